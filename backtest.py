@@ -0,0 +1,476 @@
+"""
+當沖規則回測（以欄位陣列一次評估所有列、所有參數組合）
+
+工作表每一列已經有當沖需要的特徵：價格距離、昨日收盤價，以及盤中的開盤價、10分鐘最低價、
+1.5小時最高價、最高價前的最低價。RSI / ADX 序列的最後一個值包含開盤日期當天的收盤（補算歷史資料時），
+進場時還不知道，所以改以開盤日期之前的日 K 重新計算（見 pre_open_indicators）。
+這裡把所有列讀成欄位陣列（依日期排序），把每個參數組合的進出場規則寫成 (參數組合數 x 列數) 的矩陣運算：
+
+  - 進場：開盤價買進；RSI、ADX 與開盤跳空（相對昨日收盤價）在參數的範圍內才進場
+  - 停損：固定停損（開盤價往下 stop_pct %），low10_stop 為 1 時 10 分鐘後把停損移到 10 分鐘最低價
+  - 停利：開盤價往上 target_pct %
+
+盤中只記錄了四個價格，所以價格路徑以保守的方式判斷：
+
+  1. 前 10 分鐘的最低價跌破固定停損 -> 以停損價出場
+  2. 10 分鐘到最高價之間的最低價（最高價前的最低價）跌破停損 -> 以停損價出場
+     （同時也碰到停利時，無法得知先後，一律視為先停損）
+  3. 1.5 小時最高價達到停利 -> 以停利價出場（前 10 分鐘的最高價沒有記錄，停利從第 10 分鐘開始判斷）
+  4. 都沒有觸發 -> 依 UNRESOLVED_EXIT 計算：
+       "low"：以前 1.5 小時記錄到的最低價出場（保守）；"entry"：以開盤價出場（報酬為 0）
+
+參數網格（例如 RSI 上限 x 停損 x 停利的所有組合）中，進場條件只決定哪些列進場、出場條件只決定每一列的報酬，
+兩者分開計算後以矩陣乘法組合（見 evaluate）；組合很多時再分給行程池平行計算，
+數千個組合在整段歷史上只要幾秒。
+
+用法:
+    python cli.py backtest --param rsi_max=30,40,50 --param target_pct=1,2,3 --param stop_pct=1,2,inf
+    python cli.py backtest --param adx_min=20,25,30 --param low10_stop=0,1 --sort 總報酬(%) --top 20
+"""
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import calculate_indicators as ci
+import indicator_registry
+import trading_calendar
+from fetch_pool import ConcurrentFetcher
+from parallel_compute import default_workers
+from streaming_workbook import iter_sheet_values
+
+# 參數 -> 預設值（沒有出現在網格中的參數使用預設值；範圍的上下限為 inf 表示不限制）
+PARAMETERS = {
+    "rsi_min": -np.inf,     # RSI 下限
+    "rsi_max": np.inf,      # RSI 上限
+    "adx_min": -np.inf,     # ADX 下限
+    "adx_max": np.inf,      # ADX 上限
+    "gap_min": -np.inf,     # 開盤跳空下限 (%)：(開盤價 / 昨日收盤價 - 1) * 100
+    "gap_max": np.inf,      # 開盤跳空上限 (%)
+    "stop_pct": np.inf,     # 固定停損：開盤價往下 (%)，inf 表示不設
+    "low10_stop": 1.0,      # 1 表示 10 分鐘後把停損移到 10 分鐘最低價，0 表示只用固定停損
+    "target_pct": 2.0,      # 停利：開盤價往上 (%)
+}
+
+# 進場前已知的指標：特徵名稱 -> 指標（以開盤日期之前的日 K 計算，與工作表序列的 RSI / ADX 定義相同）
+PRE_OPEN_INDICATORS = {"RSI": "RSI(14)", "ADX": "ADX(14)"}
+
+# 進場條件與出場條件的參數（分開計算後以矩陣乘法組合）
+ENTRY_PARAMETERS = ["rsi_min", "rsi_max", "adx_min", "adx_max", "gap_min", "gap_max"]
+EXIT_PARAMETERS = ["stop_pct", "low10_stop", "target_pct"]
+
+# 每筆交易的來回成本 (%)（手續費與滑價）
+ROUND_TRIP_COST_PCT = 0.05
+
+# 停損與停利都沒有觸發時的出場價："low"（前 1.5 小時的最低價）或 "entry"（開盤價）
+UNRESOLVED_EXIT = "low"
+
+# 每次矩陣運算最多的儲存格數（參數組合數 x 列數），控制記憶體用量
+CHUNK_CELLS = 2_000_000
+
+# 參數組合少於這個數量時不建立行程池
+PARALLEL_MIN_VARIANTS = 256
+
+# 預設的排序欄位（由大到小）
+DEFAULT_SORT = "總報酬(%)"
+
+# 結果的統計欄位
+METRIC_COLUMNS = ["交易數", "勝率(%)", "平均報酬(%)", "總報酬(%)", "獲利因子", "最大回撤(%)",
+                  "停損出場", "停利出場", "未觸發"]
+
+# Excel 日期序號的起點
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+def _number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _to_date(value):
+    """工作表日期（Excel 序號或字串）-> Timestamp，無法解析時為 NaT"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return pd.Timestamp(EXCEL_EPOCH + timedelta(days=value))
+    return pd.to_datetime(value, errors="coerce")
+
+def feature_sources(header):
+    """
+    特徵名稱 -> 工作表欄位索引（同一個特徵有多個欄位名稱時取第一個存在的欄位）
+
+    參數:
+        header: {欄位名稱: 欄位索引}
+
+    返回:
+        dict: {特徵名稱: 欄位索引}，特徵名稱與 screener.feature_names 相同，另加盤中價格
+        （RSI / ADX 不從工作表讀取，見 pre_open_indicators）
+    """
+    sources = {}
+
+    def add(name, col_name):
+        if name not in sources and col_name in header:
+            sources[name] = header[col_name]
+
+    for col_name, (key, sub_key) in ci.PRICE_DISTANCE_COLUMNS.items():
+        if sub_key is None:
+            add(key, col_name)
+        elif key in ci.PRICE_DISTANCE_WINDOWS:
+            side = "高" if "最高" in sub_key else "低"
+            add(f"{ci.PRICE_DISTANCE_WINDOWS[key]}日{side}價距離", col_name)
+    for col_name, (_, sub_key) in ci.INTRADAY_PRICE_COLUMNS.items():
+        add(sub_key, col_name)
+    return sources
+
+def pre_open_indicators(tickers, dates):
+    """
+    每一列開盤前已知的 RSI / ADX（開盤日期之前最後一個交易日收盤時的值）
+
+    工作表的序列與 calculate_rsi_adx_sequences_batch 相同，包含開盤日期當天的 K 棒，
+    以序列的最後一個值回測會用到當天收盤後才知道的資料。這裡取得開盤日期之前的日 K（經過 K 線快取），
+    每檔股票計算一次指標，取開盤日期之前最後一個有效值，四捨五入到 1 位小數（與工作表相同）。
+
+    參數:
+        tickers: 股票代碼陣列
+        dates: 開盤日期（美國交易日）陣列
+
+    返回:
+        dict: {特徵名稱: float64 陣列}，沒有日 K 的列為 NaN
+    """
+    values = {name: np.full(len(dates), np.nan) for name in PRE_OPEN_INDICATORS}
+    rows = {}
+    for i, (ticker, date) in enumerate(zip(tickers, dates)):
+        if isinstance(ticker, str) and ticker.strip() and not pd.isna(date):
+            rows.setdefault(ticker.strip(), []).append(i)
+    if not rows:
+        return values
+
+    sessions = ci.required_sessions(need_rsi_adx=True, need_price_dist=False)
+    fetch_plan = ci.plan_daily_fetches([(ticker, pd.Timestamp(dates[i]), sessions)
+                                        for ticker, positions in rows.items() for i in positions])
+    print(f"正在取得 {len(fetch_plan)} 檔股票開盤日期之前的日 K（計算進場前的 RSI / ADX）...")
+    fetcher = ConcurrentFetcher(ci.load_daily_bars, max_workers=ci.FETCH_MAX_WORKERS,
+                                rate=None, max_retries=ci.FETCH_MAX_RETRIES)
+    daily_bars = ci.fetch_daily_bars(fetch_plan, fetcher)
+
+    plan = indicator_registry.plan_for(tuple(PRE_OPEN_INDICATORS.values()))
+    for ticker, positions in rows.items():
+        bars = daily_bars.get(ticker)
+        if bars is None or bars.empty:
+            continue
+        positions = np.array(positions)
+        row_dates = pd.DatetimeIndex(dates[positions]).as_unit("ns").asi8
+        computed = plan.compute(bars)
+        for name, spec in PRE_OPEN_INDICATORS.items():
+            series = computed[spec].dropna()
+            index_ns = pd.DatetimeIndex(series.index).as_unit("ns").asi8
+            # 開盤日期之前（不含當天）的最後一個值
+            before = np.searchsorted(index_ns, row_dates, side="left") - 1
+            found = before >= 0
+            values[name][positions[found]] = np.round(series.to_numpy(dtype=np.float64)[before[found]], 1)
+    return values
+
+def load_features(input_file, sheet_name, indicators=True):
+    """
+    把工作表所有列的特徵讀成欄位陣列（依日期排序）
+
+    參數:
+        input_file: Excel 檔案路徑
+        sheet_name: 工作表名稱
+        indicators: 是否計算進場前的 RSI / ADX（需要日 K；回測規則沒有用到時可略過）
+
+    返回:
+        dict: {"股票代碼": object 陣列, "日期": datetime64 陣列, 特徵名稱: float64 陣列, ...}
+
+    例外:
+        ValueError: 找不到股票代碼、日期或盤中價格欄位
+    """
+    rows = iter_sheet_values(input_file, sheet_name)
+    _, header_values = next(rows, (None, {}))
+    header = {str(name): col_idx for col_idx, name in header_values.items()}
+    date_column = next((col for col in ci.DATE_COLUMNS if col in header), None)
+    if ci.TICKER_COLUMN not in header or date_column is None:
+        raise ValueError(f"找不到股票代碼欄位 '{ci.TICKER_COLUMN}' 或日期欄位 {ci.DATE_COLUMNS}")
+    sources = feature_sources(header)
+    missing = [name for name in ("開盤價", "10分鐘最低價", "1.5小時最高價", "最高價前的最低價") if name not in sources]
+    if missing:
+        raise ValueError(f"工作表沒有盤中價格欄位: {', '.join(missing)}")
+
+    tickers, dates = [], []
+    values = {name: [] for name in sources}
+    for _, row in rows:
+        if not row:
+            continue
+        tickers.append(row.get(header[ci.TICKER_COLUMN]))
+        # 台灣時間欄位中含時間的值轉成對應的美國交易日（與主程式相同）
+        dates.append(trading_calendar.sheet_session_date(_to_date(row.get(header[date_column])), date_column))
+        for name, col_idx in sources.items():
+            values[name].append(_number(row.get(col_idx)))
+
+    dates = pd.DatetimeIndex(dates).normalize().to_numpy()
+    order = np.argsort(dates, kind="stable")
+    features = {"股票代碼": np.array(tickers, dtype=object)[order], "日期": dates[order]}
+    for name, column in values.items():
+        features[name] = np.array(column, dtype=np.float64)[order]
+    if indicators:
+        # 只有盤中價格完整（可以進場）的列需要指標
+        tradable = np.isfinite(features["開盤價"])
+        for name, column in pre_open_indicators(np.where(tradable, features["股票代碼"], None),
+                                                features["日期"]).items():
+            features[name] = column
+    return features
+
+def param_grid(grid):
+    """
+    展開參數網格（所有組合的笛卡兒積，沒有指定的參數使用 PARAMETERS 的預設值）
+
+    參數:
+        grid: {參數: 值的列表}
+
+    返回:
+        dict: {參數: float64 陣列}，每個陣列的長度都是組合數
+
+    例外:
+        ValueError: 未知的參數
+    """
+    unknown = [name for name in grid if name not in PARAMETERS]
+    if unknown:
+        raise ValueError(f"未知的參數: {', '.join(unknown)}（可用的參數: {', '.join(PARAMETERS)}）")
+    names = list(grid)
+    combos = np.array(list(itertools.product(*(grid[name] for name in names))), dtype=np.float64)
+    count = len(combos)
+    params = {name: np.full(count, default, dtype=np.float64) for name, default in PARAMETERS.items()}
+    for i, name in enumerate(names):
+        params[name] = combos[:, i]
+    return params
+
+def _within(values, low, high):
+    """low <= values <= high；上下限為 inf 時不限制（特徵為 NaN 的列也通過）"""
+    return (((values >= low) | np.isneginf(low)) & ((values <= high) | np.isposinf(high)))
+
+def _feature(features, name):
+    values = features.get(name)
+    if values is None:
+        return np.full(len(features["日期"]), np.nan)
+    return values
+
+def _unique_combos(params, names):
+    """參數組合中 names 的不重複組合 -> ({參數: 陣列}, 每個組合對應的索引)"""
+    combos, inverse = np.unique(np.column_stack([params[name] for name in names]), axis=0, return_inverse=True)
+    return {name: combos[:, i][:, None] for i, name in enumerate(names)}, inverse.ravel()
+
+def entry_masks(features, filters):
+    """
+    每組進場條件的進場遮罩
+
+    參數:
+        features: load_features 的結果
+        filters: {ENTRY_PARAMETERS 的參數: (組數, 1) 陣列}
+
+    返回:
+        ndarray: (組數, 列數) bool，盤中價格不完整的列一律不進場
+    """
+    entry = _feature(features, "開盤價")
+    tradable = np.isfinite(entry)
+    for name in ("10分鐘最低價", "1.5小時最高價", "最高價前的最低價"):
+        tradable &= np.isfinite(_feature(features, name))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        gap = (entry / _feature(features, "昨日收盤價") - 1) * 100
+    return (tradable
+            & _within(_feature(features, "RSI"), filters["rsi_min"], filters["rsi_max"])
+            & _within(_feature(features, "ADX"), filters["adx_min"], filters["adx_max"])
+            & _within(gap, filters["gap_min"], filters["gap_max"]))
+
+def exit_outcomes(features, exits):
+    """
+    每組出場條件在每一列的報酬與出場方式（假設每一列都進場）
+
+    參數:
+        features: load_features 的結果
+        exits: {EXIT_PARAMETERS 的參數: (組數, 1) 陣列}
+
+    返回:
+        tuple: (報酬 (%), 停損出場, 停利出場, 未觸發)，都是 (組數, 列數) 陣列；盤中價格不完整的列為 0 / False
+    """
+    entry = _feature(features, "開盤價")[None, :]
+    low_10 = _feature(features, "10分鐘最低價")[None, :]
+    high_90 = _feature(features, "1.5小時最高價")[None, :]
+    low_before_high = _feature(features, "最高價前的最低價")[None, :]
+    tradable = np.isfinite(entry) & np.isfinite(low_10) & np.isfinite(high_90) & np.isfinite(low_before_high)
+
+    with np.errstate(invalid="ignore"):
+        fixed_stop = entry * (1 - exits["stop_pct"] / 100)
+        trailing_stop = np.where(exits["low10_stop"] > 0, np.fmax(fixed_stop, low_10), fixed_stop)
+        target = entry * (1 + exits["target_pct"] / 100)
+
+        early_stop = low_10 <= fixed_stop
+        late_stop = ~early_stop & (low_before_high <= trailing_stop)
+        target_hit = ~early_stop & ~late_stop & (high_90 >= target)
+        unresolved = tradable & ~(early_stop | late_stop | target_hit)
+
+        unresolved_exit = np.fmin(low_10, low_before_high) if UNRESOLVED_EXIT == "low" else entry
+        exit_price = np.select([early_stop, late_stop, target_hit], [fixed_stop, trailing_stop, target],
+                               unresolved_exit)
+        returns = np.where(tradable, (exit_price / entry - 1) * 100 - ROUND_TRIP_COST_PCT, 0.0)
+    return returns, (early_stop | late_stop) & tradable, target_hit & tradable, unresolved
+
+def evaluate(features, params):
+    """
+    評估一組參數組合
+
+    進場條件與出場條件分開計算：每組進場條件一列遮罩 (F x 列數)、每組出場條件一列報酬 (E x 列數)，
+    交易數、總報酬、勝率等加總型的統計都是 遮罩 @ 報酬.T 的矩陣乘法，所有 F x E 個組合一次算完；
+    只有最大回撤需要依日期累加，依 CHUNK_CELLS 分塊計算。
+
+    參數:
+        features: load_features 的結果
+        params: {參數: 陣列}（param_grid 的結果或其中一段）
+
+    返回:
+        dict: {統計欄位: 陣列}（每個參數組合一個值，欄位見 METRIC_COLUMNS）
+    """
+    filters, entry_index = _unique_combos(params, ENTRY_PARAMETERS)
+    exits, exit_index = _unique_combos(params, EXIT_PARAMETERS)
+    masks = entry_masks(features, filters)
+    returns, stopped, target_hit, unresolved = exit_outcomes(features, exits)
+
+    # 每組出場條件的加總項：報酬、獲利、虧損、獲利筆數、三種出場方式
+    terms = np.stack([returns, np.maximum(returns, 0), np.maximum(-returns, 0), returns > 0,
+                      stopped, target_hit, unresolved]).astype(np.float64)
+    terms = terms.reshape(-1, terms.shape[-1])
+    step = max(1, CHUNK_CELLS // max(1, masks.shape[1]))
+    sums = np.concatenate([masks[begin:begin + step].astype(np.float64) @ terms.T
+                           for begin in range(0, len(masks), step)])
+    sums = sums.reshape(len(masks), -1, len(exits["target_pct"]))
+    total, gross_profit, gross_loss, wins, stops, targets, unresolved_count = (
+        sums[entry_index, i, exit_index] for i in range(sums.shape[1]))
+    trades = masks.sum(axis=1)[entry_index]
+
+    # 最大回撤：權益曲線（依日期累加的報酬，從 0 開始）與之前最高點的最大差距（原地計算，減少暫存陣列）
+    drawdown = np.empty(len(entry_index))
+    for begin in range(0, len(entry_index), step):
+        end = begin + step
+        equity = np.multiply(masks[entry_index[begin:end]], returns[exit_index[begin:end]])
+        np.cumsum(equity, axis=1, out=equity)
+        peak = np.maximum.accumulate(equity, axis=1)
+        np.subtract(peak, equity, out=peak)
+        drawdown[begin:end] = np.maximum(peak.max(axis=1, initial=0), 0 - equity.min(axis=1, initial=0))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "交易數": trades,
+            "勝率(%)": wins / trades * 100,
+            "平均報酬(%)": total / trades,
+            "總報酬(%)": total,
+            "獲利因子": gross_profit / gross_loss,
+            "最大回撤(%)": drawdown,
+            "停損出場": np.rint(stops).astype(int),
+            "停利出場": np.rint(targets).astype(int),
+            "未觸發": np.rint(unresolved_count).astype(int),
+        }
+
+# 子行程中的特徵陣列（由 _init_worker 設定一次，之後每個任務只傳參數）
+_worker_features = None
+
+def _init_worker(features):
+    global _worker_features
+    _worker_features = features
+
+def _evaluate_worker(params):
+    return evaluate(_worker_features, params)
+
+def run_grid(features, grid, workers=None):
+    """
+    評估參數網格的所有組合
+
+    參數:
+        features: load_features 的結果
+        grid: {參數: 值的列表}
+        workers: 行程數，預設為 CPU 核心數（組合少於 PARALLEL_MIN_VARIANTS 時使用單一行程）
+
+    返回:
+        DataFrame: 每個參數組合一列（網格中的參數欄位 + METRIC_COLUMNS）
+    """
+    params = param_grid(grid)
+    count = len(params["target_pct"])
+    if workers is None:
+        workers = default_workers()
+    if workers <= 1 or count < PARALLEL_MIN_VARIANTS:
+        metrics = evaluate(features, params)
+    else:
+        bounds = np.linspace(0, count, workers + 1).astype(int)
+        tasks = [{name: values[begin:end] for name, values in params.items()}
+                 for begin, end in zip(bounds[:-1], bounds[1:]) if end > begin]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(features,)) as pool:
+            parts = list(pool.map(_evaluate_worker, tasks))
+        metrics = {name: np.concatenate([part[name] for part in parts]) for name in METRIC_COLUMNS}
+
+    result = pd.DataFrame({name: params[name] for name in grid})
+    for name in METRIC_COLUMNS:
+        result[name] = metrics[name]
+    return result
+
+def parse_param(text):
+    """
+    解析命令列的參數網格，例如 "target_pct=1,2,3" 或 "stop_pct=1,2,inf"
+
+    返回:
+        tuple: (參數, 值的列表)
+
+    例外:
+        ValueError: 格式錯誤或未知的參數
+    """
+    name, sep, values = text.partition("=")
+    name = name.strip()
+    if not sep or name not in PARAMETERS:
+        raise ValueError(f"無法解析參數: {text!r}（格式為 參數=值1,值2,...，可用的參數: {', '.join(PARAMETERS)}）")
+    try:
+        return name, [float(value) for value in values.split(",") if value.strip()]
+    except ValueError:
+        raise ValueError(f"參數 {name} 的值必須是數字: {values!r}")
+
+def run_backtest(input_file, sheet_name, grid, sort=DEFAULT_SORT, top=None, workers=None, output=None):
+    """
+    讀取工作表、評估參數網格並顯示結果
+
+    參數:
+        input_file: Excel 檔案路徑
+        sheet_name: 工作表名稱
+        grid: {參數: 值的列表}（空 dict 表示只評估預設參數）
+        sort: 排序欄位（由大到小）
+        top: 只顯示前幾名
+        workers: 行程數
+        output: 另存結果的 CSV 檔
+
+    返回:
+        DataFrame: 排序後的結果
+
+    例外:
+        ValueError: 未知的參數或排序欄位、工作表缺少必要欄位
+    """
+    if sort not in METRIC_COLUMNS and sort not in grid:
+        raise ValueError(f"未知的排序欄位: {sort}（可用的欄位: {', '.join(list(grid) + METRIC_COLUMNS)}）")
+    param_grid(grid)
+
+    start_time = time.time()
+    indicators = any(name in grid for name in ("rsi_min", "rsi_max", "adx_min", "adx_max"))
+    features = load_features(input_file, sheet_name, indicators=indicators)
+    load_seconds = time.time() - start_time
+    tradable = int(np.isfinite(features["開盤價"]).sum())
+    print(f"已讀取 {len(features['日期'])} 列（{tradable} 列有盤中價格），耗時 {load_seconds:.2f} 秒")
+
+    start_time = time.time()
+    result = run_grid(features, grid, workers=workers)
+    result = result.sort_values(sort, ascending=False, na_position="last", kind="stable").reset_index(drop=True)
+    print(f"已評估 {len(result)} 個參數組合，耗時 {time.time() - start_time:.2f} 秒\n")
+
+    shown = result.head(top) if top else result
+    with pd.option_context("display.max_rows", None, "display.width", 200, "display.float_format", "{:.2f}".format):
+        print(shown.to_string())
+    if output:
+        result.to_csv(output, index=False, encoding="utf-8-sig")
+        print(f"\n✓ 結果已儲存到 {output}")
+    return result
@@ -0,0 +1,314 @@
+"""
+本地 K 線快取（依股票代碼與週期分檔）
+
+每檔股票、每種週期存成兩個原始二進位檔加一個描述檔：
+  <cache_dir>/<interval>/<TICKER>.ts.bin     int64 時間戳（UTC 奈秒）
+  <cache_dir>/<interval>/<TICKER>.ohlcv.bin  float64，每根 K 棒依序為 Open/High/Low/Close/Volume
+  <cache_dir>/<interval>/<TICKER>.json       已下載的涵蓋區間與時區
+
+讀取時以 np.memmap 直接映射檔案（不複製），
+之後的執行只下載最後一根快取 K 棒之後的資料並附加在檔案尾端。
+檔案一律寫到暫存路徑再取代，不在原地改寫，已經映射的舊檔案內容不會改變。
+"""
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from market_data import EmptyResponseError
+from trading_calendar import NYSE
+
+# 預設快取目錄
+CACHE_DIR = ".bar_cache"
+
+# 快取欄位順序
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# cached_download 的命中統計：hit（完全命中）、partial（只下載缺少的部分）、miss（沒有快取）
+CACHE_STATS = {"hit": 0, "partial": 0, "miss": 0}
+_stats_lock = threading.Lock()
+
+# 每個快取檔（ticker, interval, cache_dir）一把鎖：同一檔股票的多個請求在不同執行緒同時
+# 讀取、下載、改寫同一組檔案時，依序執行，後到的請求直接使用前一個請求寫入的資料
+_file_locks = {}
+_file_locks_lock = threading.Lock()
+
+def _count(name):
+    with _stats_lock:
+        CACHE_STATS[name] += 1
+
+def _fetch_or_empty(fetch, ticker, start, end):
+    """補下載快取前後的區間：沒有資料時當成空的 DataFrame（已快取的資料照常回傳，涵蓋區間不推進）"""
+    try:
+        return fetch(ticker, start, end)
+    except EmptyResponseError:
+        return pd.DataFrame()
+
+def _before_listing(cached, start, cached_start):
+    """
+    往前補資料沒有拿到 K 棒時，[start, cached_start) 是否確定沒有資料
+
+    區間內沒有交易日，或快取的第一根 K 棒晚於 cached_start 之後的第一個交易日
+    （涵蓋區間開始時還沒上市）時才成立；否則視為下載失敗。
+    """
+    if NYSE.session_count(start, cached_start) == 0:
+        return True
+    if len(cached) == 0:
+        return False
+    return _bound(cached.index[0], None).normalize() > NYSE.next_session(cached_start)
+
+def _file_lock(ticker, interval, cache_dir):
+    key = (ticker.upper(), interval, os.path.abspath(cache_dir))
+    with _file_locks_lock:
+        lock = _file_locks.get(key)
+        if lock is None:
+            lock = _file_locks[key] = threading.Lock()
+    return lock
+
+def _paths(ticker, interval, cache_dir):
+    """回傳 (時間戳檔, OHLCV 檔, 描述檔) 路徑"""
+    base = os.path.join(cache_dir, interval, ticker.upper())
+    return base + ".ts.bin", base + ".ohlcv.bin", base + ".json"
+
+def _read_meta(meta_path):
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_meta(meta_path, meta):
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+def _to_arrays(df):
+    """把 DataFrame 轉成 (UTC 奈秒時間戳, N x 5 float64 陣列)"""
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    ts = index.as_unit("ns").asi8.astype(np.int64)
+    values = df.reindex(columns=COLUMNS).to_numpy(dtype=np.float64)
+    return ts, np.ascontiguousarray(values)
+
+def _bound(value, tz):
+    """把日期轉成可以和快取索引比較的 Timestamp"""
+    ts = pd.Timestamp(value)
+    if tz is not None and ts.tz is None:
+        ts = ts.tz_localize(tz)
+    elif tz is None and ts.tz is not None:
+        ts = ts.tz_localize(None)
+    return ts
+
+def read_cached_bars(ticker, interval="1d", cache_dir=CACHE_DIR):
+    """
+    讀取快取的 K 線（記憶體映射，不複製資料）
+
+    參數:
+        ticker: 股票代碼
+        interval: K 線週期（例如 "1d"、"1m"）
+        cache_dir: 快取目錄
+
+    返回:
+        DataFrame: 以 memmap 為底的 OHLCV 資料，沒有快取時為空的 DataFrame
+    """
+    ts_path, ohlcv_path, meta_path = _paths(ticker, interval, cache_dir)
+    meta = _read_meta(meta_path)
+    if meta is None or not os.path.exists(ts_path) or os.path.getsize(ts_path) == 0:
+        return pd.DataFrame(columns=COLUMNS)
+
+    # 以兩個檔案中較短者為準，避免讀到寫到一半的資料
+    n = min(os.path.getsize(ts_path) // 8, os.path.getsize(ohlcv_path) // (8 * len(COLUMNS)))
+    if n == 0:
+        return pd.DataFrame(columns=COLUMNS)
+
+    ts = np.memmap(ts_path, dtype=np.int64, mode="r", shape=(n,))
+    values = np.memmap(ohlcv_path, dtype=np.float64, mode="r", shape=(n, len(COLUMNS)))
+
+    index = pd.DatetimeIndex(ts.view("datetime64[ns]"))
+    if meta.get("tz"):
+        index = index.tz_localize("UTC").tz_convert(meta["tz"])
+    return pd.DataFrame(values, index=index, columns=COLUMNS, copy=False)
+
+def write_cached_bars(ticker, interval, df, cache_dir=CACHE_DIR, start=None, end=None):
+    """
+    以新資料完整覆寫快取（用於第一次下載或往前補資料）
+
+    參數:
+        ticker: 股票代碼
+        interval: K 線週期
+        df: OHLCV 資料
+        cache_dir: 快取目錄
+        start, end: 已下載的涵蓋區間（end 不包含）
+    """
+    ts_path, ohlcv_path, meta_path = _paths(ticker, interval, cache_dir)
+    os.makedirs(os.path.dirname(ts_path), exist_ok=True)
+
+    df = df[~df.index.duplicated(keep="last")].sort_index()
+    ts, values = _to_arrays(df)
+    for path, array in ((ohlcv_path, values), (ts_path, ts)):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(array.tobytes())
+        os.replace(tmp_path, path)
+
+    tz = pd.DatetimeIndex(df.index).tz
+    _write_meta(meta_path, {
+        "start": str(pd.Timestamp(start).date()) if start is not None else None,
+        "end": str(pd.Timestamp(end).date()) if end is not None else None,
+        "tz": str(tz) if tz is not None else None,
+    })
+
+def append_cached_bars(ticker, interval, df, cache_dir=CACHE_DIR, end=None):
+    """
+    把較新的 K 線附加到快取尾端
+
+    與快取重疊的部分（時間戳 >= 新資料第一根）會先截掉，
+    讓最後一根可能尚未收盤的 K 棒被新資料取代。
+    新檔案寫在暫存路徑再以 os.replace 取代（與 write_cached_bars 相同），
+    之前 read_cached_bars 回傳的映射仍指向舊檔案，數值不會在呼叫端手上改變。
+
+    參數:
+        ticker: 股票代碼
+        interval: K 線週期
+        df: 新的 OHLCV 資料
+        cache_dir: 快取目錄
+        end: 新的涵蓋區間結束日（不包含）
+    """
+    ts_path, ohlcv_path, meta_path = _paths(ticker, interval, cache_dir)
+    meta = _read_meta(meta_path)
+
+    if len(df) > 0:
+        df = df[~df.index.duplicated(keep="last")].sort_index()
+        ts, values = _to_arrays(df)
+
+        # 找出要截掉的位置
+        n = min(os.path.getsize(ts_path) // 8, os.path.getsize(ohlcv_path) // (8 * len(COLUMNS)))
+        cached_ts = np.fromfile(ts_path, dtype=np.int64, count=n)
+        keep = int(np.searchsorted(cached_ts, ts[0], side="left"))
+
+        kept_values = np.fromfile(ohlcv_path, dtype=np.float64, count=keep * len(COLUMNS))
+        for path, kept, array in ((ohlcv_path, kept_values, values), (ts_path, cached_ts[:keep], ts)):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(kept.tobytes())
+                f.write(array.tobytes())
+            os.replace(tmp_path, path)
+
+    if end is not None:
+        meta["end"] = str(max(pd.Timestamp(meta["end"]), pd.Timestamp(end)).date())
+        _write_meta(meta_path, meta)
+
+def missing_range(ticker, start, end, interval="1d", cache_dir=CACHE_DIR):
+    """
+    回傳 cached_download 需要下載的區間（用於事先以批次請求一次下載多檔股票）
+
+    參數:
+        ticker: 股票代碼
+        start: 開始日期（包含）
+        end: 結束日期（不包含）
+        interval: K 線週期
+        cache_dir: 快取目錄
+
+    返回:
+        tuple: (fetch_start, fetch_end)，涵蓋 cached_download 會發出的所有請求；快取已完整涵蓋時為 None
+    """
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize()
+    _, _, meta_path = _paths(ticker, interval, cache_dir)
+    meta = _read_meta(meta_path)
+    if meta is None:
+        return start, end
+
+    cached_start = pd.Timestamp(meta["start"])
+    cached_end = pd.Timestamp(meta["end"])
+    fetch_start = fetch_end = None
+    if start < cached_start:
+        fetch_start, fetch_end = start, cached_start
+    if end > cached_end:
+        newer_start = cached_end
+        cached = read_cached_bars(ticker, interval, cache_dir)
+        if len(cached) > 0:
+            newer_start = min(newer_start, _bound(cached.index[-1], None).normalize())
+        del cached
+        fetch_start = newer_start if fetch_start is None else fetch_start
+        fetch_end = end
+    return (fetch_start, fetch_end) if fetch_start is not None else None
+
+def cached_download(ticker, start, end, interval, fetch, cache_dir=CACHE_DIR):
+    """
+    透過本地快取取得 K 線，只下載快取沒有的部分
+
+    - 沒有快取：下載整個區間並建立快取
+    - 要求的開始日早於快取：補下載前段並重寫快取（沒有資料時只在確定是上市之前才擴大涵蓋區間）
+    - 要求的結束日晚於快取：從最後一根快取 K 棒的日期開始下載並附加
+
+    今天（含）之後的區間不會被記為已涵蓋，下次執行會再更新最後一根 K 棒。
+    同一檔股票、同一週期的呼叫以鎖依序執行（執行緒安全）。
+    沒有快取時 fetch 拋出的 EmptyResponseError 會傳給呼叫端（由 ConcurrentFetcher 重試）。
+
+    參數:
+        ticker: 股票代碼
+        start: 開始日期（包含）
+        end: 結束日期（不包含）
+        interval: K 線週期
+        fetch: 實際下載函式 fetch(ticker, start, end)，回傳 DataFrame
+        cache_dir: 快取目錄
+
+    返回:
+        DataFrame: [start, end) 區間的 OHLCV 資料
+    """
+    with _file_lock(ticker, interval, cache_dir):
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize()
+        today = pd.Timestamp.now().normalize()
+        covered_end = min(end, today)
+
+        _, _, meta_path = _paths(ticker, interval, cache_dir)
+        meta = _read_meta(meta_path)
+
+        if meta is None:
+            _count("miss")
+            df = fetch(ticker, start, end)
+            if df.empty:
+                return df
+            write_cached_bars(ticker, interval, df, cache_dir, start=start, end=covered_end)
+        else:
+            cached = read_cached_bars(ticker, interval, cache_dir)
+            cached_start = pd.Timestamp(meta["start"])
+            cached_end = pd.Timestamp(meta["end"])
+            _count("partial" if start < cached_start or end > cached_end else "hit")
+
+            if start < cached_start:
+                older = _fetch_or_empty(fetch, ticker, start, cached_start)
+                if not older.empty:
+                    merged = pd.concat([older, pd.DataFrame(np.array(cached), index=cached.index, columns=COLUMNS)])
+                    del cached
+                    write_cached_bars(ticker, interval, merged, cache_dir, start=start, end=cached_end)
+                elif _before_listing(cached, start, cached_start):
+                    # 確定是上市之前（或整段沒有交易日）才記為已涵蓋，下載失敗時不推進，下次再試
+                    meta["start"] = str(start.date())
+                    _write_meta(meta_path, meta)
+                cached = read_cached_bars(ticker, interval, cache_dir)
+
+            if end > cached_end:
+                # 只下載最後一根快取 K 棒（含）之後的資料
+                fetch_start = cached_end
+                if len(cached) > 0:
+                    fetch_start = min(fetch_start, _bound(cached.index[-1], None).normalize())
+                newer = _fetch_or_empty(fetch, ticker, fetch_start, end)
+                del cached
+                # 沒拿到資料（假日或下載失敗）時不推進涵蓋區間，下次再試
+                if not newer.empty:
+                    append_cached_bars(ticker, interval, newer, cache_dir, end=covered_end)
+            else:
+                del cached
+
+        # 以 searchsorted 切片，回傳的仍是映射檔案的視圖
+        df = read_cached_bars(ticker, interval, cache_dir)
+        tz = df.index.tz
+        i = df.index.searchsorted(_bound(start, tz), side="left")
+        j = df.index.searchsorted(_bound(end, tz), side="left")
+        return df.iloc[i:j]
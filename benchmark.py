@@ -0,0 +1,373 @@
+"""
+效能基準測試（合成工作簿 + 合成行情）
+
+產生指定大小的 `量化交易.xlsx`（列數、股票檔數、已填資料的比例），
+用 market_data.SyntheticProvider 提供對應的日 K 與 1 分鐘 K 線，
+直接執行主程式（calculate_indicators.process_workbook，或 --stream 時的串流模式，含更新日誌），
+以主程式本身的執行記錄（instrumentation.span）取得各階段耗時：
+
+  讀取 Excel -> 下載 -> 指標計算 -> 價格距離 -> 盤中數據 -> 寫回 Excel
+
+每個階段記錄耗時、吞吐量（筆/秒）與 tracemalloc 記憶體峰值
+（tracemalloc 會讓計算慢好幾倍，所以記憶體在第二次執行時另外量測，不影響計時），
+結果存成 JSON；可存為基準，之後的版本與基準比較，找出效能退步的階段。
+工作簿的欄位依目前的設定產生（設定檔 indicators.json 同樣會套用）。
+
+用法:
+    python benchmark.py                                  # 預設 500 列、50 檔股票
+    python benchmark.py --rows 5000 --tickers 200 --prefilled 0.3
+    python benchmark.py --rows 50000 --stream            # 串流模式
+    python benchmark.py --save-baseline                  # 存成基準（benchmark_baseline.json）
+    python benchmark.py --compare --repeat 3             # 與基準比較（取 3 次中最快），退步超過門檻時結束代碼為 1
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.styles import Font
+
+import calculate_indicators as ci
+import instrumentation
+import sheet_config
+from market_data import SyntheticProvider
+
+# 基準結果檔案
+BASELINE_FILE = "benchmark_baseline.json"
+
+# 每次執行的結果檔案
+RESULT_FILE = "benchmark_latest.json"
+
+# 比基準慢超過這個比例就視為退步
+REGRESSION_THRESHOLD = 0.20
+
+# 比較時忽略耗時低於此值（秒）的階段，避免計時雜訊造成誤報
+MIN_COMPARE_SECONDS = 0.2
+
+def _first_names(columns):
+    """{欄位名稱: 目標} 中每個目標只取第一個欄位名稱（同一個值有多個可用的欄位名稱）"""
+    names = {}
+    for name, target in columns.items():
+        names.setdefault(target, name)
+    return list(names.values())
+
+def workbook_columns():
+    """
+    合成工作簿的欄位（依目前的設定：股票代碼、開盤日期、RSI/ADX 序列、其他指標、價格距離、盤中價格）
+
+    返回:
+        list: 欄位名稱
+    """
+    return ([ci.TICKER_COLUMN, ci.DATE_COLUMNS[0]] + list(ci.SEQUENCE_COLUMNS) + list(ci.INDICATOR_COLUMNS)
+            + _first_names(ci.PRICE_DISTANCE_COLUMNS) + _first_names(ci.INTRADAY_PRICE_COLUMNS) + ["備註"])
+
+def _filled_value(column):
+    """已填資料的列在每個欄位填入的值"""
+    if column in ci.SEQUENCE_COLUMNS:
+        return "[50.0]"
+    if column in ci.INDICATOR_COLUMNS:
+        return "[50.0]" if ci.INDICATOR_COLUMNS[column][1] > 1 else 50.0
+    if column in ci.PRICE_DISTANCE_COLUMNS:
+        return 0.0 if ci.PRICE_DISTANCE_COLUMNS[column][1] else 100.0
+    if column in ci.INTRADAY_PRICE_COLUMNS:
+        return 100.0
+    return None
+
+STAGES = ["讀取 Excel", "下載", "指標計算", "價格距離", "盤中數據", "寫回 Excel"]
+
+def generate_workbook(path, rows, tickers, prefilled=0.0, history_days=500, end_date=None, seed=0):
+    """
+    產生合成的量化交易工作簿（工作表名稱與欄位依目前的設定）
+
+    參數:
+        path: 輸出路徑
+        rows: 資料列數
+        tickers: 不同股票檔數
+        prefilled: 已經填好所有欄位的列比例（0 ~ 1，這些列會被跳過）
+        history_days: 開盤日期的分布範圍（往前幾個交易日）
+        end_date: 最後一個開盤日期（預設為今天）
+        seed: 亂數種子
+
+    返回:
+        list: 使用的股票代碼
+    """
+    rng = np.random.default_rng(seed)
+    end_date = pd.Timestamp(end_date).normalize() if end_date else pd.Timestamp.now().normalize()
+    dates = pd.bdate_range(end=end_date, periods=history_days)
+    symbols = [f"T{i:04d}" for i in range(tickers)]
+    columns = workbook_columns()
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = ci.SHEET_NAME
+    ws.append(columns)
+    bold = Font(bold=True)
+
+    filled_values = [_filled_value(column) for column in columns[2:]]
+    for i in range(rows):
+        ticker = symbols[int(rng.integers(tickers))]
+        date = dates[int(rng.integers(len(dates)))].to_pydatetime()
+        if rng.random() < prefilled:
+            ws.append([ticker, date] + filled_values)
+        else:
+            ws.append([ticker, date] + [None] * (len(columns) - 2))
+        ws.cell(row=i + 2, column=1).font = bold
+
+    wb.save(path)
+    return symbols
+
+def _stage_items(report):
+    """各階段的處理筆數（計算吞吐量用）"""
+    counters = report.counters
+    requests = sum(stats["requests"] for tickers in report.fetches.values() for stats in tickers.values())
+    pending = counters.get("rows.pending", 0)
+    return {
+        "讀取 Excel": counters.get("rows.total", 0),
+        "下載": requests,
+        "指標計算": pending,
+        "價格距離": pending,
+        "盤中數據": pending,
+        "寫回 Excel": counters.get("rows.processed", 0) + counters.get("rows.resumed", 0),
+    }
+
+def run_pipeline(workbook_path, provider, trace_memory=False, max_workers=ci.FETCH_MAX_WORKERS, processes=0,
+                 bulk=True, stream=False, quiet=True):
+    """
+    以主程式處理工作簿（process_workbook 或 process_workbook_streaming），從執行記錄取得各階段耗時
+
+    參數:
+        workbook_path: 合成工作簿路徑（會被寫入）
+        provider: 資料來源
+        trace_memory: 是否記錄各階段的記憶體峰值（會讓計算變慢，計時與量測記憶體應分開執行）
+        max_workers: 並行下載數（ci.FETCH_MAX_WORKERS）
+        processes: 平行計算的行程數（ci.PARALLEL_WORKERS，待處理列數少於 ci.PARALLEL_MIN_ROWS 時與主程式相同，仍為單一行程）
+        bulk: 是否以批次請求下載日 K（ci.BULK_DAILY_DOWNLOAD）
+        stream: 是否使用串流模式
+        quiet: 是否隱藏主程式的輸出
+
+    返回:
+        tuple: ({階段名稱: {"seconds", "items", "items_per_sec", "peak_mb"}}, 統計資訊)
+    """
+    # 主程式的模組設定：使用指定的資料來源，不讀寫本地快取與封存
+    ci.market_data_provider = provider
+    ci.USE_BAR_CACHE = False
+    ci.USE_INTRADAY_ARCHIVE = False
+    ci.BULK_DAILY_DOWNLOAD = bulk
+    ci.FETCH_MAX_WORKERS = max_workers
+    ci.PARALLEL_WORKERS = processes
+
+    report = instrumentation.start_run(trace_memory=trace_memory)
+    output = io.StringIO() if quiet else None
+    try:
+        with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+            if stream:
+                ci.process_workbook_streaming(workbook_path, ci.SHEET_NAME)
+            else:
+                ci.process_workbook(workbook_path, ci.SHEET_NAME)
+    finally:
+        # 執行記錄只用來取得計時，不寫到 reports/
+        instrumentation.discard_run()
+
+    items = _stage_items(report)
+    stages = {}
+    for name, span in report.stages.items():
+        seconds = span["seconds"]
+        stages[name] = {
+            "seconds": round(seconds, 4),
+            "items": items.get(name, 0),
+            "items_per_sec": round(items.get(name, 0) / seconds, 1) if seconds > 0 else None,
+            "peak_mb": span.get("peak_mb", 0.0),
+        }
+
+    counters = report.counters
+    summary = {
+        "rows": counters.get("rows.total", 0),
+        "pending_rows": counters.get("rows.pending", 0),
+        "skipped_rows": counters.get("rows.skipped", 0),
+        "processed_rows": counters.get("rows.processed", 0),
+        "failed_rows": counters.get("rows.failed", 0),
+        "daily_requests": len(report.fetches.get("1d", {})),
+        "bulk_tickers": counters.get("bulk_download.tickers", 0),
+        "intraday_requests": sum(stats["requests"] for stats in report.fetches.get("1m", {}).values()),
+    }
+    return stages, summary
+
+def _git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run_benchmark(rows=500, tickers=50, prefilled=0.2, latency=0.0, max_workers=ci.FETCH_MAX_WORKERS,
+                  trace_memory=True, seed=0, repeat=1, processes=0, bulk=True, stream=False, quiet=True):
+    """
+    產生合成資料並執行完整的基準測試
+
+    參數:
+        repeat: 計時的執行次數，每個階段取最快的一次（降低計時雜訊）
+
+    返回:
+        dict: {"params", "environment", "summary", "stages", "total_seconds"}
+    """
+    params = {"rows": rows, "tickers": tickers, "prefilled": prefilled, "latency": latency,
+              "max_workers": max_workers, "trace_memory": trace_memory, "seed": seed,
+              "repeat": repeat, "processes": processes, "bulk": bulk, "stream": stream}
+    options = {"max_workers": max_workers, "processes": processes, "bulk": bulk, "stream": stream, "quiet": quiet}
+
+    # 固定最後一個開盤日期，讓不同日期執行的結果可以比較
+    end_date = "2026-06-30"
+    stages = None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workbook_path = os.path.join(tmp_dir, "量化交易.xlsx")
+        for _ in range(max(1, repeat)):
+            generate_workbook(workbook_path, rows, tickers, prefilled, end_date=end_date, seed=seed)
+            run_stages, summary = run_pipeline(workbook_path, SyntheticProvider(latency=latency, last_date=end_date),
+                                               **options)
+            if stages is None:
+                stages = run_stages
+            else:
+                for name, stage in run_stages.items():
+                    if name not in stages or stage["seconds"] < stages[name]["seconds"]:
+                        stages[name] = stage
+
+        # 第二次執行只量測記憶體峰值（工作簿重新產生，不使用延遲）
+        if trace_memory:
+            generate_workbook(workbook_path, rows, tickers, prefilled, end_date=end_date, seed=seed)
+            memory_stages, _ = run_pipeline(workbook_path, SyntheticProvider(last_date=end_date), trace_memory=True,
+                                            **options)
+            for name, stage in memory_stages.items():
+                if name in stages:
+                    stages[name]["peak_mb"] = stage["peak_mb"]
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "version": _git_version(),
+        "params": params,
+        "environment": {"python": platform.python_version(), "pandas": pd.__version__,
+                        "numpy": np.__version__, "machine": platform.machine()},
+        "summary": summary,
+        "stages": stages,
+        "total_seconds": round(sum(stage["seconds"] for stage in stages.values()), 4),
+    }
+
+def compare_results(result, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    與基準比較各階段耗時
+
+    返回:
+        list: 退步的階段 [(階段名稱, 基準秒數, 目前秒數, 比例)]
+    """
+    regressions = []
+    for name, stage in result["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None or max(base["seconds"], stage["seconds"]) < MIN_COMPARE_SECONDS:
+            continue
+        ratio = stage["seconds"] / base["seconds"] if base["seconds"] > 0 else float("inf")
+        if ratio > 1 + threshold:
+            regressions.append((name, base["seconds"], stage["seconds"], ratio))
+    return regressions
+
+def print_report(result, baseline=None):
+    """顯示各階段耗時、吞吐量、記憶體峰值（有基準時一併顯示變化）"""
+    params = result["params"]
+    summary = result["summary"]
+    mode = "串流模式" if params.get("stream") else "一般模式"
+    print(f"工作簿: {params['rows']} 列、{params['tickers']} 檔股票、已填 {params['prefilled']:.0%}"
+          f"（{mode}，待處理 {summary['pending_rows']} 列、完成 {summary['processed_rows']} 列）")
+    print(f"版本: {result['version'] or '未知'}\n")
+
+    header = f"{'階段':<10}{'秒數':>10}{'筆/秒':>12}{'峰值 MB':>10}"
+    if baseline:
+        header += f"{'基準秒數':>10}{'變化':>9}"
+    print(header)
+    print("-" * (len(header) + 8))
+    for name in STAGES + [name for name in result["stages"] if name not in STAGES]:
+        stage = result["stages"].get(name)
+        if stage is None:
+            continue
+        rate = f"{stage['items_per_sec']:,.0f}" if stage["items_per_sec"] is not None else "-"
+        line = f"{name:<10}{stage['seconds']:>10.3f}{rate:>12}{stage['peak_mb']:>10.1f}"
+        base = baseline["stages"].get(name) if baseline else None
+        if base and base["seconds"] > 0:
+            line += f"{base['seconds']:>10.3f}{stage['seconds'] / base['seconds'] - 1:>+9.0%}"
+        print(line)
+    print(f"\n總計 {result['total_seconds']:.3f} 秒")
+
+def save_result(path, result):
+    """把結果存成 JSON（先寫暫存檔再取代）"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def load_result(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="量化交易工作簿效能基準測試")
+    parser.add_argument("--rows", type=int, default=500, help="資料列數")
+    parser.add_argument("--tickers", type=int, default=50, help="不同股票檔數")
+    parser.add_argument("--prefilled", type=float, default=0.2, help="已填資料的列比例（0 ~ 1）")
+    parser.add_argument("--latency", type=float, default=0.0, help="每次下載請求的模擬延遲（秒）")
+    parser.add_argument("--workers", type=int, default=ci.FETCH_MAX_WORKERS, help="並行下載數")
+    parser.add_argument("--processes", type=int, default=0, help="指標計算的平行行程數（0 表示單一行程）")
+    parser.add_argument("--no-bulk", action="store_true", help="日 K 逐檔下載（不使用批次請求）")
+    parser.add_argument("--stream", action="store_true", help="使用串流模式（STREAM_WORKBOOK）")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子")
+    parser.add_argument("--repeat", type=int, default=1, help="計時次數（每個階段取最快的一次）")
+    parser.add_argument("--no-memory", action="store_true", help="不量測記憶體峰值（省下第二次執行）")
+    parser.add_argument("--verbose", action="store_true", help="顯示各階段原本的輸出")
+    parser.add_argument("--output", default=RESULT_FILE, help="結果 JSON 檔案")
+    parser.add_argument("--save-baseline", action="store_true", help="把結果存成基準")
+    parser.add_argument("--compare", action="store_true", help="與基準比較")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="基準 JSON 檔案")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="退步門檻（0.2 = 慢 20%%）")
+    args = parser.parse_args(argv)
+
+    # 與主程式相同：工作目錄有設定檔時套用（欄位名稱、價格距離視窗、其他指標）
+    ci.apply_config(sheet_config.load_config())
+    result = run_benchmark(rows=args.rows, tickers=args.tickers, prefilled=args.prefilled, latency=args.latency,
+                           max_workers=args.workers, trace_memory=not args.no_memory,
+                           seed=args.seed, repeat=args.repeat, processes=args.processes,
+                           bulk=not args.no_bulk, stream=args.stream, quiet=not args.verbose)
+
+    baseline = None
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"找不到基準檔案 {args.baseline}，請先執行 --save-baseline\n")
+        else:
+            baseline = load_result(args.baseline)
+            if baseline["params"] != result["params"]:
+                print(f"⚠ 基準的參數不同：{baseline['params']}\n")
+
+    print_report(result, baseline)
+    save_result(args.output, result)
+    print(f"結果已存到 {args.output}")
+
+    if args.save_baseline:
+        save_result(args.baseline, result)
+        print(f"已存成基準 {args.baseline}")
+
+    if baseline:
+        regressions = compare_results(result, baseline, args.threshold)
+        if regressions:
+            print(f"\n✗ 效能退步（超過 {args.threshold:.0%}）:")
+            for name, base_seconds, seconds, ratio in regressions:
+                print(f"  {name}: {base_seconds:.3f} 秒 -> {seconds:.3f} 秒（{ratio:.2f} 倍）")
+            return 1
+        print(f"\n✓ 沒有階段比基準慢超過 {args.threshold:.0%}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
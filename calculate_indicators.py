@@ -1,10 +1,502 @@
-import yfinance as yf
+import os
+import threading
+import time
 import pandas as pd
 from datetime import datetime, timedelta
-import openpyxl
 import numpy as np
 
-def calculate_intraday_prices(ticker, trade_date):
+import bar_cache
+import indicator_registry
+import instrumentation
+import intraday_archive
+import sheet_config
+import trading_calendar
+import update_journal
+from excel_writer import write_updates_to_workbook
+from fetch_pool import ConcurrentFetcher, TokenBucket
+from intraday_batch import calculate_intraday_prices_batch
+from parallel_compute import ParallelSequenceEngine
+from market_data import EmptyResponseError, get_provider
+from rolling_extrema import RollingExtremaIndex
+from sequence_store import save_sequences
+from streaming_workbook import has_cell_value, iter_sheet_blocks, patch_sheet
+
+# 工作簿、欄位名稱與價格距離視窗的預設值在 sheet_config.py，可以用設定檔覆寫（見 apply_config）
+INPUT_FILE = sheet_config.INPUT_FILE
+SHEET_NAME = sheet_config.SHEET_NAME
+TICKER_COLUMN = sheet_config.TICKER_COLUMN
+DATE_COLUMNS = list(sheet_config.DATE_COLUMNS)
+
+# 價格距離的視窗：結果 dict 的鍵 -> 交易日數
+PRICE_DISTANCE_WINDOWS = dict(sheet_config.PRICE_DISTANCE_WINDOWS)
+
+# 每列需要的日 K（以 NYSE 交易日計算，見 required_sessions）：
+# RSI/ADX 序列需要 6 個月序列的 120 個值加上 ADX 的暖機（兩次 14 日 rolling，前 26 根 K 棒沒有值），
+# 價格距離需要最長視窗的 K 棒數；另加 FETCH_PADDING_SESSIONS 個交易日，資料來源偶爾缺 K 棒時仍足夠
+SEQUENCE_FETCH_SESSIONS = 120 + 2 * (14 - 1)
+FETCH_PADDING_SESSIONS = 5
+
+# 是否使用本地 K 線快取（bar_cache.CACHE_DIR），只下載快取之後的新資料
+USE_BAR_CACHE = True
+
+# 是否使用盤中 1 分鐘 K 線封存（intraday_archive.ARCHIVE_DIR）
+USE_INTRADAY_ARCHIVE = True
+
+# RSI/ADX 序列側存檔（例如 "indicator_sequences.npz"）
+# 設定後序列以 float32 存在側存檔，工作表的序列欄位只寫入最近一天的值；None 表示照舊寫入完整序列字串
+SEQUENCE_SIDECAR_FILE = None
+
+# 並行下載設定：同時請求數、每秒請求數上限、失敗重試次數
+# 每秒請求數只限制實際送往網路來源的請求（見 throttle_request），快取命中、批次結果與本地來源不受限
+FETCH_MAX_WORKERS = 4
+FETCH_RATE_PER_SEC = 2.0
+FETCH_MAX_RETRIES = 3
+
+# 批次下載日 K：資料來源支援時，每 BULK_CHUNK_SIZE 檔股票只發出一次請求，失敗的股票再逐檔下載
+BULK_DAILY_DOWNLOAD = True
+BULK_CHUNK_SIZE = 50
+
+# 行情資料來源："yfinance" 或 "replay:<資料夾>"（本地檔案重播，可離線執行）
+MARKET_DATA_PROVIDER = os.environ.get("MARKET_DATA_PROVIDER", "yfinance")
+market_data_provider = get_provider(MARKET_DATA_PROVIDER)
+
+# 平行計算的行程數（0 或 1 表示單一行程），待處理列數達到 PARALLEL_MIN_ROWS 才會啟用
+PARALLEL_WORKERS = int(os.environ.get("PARALLEL_WORKERS", "0"))
+PARALLEL_MIN_ROWS = 2000
+
+# 更新日誌（update_journal）：每完成一列就附加到日誌，中斷後再次執行會重播日誌並從未完成的列繼續
+# RESUME=0 表示捨棄上次未完成的日誌、全部重新計算
+USE_UPDATE_JOURNAL = True
+RESUME_FROM_JOURNAL = os.environ.get("RESUME", "1") == "1"
+
+# 每完成幾列就把目前的結果寫回工作簿一次（先寫暫存檔再取代），0 表示只在最後寫回
+CHECKPOINT_EVERY_ROWS = 0
+
+# 串流模式（STREAM_WORKBOOK=1）：唯讀逐列掃描工作表、每批最多 STREAM_CHUNK_ROWS 列、只改寫有更新的列，
+# 適合數十萬列的大型工作表（記憶體不隨列數增加）
+STREAM_WORKBOOK = os.environ.get("STREAM_WORKBOOK") == "1"
+STREAM_CHUNK_ROWS = 5000
+
+# 只計算盤中價格（intraday 子命令），不計算 RSI/ADX 與價格距離
+INTRADAY_ONLY = False
+
+# 執行記錄（instrumentation.REPORT_DIR）：各階段耗時、快取命中率、最慢的資料列，並與上次比較
+WRITE_RUN_REPORT = True
+
+# 效能分析（會讓執行變慢）：PROFILE_RUN=1 記錄 cProfile 熱點，TRACE_MEMORY=1 記錄記憶體峰值
+PROFILE_RUN = os.environ.get("PROFILE_RUN") == "1"
+TRACE_MEMORY = os.environ.get("TRACE_MEMORY") == "1"
+
+# RSI/ADX 序列欄位 -> 結果 dict 的鍵
+SEQUENCE_COLUMNS = dict(sheet_config.SEQUENCE_COLUMNS)
+
+# 其他指標欄位（可選）：欄位 -> (指標, 序列長度)，指標見 indicator_registry.py
+INDICATOR_COLUMNS = dict(sheet_config.INDICATOR_COLUMNS)
+
+# 價格距離欄位（可選），額外的價格距離視窗使用「N日高價距離 (%)」/「N日低價距離 (%)」欄位
+PRICE_DISTANCE_COLUMNS = sheet_config.window_columns(PRICE_DISTANCE_WINDOWS, sheet_config.PRICE_DISTANCE_COLUMNS)
+
+# 盤中價格欄位（可選）
+INTRADAY_PRICE_COLUMNS = dict(sheet_config.INTRADAY_PRICE_COLUMNS)
+
+# 設定檔的鍵 -> 對應的模組常數
+CONFIG_CONSTANTS = {
+    "file": "INPUT_FILE",
+    "sheet": "SHEET_NAME",
+    "ticker_column": "TICKER_COLUMN",
+    "date_columns": "DATE_COLUMNS",
+    "price_distance_windows": "PRICE_DISTANCE_WINDOWS",
+    "sequence_columns": "SEQUENCE_COLUMNS",
+    "intraday_price_columns": "INTRADAY_PRICE_COLUMNS",
+    "indicator_columns": "INDICATOR_COLUMNS",
+    "provider": "MARKET_DATA_PROVIDER",
+    "parallel_workers": "PARALLEL_WORKERS",
+    "stream_workbook": "STREAM_WORKBOOK",
+    "stream_chunk_rows": "STREAM_CHUNK_ROWS",
+    "sequence_sidecar_file": "SEQUENCE_SIDECAR_FILE",
+    "checkpoint_every_rows": "CHECKPOINT_EVERY_ROWS",
+}
+
+# apply_config 套用過的設定（累計）：平行計算的子行程啟動時以同一份設定呼叫 apply_config
+applied_config = {}
+
+def apply_config(config):
+    """
+    套用設定（sheet_config.load_config 的結果），覆寫對應的模組常數
+    
+    價格距離視窗改變時一併重新計算價格距離欄位，資料來源改變時重新建立。
+    套用的設定累計在 applied_config，平行計算的子行程會套用同一份設定。
+    
+    參數:
+        config: {設定鍵: 值}
+    
+    例外:
+        ValueError: 指標欄位的指標無效
+    """
+    global PRICE_DISTANCE_COLUMNS, market_data_provider
+    for spec, _ in config.get("indicator_columns", {}).values():
+        indicator_registry.parse_spec(spec)
+    for key, value in config.items():
+        if key in CONFIG_CONSTANTS:
+            globals()[CONFIG_CONSTANTS[key]] = value
+    applied_config.update(config)
+    
+    PRICE_DISTANCE_COLUMNS = sheet_config.window_columns(
+        PRICE_DISTANCE_WINDOWS, config.get("price_distance_columns", sheet_config.PRICE_DISTANCE_COLUMNS))
+    if "provider" in config:
+        market_data_provider = get_provider(MARKET_DATA_PROVIDER)
+
+def required_sessions(need_rsi_adx=True, need_price_dist=True):
+    """
+    一列需要往前下載的交易日數（只需要價格距離的列不必下載 RSI/ADX 的暖機區間）
+    
+    參數:
+        need_rsi_adx: 是否計算 RSI/ADX 序列
+        need_price_dist: 是否計算價格距離
+    
+    返回:
+        int: 交易日數（含 FETCH_PADDING_SESSIONS）
+    """
+    sessions = 0
+    if need_rsi_adx:
+        # 其他指標欄位的序列長度加上該指標的暖機
+        sessions = max([SEQUENCE_FETCH_SESSIONS] + [length + indicator_registry.warmup(spec)
+                                                    for spec, length in INDICATOR_COLUMNS.values()])
+    if need_price_dist:
+        sessions = max(sessions, max(PRICE_DISTANCE_WINDOWS.values()))
+    return sessions + FETCH_PADDING_SESSIONS
+
+def daily_fetch_window(start_date, sessions=None):
+    """
+    計算單一開盤日期需要的日 K 下載區間（從開盤日期之前第 sessions 個 NYSE 交易日開始）
+    
+    參數:
+        start_date: 開盤日期
+        sessions: 往前的交易日數，預設為 required_sessions()
+    
+    返回:
+        tuple: (fetch_start, fetch_end)，fetch_end 不包含
+    """
+    start_date = pd.to_datetime(start_date)
+    if sessions is None:
+        sessions = required_sessions()
+    return trading_calendar.NYSE.sessions_before(start_date, sessions), start_date + timedelta(days=1)
+
+# 網路請求的令牌桶（所有執行緒共用），第一次請求時依 FETCH_RATE_PER_SEC 建立
+_request_bucket = None
+_request_bucket_lock = threading.Lock()
+
+def throttle_request():
+    """
+    向網路來源發出一次請求前取得令牌（每秒最多 FETCH_RATE_PER_SEC 次，不足時等待）
+    
+    只在實際呼叫資料來源前呼叫：快取命中、批次結果切片與本地來源（重播、合成）都不經過這裡。
+    """
+    global _request_bucket
+    if not market_data_provider.is_remote or not FETCH_RATE_PER_SEC:
+        return
+    with _request_bucket_lock:
+        if _request_bucket is None or _request_bucket.rate != FETCH_RATE_PER_SEC:
+            _request_bucket = TokenBucket(FETCH_RATE_PER_SEC)
+        bucket = _request_bucket
+    bucket.acquire()
+
+# 批次下載取得的日 K：{ticker: (start, end, DataFrame)}
+_bulk_daily_bars = {}
+
+def bulk_download_daily(fetch_plan):
+    """
+    以批次請求預先下載多檔股票的日 K（資料來源支援批次下載時）
+    
+    啟用快取時只下載快取缺少的區間。股票依下載區間的開始日排序後每 BULK_CHUNK_SIZE 檔一批，
+    每批請求涵蓋成員區間的聯集；之後 download_daily_bars 直接從批次結果切出需要的區間，
+    批次中失敗或沒有資料的股票照舊逐檔下載（含重試與負向快取）。
+    
+    參數:
+        fetch_plan: plan_daily_fetches 的結果 {ticker: (fetch_start, fetch_end)}
+    
+    返回:
+        int: 批次取得的股票數
+    """
+    _bulk_daily_bars.clear()
+    if not BULK_DAILY_DOWNLOAD or not market_data_provider.supports_batch:
+        return 0
+    
+    use_cache = USE_BAR_CACHE and market_data_provider.is_remote
+    windows = {}
+    for ticker, (fetch_start, fetch_end) in fetch_plan.items():
+        window = (pd.Timestamp(fetch_start).normalize(), pd.Timestamp(fetch_end).normalize())
+        if use_cache:
+            window = bar_cache.missing_range(ticker, fetch_start, fetch_end, "1d")
+        if window is not None:
+            windows[ticker] = window
+    if len(windows) < 2:
+        return 0
+    
+    tickers = sorted(windows, key=lambda ticker: windows[ticker])
+    for i in range(0, len(tickers), BULK_CHUNK_SIZE):
+        chunk = tickers[i:i + BULK_CHUNK_SIZE]
+        start = min(windows[ticker][0] for ticker in chunk)
+        end = max(windows[ticker][1] for ticker in chunk)
+        print(f"  正在批次下載 {len(chunk)} 檔股票的日 K...")
+        instrumentation.count("bulk_download.requests")
+        throttle_request()
+        frames = market_data_provider.get_daily_bars_batch(chunk, start, end, chunk_size=BULK_CHUNK_SIZE)
+        for ticker, df in frames.items():
+            instrumentation.record_download(ticker, "1d", df)
+            _bulk_daily_bars[ticker] = (start, end, df)
+        if len(frames) < len(chunk):
+            print(f"  ⚠ {len(chunk) - len(frames)} 檔股票批次下載失敗，改為逐檔下載")
+    instrumentation.count("bulk_download.tickers", len(_bulk_daily_bars))
+    return len(_bulk_daily_bars)
+
+def download_daily_bars(ticker, start, end):
+    """
+    從目前的資料來源下載日 K 資料（批次下載已涵蓋此區間時直接取用批次結果）
+    
+    參數:
+        ticker: 股票代碼
+        start: 開始日期（包含）
+        end: 結束日期（不包含）
+    
+    返回:
+        DataFrame: 日 K 資料，無資料時為空的 DataFrame
+    """
+    if ticker in _bulk_daily_bars:
+        bulk_start, bulk_end, df = _bulk_daily_bars[ticker]
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        if bulk_start <= start and end <= bulk_end:
+            i = df.index.searchsorted(start, side="left")
+            j = df.index.searchsorted(end, side="left")
+            return df.iloc[i:j]
+    
+    print(f"  正在下載 {ticker} 的資料...")
+    throttle_request()
+    df = market_data_provider.get_daily_bars(ticker, start, end)
+    instrumentation.record_download(ticker, "1d", df)
+    return df
+
+def load_daily_bars(ticker, start, end):
+    """
+    取得日 K 資料（網路來源且啟用快取時先讀本地快取，只下載缺少的部分）
+    
+    參數:
+        ticker: 股票代碼
+        start: 開始日期（包含）
+        end: 結束日期（不包含）
+    
+    返回:
+        DataFrame: 日 K 資料
+    """
+    start_time = time.perf_counter()
+    if USE_BAR_CACHE and market_data_provider.is_remote:
+        df = bar_cache.cached_download(ticker, start, end, "1d", download_daily_bars)
+    else:
+        df = download_daily_bars(ticker, start, end)
+    instrumentation.record_fetch(ticker, "1d", time.perf_counter() - start_time, start)
+    return df
+
+def download_intraday_bars(ticker, start, end):
+    """
+    從目前的資料來源下載 1 分鐘 K 線
+    
+    參數:
+        ticker: 股票代碼
+        start: 開始日期（包含）
+        end: 結束日期（不包含）
+    
+    返回:
+        DataFrame: 1 分鐘 K 線，無資料時為空的 DataFrame
+    """
+    print(f"  正在下載 {ticker} 的盤中數據...")
+    throttle_request()
+    df = market_data_provider.get_intraday_bars(ticker, start, end)
+    instrumentation.record_download(ticker, "1m", df)
+    return df
+
+def load_intraday_bars(ticker, start, end):
+    """
+    取得 1 分鐘 K 線（網路來源且啟用快取時先讀本地快取）
+    
+    參數:
+        ticker: 股票代碼
+        start: 開始日期（包含）
+        end: 結束日期（不包含）
+    
+    返回:
+        DataFrame: 1 分鐘 K 線
+    """
+    start_time = time.perf_counter()
+    if USE_BAR_CACHE and market_data_provider.is_remote:
+        df = bar_cache.cached_download(ticker, start, end, "1m", download_intraday_bars)
+    else:
+        df = download_intraday_bars(ticker, start, end)
+    instrumentation.record_fetch(ticker, "1m", time.perf_counter() - start_time, start)
+    return df
+
+def fetch_daily_bars(fetch_plan, fetcher):
+    """
+    下載 fetch_plan 中所有股票的日 K
+    
+    先以 bulk_download_daily 批次下載；批次結果或本地快取已涵蓋的股票直接取用，
+    只有其餘的股票（批次失敗、不支援批次）交給 fetcher 逐檔並行下載（含限速、重試與負向快取）。
+    直接取用但沒有資料的股票同樣記入 fetcher 的負向快取。
+    
+    參數:
+        fetch_plan: plan_daily_fetches 的結果 {ticker: (fetch_start, fetch_end)}
+        fetcher: ConcurrentFetcher（下載函式為 load_daily_bars）
+    
+    返回:
+        dict: {ticker: DataFrame 或 None}（None 表示下載失敗）
+    """
+    bulk_download_daily(fetch_plan)
+    try:
+        use_cache = USE_BAR_CACHE and market_data_provider.is_remote
+        daily_bars, remaining = {}, {}
+        for ticker, (fetch_start, fetch_end) in fetch_plan.items():
+            if ticker in _bulk_daily_bars or (
+                    use_cache and bar_cache.missing_range(ticker, fetch_start, fetch_end) is None):
+                df = load_or_empty(load_daily_bars, ticker, fetch_start, fetch_end)
+                if df.empty:
+                    fetcher.negative_cache.add(ticker)
+                daily_bars[ticker] = df
+            else:
+                remaining[ticker] = (ticker, fetch_start, fetch_end)
+        if remaining and daily_bars:
+            print(f"  正在逐檔下載 {len(remaining)} 檔股票的日 K...")
+        daily_bars.update(fetcher.fetch_all(remaining))
+    finally:
+        _bulk_daily_bars.clear()
+    return daily_bars
+
+def load_or_empty(load, ticker, start, end):
+    """
+    不經過 ConcurrentFetcher 直接下載時使用：資料來源回傳空資料（EmptyResponseError）時當成沒有資料
+    
+    參數:
+        load: load_daily_bars 或 load_intraday_bars
+        ticker: 股票代碼
+        start: 開始日期（包含）
+        end: 結束日期（不包含）
+    
+    返回:
+        DataFrame: K 線資料，沒有資料時為空的 DataFrame
+    """
+    try:
+        return load(ticker, start, end)
+    except EmptyResponseError as e:
+        print(f"  ⚠ {str(e)}")
+        return pd.DataFrame()
+
+def intraday_out_of_range(trade_date):
+    """檢查交易日是否超出資料來源的 1 分鐘資料回溯範圍"""
+    lookback = market_data_provider.intraday_lookback_days
+    return lookback is not None and (datetime.now() - trade_date).days > lookback
+
+def plan_daily_fetches(requests):
+    """
+    依股票代碼分組，規劃每檔股票只下載一次的日 K 區間
+    
+    每檔股票的下載區間為所有列所需視窗的聯集，
+    讓網路請求次數取決於股票檔數，而不是資料列數。
+    
+    參數:
+        requests: [(ticker, start_date), ...] 或 [(ticker, start_date, 交易日數), ...]（見 required_sessions）
+    
+    返回:
+        dict: {ticker: (fetch_start, fetch_end)}
+    """
+    plan = {}
+    for ticker, start_date, *sessions in requests:
+        fetch_start, fetch_end = daily_fetch_window(start_date, *sessions)
+        if ticker in plan:
+            prev_start, prev_end = plan[ticker]
+            fetch_start = min(fetch_start, prev_start)
+            fetch_end = max(fetch_end, prev_end)
+        plan[ticker] = (fetch_start, fetch_end)
+    return plan
+
+def plan_intraday_fetches(pending_rows):
+    """
+    規劃需要下載的盤中 1 分鐘 K 線（已封存或超出回溯範圍的日期不下載）
+    
+    參數:
+        pending_rows: find_pending_rows 的回傳列表
+    
+    返回:
+        dict: {(ticker, 交易日): (ticker, start, end)}，可直接傳給 ConcurrentFetcher.fetch_all
+    """
+    requests = {}
+    for _, ticker, date, _, _, need_intraday in pending_rows:
+        if not need_intraday:
+            continue
+        trade_date = pd.to_datetime(date)
+        if not trading_calendar.NYSE.is_session(trade_date):
+            continue
+        if USE_INTRADAY_ARCHIVE and intraday_archive.has_archived_day(ticker, trade_date):
+            continue
+        if intraday_out_of_range(trade_date):
+            continue
+        requests[(ticker, trade_date.normalize())] = (
+            ticker, trade_date.strftime("%Y-%m-%d"), (trade_date + timedelta(days=1)).strftime("%Y-%m-%d")
+        )
+    return requests
+
+def load_intraday_session(ticker, trade_date, intraday_df=None):
+    """
+    取得一檔股票某一天的 1 分鐘 K 線（優先使用本地封存，其次為已下載的資料或資料來源）
+    
+    參數:
+        ticker: 股票代號
+        trade_date: 交易日期（美國時間）
+        intraday_df: 已下載的當天 1 分鐘 K 線（可選），提供時不再重新下載
+    
+    返回:
+        DataFrame: 當天的 1 分鐘 K 線，無法取得時為 None
+    """
+    # 確保日期格式正確
+    if isinstance(trade_date, str):
+        trade_date = pd.to_datetime(trade_date)
+    
+    # 設定日期範圍（當天）
+    start = trade_date.strftime("%Y-%m-%d")
+    end = (trade_date + timedelta(days=1)).strftime("%Y-%m-%d")
+    
+    # 休市日沒有盤中資料，不必查封存或下載
+    if not trading_calendar.NYSE.is_session(trade_date):
+        print(f"  ⚠ {start} 不是美股交易日，沒有盤中數據")
+        return None
+    
+    # 優先使用本地封存（不受 7 天限制）
+    df = pd.DataFrame()
+    if USE_INTRADAY_ARCHIVE:
+        df = intraday_archive.read_archived_day(ticker, trade_date)
+        if not df.empty:
+            print(f"  使用 {ticker} 在 {start} 的盤中封存資料")
+        instrumentation.count("intraday_archive.miss" if df.empty else "intraday_archive.hit")
+    
+    if df.empty:
+        # 檢查是否在資料來源的回溯範圍內（yfinance 為最近 7 天）
+        if intraday_out_of_range(trade_date):
+            print(f"  ⚠ {ticker} 在 {start} 超過 {market_data_provider.intraday_lookback_days} 天且沒有封存資料，"
+                  f"無法獲取盤中數據（{market_data_provider.name} 限制）")
+            return None
+        
+        # 取得 1 分鐘數據
+        df = intraday_df if intraday_df is not None else load_or_empty(load_intraday_bars, ticker, start, end)
+        
+        if df.empty:
+            print(f"  ⚠ 無法獲取 {ticker} 在 {start} 的盤中數據")
+            return None
+        
+        # 已收盤的交易日順便封存，之後超過 7 天仍可計算（本地重播資料不封存）
+        if (USE_INTRADAY_ARCHIVE and market_data_provider.is_remote
+                and trade_date.normalize() < pd.Timestamp.now().normalize()):
+            intraday_archive.archive_bars(ticker, df)
+    
+    return df
+
+def calculate_intraday_prices(ticker, trade_date, intraday_df=None):
     """
     計算盤中價格指標（僅限最近 7 天）
     
@@ -17,39 +509,16 @@ def calculate_intraday_prices(ticker, trade_date):
     參數:
         ticker: 股票代號
         trade_date: 交易日期（美國時間）
+        intraday_df: 已下載的當天 1 分鐘 K 線（可選），提供時不再重新下載
     
     返回:
         dict: 包含各項價格指標，如果無法獲取則返回 None
     """
     try:
-        # 確保日期格式正確
-        if isinstance(trade_date, str):
-            trade_date = pd.to_datetime(trade_date)
-        
-        # 檢查是否在最近 7 天內
-        days_ago = (datetime.now() - trade_date).days
-        if days_ago > 7:
-            print(f"  ⚠ {trade_date.strftime('%Y-%m-%d')} 超過 7 天，無法獲取盤中數據（yfinance 限制）")
+        df = load_intraday_session(ticker, trade_date, intraday_df)
+        if df is None:
             return None
         
-        # 下載分鐘級數據
-        print(f"  正在下載 {ticker} 的盤中數據...")
-        
-        # 設定日期範圍（當天）
-        start = trade_date.strftime("%Y-%m-%d")
-        end = (trade_date + timedelta(days=1)).strftime("%Y-%m-%d")
-        
-        # 下載 1 分鐘數據
-        df = yf.download(ticker, start=start, end=end, interval="1m", progress=False)
-        
-        if df.empty:
-            print(f"  ⚠ 無法獲取 {ticker} 在 {start} 的盤中數據")
-            return None
-        
-        # 處理多層索引
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = df.columns.get_level_values(0)
-        
         # 確保有必要的欄位
         if 'Open' not in df.columns or 'High' not in df.columns or 'Low' not in df.columns:
             print(f"  ⚠ 數據不完整")
@@ -149,44 +618,18 @@ def calculate_price_distance(close_prices, current_price, days):
     }
 
 def calculate_rsi(close_prices, period=14):
-    """計算 RSI 指標"""
-    delta = close_prices.diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-    rs = gain / loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
+    """計算 RSI 指標（indicator_registry 的 RSI）"""
+    return indicator_registry.compute(f"RSI({period})", {"Close": close_prices})
 
 def calculate_adx(high, low, close, period=14):
-    """計算 ADX 指標"""
-    # 計算 True Range
-    high_low = high - low
-    high_close = np.abs(high - close.shift())
-    low_close = np.abs(low - close.shift())
-    tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-    
-    # 計算方向移動
-    up_move = high - high.shift()
-    down_move = low.shift() - low
-    
-    plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0)
-    minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0)
-    
-    plus_dm = pd.Series(plus_dm, index=close.index)
-    minus_dm = pd.Series(minus_dm, index=close.index)
-    
-    # 平滑化
-    atr = tr.rolling(window=period).mean()
-    plus_di = 100 * (plus_dm.rolling(window=period).mean() / atr)
-    minus_di = 100 * (minus_dm.rolling(window=period).mean() / atr)
-    
-    # 計算 DX 和 ADX
-    dx = 100 * np.abs(plus_di - minus_di) / (plus_di + minus_di)
-    adx = dx.rolling(window=period).mean()
-    
-    return adx
+    """計算 ADX 指標（indicator_registry 的 ADX）"""
+    return indicator_registry.compute(f"ADX({period})", {"High": high, "Low": low, "Close": close})
+
+def indicator_key(spec, length):
+    """其他指標欄位在結果 dict 中的鍵（例如 ATR(14)_5天）"""
+    return f"{spec}_{length}天"
 
-def calculate_rsi_adx_sequences(ticker, start_date, days_5=5, days_30=30, days_180=120):
+def calculate_rsi_adx_sequences(ticker, start_date, days_5=5, days_30=30, days_180=120, daily_df=None):
     """
     計算指定股票在開盤日期之前的 RSI、ADX 和價格距離（過去的資料）
     
@@ -196,6 +639,7 @@ def calculate_rsi_adx_sequences(ticker, start_date, days_5=5, days_30=30, days_1
         days_5: 5天序列長度
         days_30: 30天序列長度
         days_180: 6個月序列長度（約120個交易日）
+        daily_df: 已下載的日 K 資料（可選），涵蓋此列的下載區間時不再重新下載
     
     返回:
         dict: 包含 RSI、ADX 的序列和價格距離
@@ -206,194 +650,245 @@ def calculate_rsi_adx_sequences(ticker, start_date, days_5=5, days_30=30, days_1
             start_date = pd.to_datetime(start_date)
         
         # 計算需要抓取的日期範圍（需要更多資料以計算 6 個月序列）
-        fetch_start = start_date - timedelta(days=250)  # 約 8 個月前，確保有足夠交易日
-        fetch_end = start_date + timedelta(days=1)
+        fetch_start, fetch_end = daily_fetch_window(start_date)
         
-        # 下載股票資料
-        print(f"  正在下載 {ticker} 的資料...")
-        df = yf.download(ticker, start=fetch_start, end=fetch_end, progress=False)
+        if daily_df is None:
+            df = load_or_empty(load_daily_bars, ticker, fetch_start, fetch_end)
+        elif daily_df.empty:
+            df = daily_df
+        else:
+            # 從整批下載的資料中以 searchsorted 切出此列的區間（索引已排序，不需要整欄布林遮罩）
+            i, j = np.searchsorted(pd.DatetimeIndex(daily_df.index).as_unit("ns").asi8,
+                                   pd.DatetimeIndex([fetch_start, fetch_end]).as_unit("ns").asi8, side="left")
+            df = daily_df.iloc[i:j].copy()
         
         if df.empty:
             print(f"  警告: {ticker} 沒有資料")
             return None
         
-        # 處理多層索引的情況
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = df.columns.get_level_values(0)
-        
-        # 確保資料是一維的
-        for col in ['Open', 'High', 'Low', 'Close', 'Volume']:
-            if col in df.columns and df[col].ndim > 1:
-                df[col] = df[col].iloc[:, 0]
-        
-        # 計算 RSI (14)
-        df["RSI"] = calculate_rsi(df["Close"], period=14)
-        
-        # 計算 ADX (14)
-        df["ADX"] = calculate_adx(df["High"], df["Low"], df["Close"], period=14)
-        
-        # 找到開盤日期當天或之前的資料
-        df_before_start = df[df.index <= start_date]
-        
-        # 找到開盤日期的前一天（昨日）
-        # 注意：這裡要找開盤日期之前的最後一個交易日
-        df_before_open = df[df.index < start_date]
-        
-        if len(df_before_open) == 0:
-            print(f"  警告: {ticker} 找不到開盤日期之前的資料")
-            return None
-        
-        if len(df_before_start) < days_180:
-            print(f"  警告: {ticker} 在 {start_date.date()} 之前的資料不足 {days_180} 天")
-        
-        # 取得序列（移除 NaN 值）
-        rsi_series = df_before_start["RSI"].dropna()
-        adx_series = df_before_start["ADX"].dropna()
-        close_series = df_before_open["Close"]  # 使用開盤日期之前的收盤價
-        
-        # 取得最近的 5 天、30 天和 120 天序列（從最遠到最近）
-        # 四捨五入到 1 位小數
-        rsi_5 = [round(x, 1) for x in rsi_series.tail(days_5).tolist()]
-        rsi_30 = [round(x, 1) for x in rsi_series.tail(days_30).tolist()]
-        rsi_180 = [round(x, 1) for x in rsi_series.tail(days_180).tolist()]
-        adx_5 = [round(x, 1) for x in adx_series.tail(days_5).tolist()]
-        adx_30 = [round(x, 1) for x in adx_series.tail(days_30).tolist()]
-        adx_180 = [round(x, 1) for x in adx_series.tail(days_180).tolist()]
-        
-        # 計算價格距離（使用昨日收盤價 = 開盤日期前一個交易日的收盤價）
-        yesterday_close = close_series.iloc[-1]  # 開盤日期前一個交易日的收盤價
-        yesterday_date = close_series.index[-1]  # 昨日的日期
-        
-        print(f"  昨日日期: {yesterday_date.strftime('%Y-%m-%d')} (美國時間)")
-        
-        price_dist_5 = calculate_price_distance(close_series, yesterday_close, 5)
-        price_dist_30 = calculate_price_distance(close_series, yesterday_close, 30)
-        price_dist_180 = calculate_price_distance(close_series, yesterday_close, 120)
-        
-        return {
-            "RSI_5天": rsi_5,
-            "RSI_30天": rsi_30,
-            "RSI_180天": rsi_180,
-            "ADX_5天": adx_5,
-            "ADX_30天": adx_30,
-            "ADX_180天": adx_180,
-            "價格距離_5日": price_dist_5,
-            "價格距離_30日": price_dist_30,
-            "價格距離_180日": price_dist_180,
-            "昨日收盤價": round(yesterday_close, 2),
-            "實際資料天數": len(rsi_series)
-        }
+        result = calculate_rsi_adx_sequences_batch(ticker, [start_date], df, days_5, days_30, days_180)[0]
+        if result:
+            print(f"  昨日日期: {result['昨日日期'].strftime('%Y-%m-%d')} (美國時間)")
+        return result
     
     except Exception as e:
         print(f"  處理 {ticker} 時發生錯誤: {str(e)}")
         return None
 
-if __name__ == "__main__":
-    # 執行主程式
-    input_file = "量化交易.xlsx"
-    sheet_name = "資料庫"
+def _tail_windows(values, positions, length):
+    """
+    一次取出多個「結尾位置」之前 length 筆的視窗
     
-    print("="*60)
-    print("美股技術指標計算系統 - RSI & ADX")
-    print("="*60)
-    print("\n計算指標：")
-    print("  ✓ RSI (相對強弱指標) - 5天、30天和6個月序列")
-    print("  ✓ ADX (平均趨向指標) - 5天、30天和6個月序列")
-    print("  ✓ 價格距離 - 昨日收盤價距離過去高低點的百分比")
-    print("  ✓ 盤中價格 - 開盤價、10分鐘最低價、1.5小時最高價等")
-    print("    ⚠ 盤中數據僅限最近 7 天（yfinance 免費版限制）")
-    print("\n資料來源：Yahoo Finance (免費)")
-    print("="*60 + "\n")
+    參數:
+        values: 一維 NumPy 陣列
+        positions: 每個視窗的結尾位置（不包含），即 values[:pos] 的最後 length 筆
+        length: 視窗長度
     
-    # 讀取 Excel
-    print(f"正在讀取 {input_file} 的 '{sheet_name}' 工作表...")
-    df = pd.read_excel(input_file, sheet_name=sheet_name)
+    返回:
+        list: 每個位置對應的視窗（長度不足時回傳較短的陣列）
+    """
+    windows = [None] * len(positions)
+    full = positions >= length
+    if len(values) >= length and full.any():
+        # sliding_window_view 回傳的是 strided view，不複製資料
+        strided = np.lib.stride_tricks.sliding_window_view(values, length)
+        rows = strided[positions[full] - length]
+        for i, window in zip(np.flatnonzero(full), rows):
+            windows[i] = window
+    for i in np.flatnonzero(~full):
+        windows[i] = values[:positions[i]]
+    return windows
+
+def calculate_price_distance_batch(ticker, start_dates, daily_df, windows=None, extrema=None):
+    """
+    對同一檔股票的多個開盤日期，一次計算昨日收盤價與價格距離
     
-    print(f"Excel 欄位: {df.columns.tolist()}")
-    print(f"共有 {len(df)} 筆資料\n")
+    收盤價只建一次滾動最高/最低價索引（rolling_extrema），每個 (日期, 視窗) 都是 O(1) 查詢，
+    結果與逐列呼叫 calculate_price_distance 相同。
     
-    # 使用正確的欄位名稱（支援多種格式）
-    ticker_col = '公司代碼'
+    參數:
+        ticker: 股票代碼
+        start_dates: 開盤日期列表
+        daily_df: 涵蓋所有日期所需區間的日 K 資料
+        windows: {結果鍵: 交易日數}，預設為 PRICE_DISTANCE_WINDOWS
+        extrema: 已建立的收盤價 RollingExtremaIndex（可選，與 daily_df 對齊），提供時不再重建
     
-    # 嘗試找到日期欄位（支援多種名稱）
-    date_col = None
-    possible_date_cols = ['開盤日期(台灣時間)', '開盤日期', '日期', '交易日期']
-    for col in possible_date_cols:
-        if col in df.columns:
-            date_col = col
-            break
+    返回:
+        list: 與 start_dates 對應的 dict（各視窗的價格距離、昨日收盤價、昨日日期），
+              開盤日期之前沒有資料時為 None
+    """
+    if daily_df is None or daily_df.empty:
+        return [None] * len(start_dates)
+    if windows is None:
+        windows = PRICE_DISTANCE_WINDOWS
     
-    # 檢查欄位是否存在
-    if ticker_col not in df.columns:
-        print(f"錯誤: 找不到 '{ticker_col}' 欄位")
-        print(f"現有欄位: {df.columns.tolist()}")
-        exit(1)
+    dates = pd.DatetimeIndex(pd.to_datetime(list(start_dates))).as_unit("ns")
+    index = pd.DatetimeIndex(daily_df.index).as_unit("ns")
+    close_values = daily_df["Close"].to_numpy(dtype=np.float64)
     
-    if date_col is None:
-        print(f"錯誤: 找不到日期欄位")
-        print(f"支援的日期欄位名稱: {possible_date_cols}")
-        print(f"現有欄位: {df.columns.tolist()}")
-        exit(1)
+    pos_before = np.searchsorted(index.asi8, dates.asi8, side="left")
+    window_start = trading_calendar.NYSE.sessions_before(dates, required_sessions(need_rsi_adx=False))
+    pos_window = np.searchsorted(index.asi8, window_start.as_unit("ns").asi8, side="left")
     
-    print(f"使用欄位: 股票代碼='{ticker_col}', 日期='{date_col}'\n")
+    # 使用昨日收盤價 = 開盤日期前一個交易日的收盤價；視窗只使用下載區間內的資料
+    if extrema is None:
+        extrema = RollingExtremaIndex(close_values)
+    yesterday_close = close_values[np.maximum(pos_before - 1, 0)]
+    available = pos_before - pos_window
+    distances = {key: extrema.price_distances(pos_before, days, yesterday_close, available)
+                 for key, days in windows.items()}
     
-    # 更新對應的欄位
-    rsi_5_col = '5天 RSI 序列'
-    rsi_30_col = '1個月 RSI 序列'
-    rsi_180_col = '6個月 RSI 序列'
-    adx_5_col = '5天 ADX 序列'
-    adx_30_col = '1個月 ADX 序列'
-    adx_180_col = '6個月 ADX 序列'
-    
-    # 價格距離欄位（可選）
-    price_dist_cols = {
-        '5日高價距離 (%)': ('價格距離_5日', '距離最高價(%)'),
-        '5日低價距離 (%)': ('價格距離_5日', '距離最低價(%)'),
-        '1個月高價距離 (%)': ('價格距離_30日', '距離最高價(%)'),
-        '1個月低價距離 (%)': ('價格距離_30日', '距離最低價(%)'),
-        '6個月高價距離 (%)': ('價格距離_180日', '距離最高價(%)'),
-        '6個月低價距離 (%)': ('價格距離_180日', '距離最低價(%)'),
-        '*昨日收盤價': ('昨日收盤價', None),
-        '昨日收盤價': ('昨日收盤價', None)  # 支援兩種名稱
-    }
+    results = []
+    for i in range(len(dates)):
+        if pos_before[i] == 0:
+            results.append(None)
+            continue
+        
+        result = {key: distances[key][i] for key in windows}
+        result["昨日收盤價"] = round(yesterday_close[i], 2)
+        result["昨日日期"] = index[pos_before[i] - 1]
+        results.append(result)
+    return results
+
+def calculate_rsi_adx_sequences_batch(ticker, start_dates, daily_df, days_5=5, days_30=30, days_180=120,
+                                      price_distance=True, indicators=None, extrema=None):
+    """
+    對同一檔股票的多個開盤日期，一次計算 RSI、ADX 序列和價格距離
     
-    # 盤中價格欄位（可選）
-    intraday_price_cols = {
-        '*開盤價格': ('盤中價格', '開盤價'),
-        '開盤價格': ('盤中價格', '開盤價'),
-        '*10分鐘最低價': ('盤中價格', '10分鐘最低價'),
-        '10分鐘最低價': ('盤中價格', '10分鐘最低價'),
-        '*1.5小時最高價': ('盤中價格', '1.5小時最高價'),
-        '1.5小時最高價': ('盤中價格', '1.5小時最高價'),
-        '*最高價前的最低價': ('盤中價格', '最高價前的最低價'),
-        '最高價前的最低價': ('盤中價格', '最高價前的最低價')
-    }
+    指標只在整段歷史上計算一次，再以 searchsorted 找出每個日期在索引中的位置，
+    用 strided view 一次取出所有 5/30/120 天的視窗，每列成本只和視窗長度有關。
     
-    # 找到欄位索引
-    col_indices = {}
-    for col_name in [rsi_5_col, rsi_30_col, rsi_180_col, adx_5_col, adx_30_col, adx_180_col]:
-        if col_name in df.columns:
-            col_indices[col_name] = df.columns.get_loc(col_name) + 1
+    參數:
+        ticker: 股票代碼
+        start_dates: 開盤日期列表
+        daily_df: 涵蓋所有日期所需區間的日 K 資料
+        days_5: 5天序列長度
+        days_30: 30天序列長度
+        days_180: 6個月序列長度（約120個交易日）
+        price_distance: 是否一併計算價格距離（calculate_price_distance_batch）
+        indicators: 已計算好的整段 (RSI, ADX) 陣列（可選，與 daily_df 對齊），提供時不再重新計算
+                    （INDICATOR_COLUMNS 的其他指標仍會計算）
+        extrema: 已建立的收盤價 RollingExtremaIndex（可選），傳給 calculate_price_distance_batch
     
-    # 找到價格距離欄位索引
-    for col_name in price_dist_cols.keys():
-        if col_name in df.columns:
-            col_indices[col_name] = df.columns.get_loc(col_name) + 1
+    返回:
+        list: 與 start_dates 對應的結果 dict（與 calculate_rsi_adx_sequences 相同格式，
+              另有 INDICATOR_COLUMNS 的序列，鍵為 indicator_key），無法計算時為 None
+    """
+    if daily_df is None or daily_df.empty:
+        print(f"  警告: {ticker} 沒有資料")
+        return [None] * len(start_dates)
     
-    # 找到盤中價格欄位索引
-    for col_name in intraday_price_cols.keys():
+    try:
+        dates = pd.DatetimeIndex(pd.to_datetime(list(start_dates))).as_unit("ns")
+        index = pd.DatetimeIndex(daily_df.index).as_unit("ns")
+        index_ns = index.asi8
+        dates_ns = dates.asi8
+        window_start_ns = trading_calendar.NYSE.sessions_before(
+            dates, required_sessions(need_price_dist=False)).as_unit("ns").asi8
+        
+        # 所有指標以同一份計算計畫計算（True Range、平均等中間結果只算一次）
+        extra_specs = tuple(dict.fromkeys(spec for spec, _ in INDICATOR_COLUMNS.values()))
+        if indicators is not None:
+            rsi, adx = indicators
+            computed = indicator_registry.plan_for(extra_specs).compute(daily_df) if extra_specs else {}
+        else:
+            computed = indicator_registry.plan_for(("RSI(14)", "ADX(14)") + extra_specs).compute(daily_df)
+            rsi = computed["RSI(14)"].to_numpy()
+            adx = computed["ADX(14)"].to_numpy()
+        
+        # 各日期在索引中的位置：<= 開盤日期（指標序列）、< 開盤日期（昨日收盤）
+        pos_through = np.searchsorted(index_ns, dates_ns, side="right")
+        pos_before = np.searchsorted(index_ns, dates_ns, side="left")
+        pos_window = np.searchsorted(index_ns, window_start_ns, side="left")
+        
+        # 移除 NaN 後的序列（與 dropna 相同）
+        sequences = {}
+        for name, values in (("RSI", rsi), ("ADX", adx)):
+            valid = ~np.isnan(values)
+            valid_values = np.round(values[valid], 1)
+            valid_index = index_ns[valid]
+            positions = np.searchsorted(valid_index, dates_ns, side="right")
+            sequences[name] = {
+                length: _tail_windows(valid_values, positions, length)
+                for length in (days_5, days_30, days_180)
+            }
+            if name == "RSI":
+                # 實際資料天數：下載區間內扣除前 13 筆暖機（rolling 14 的前 13 筆）後的有效 RSI 筆數
+                valid_cumsum = np.concatenate([[0], np.cumsum(valid)])
+                rsi_counts = valid_cumsum[pos_through] - valid_cumsum[np.minimum(pos_window + 13, pos_through)]
+        
+        # 其他指標欄位的序列（價格類的指標保留 2 位小數）
+        extra_sequences = {}
+        for spec, length in dict.fromkeys(INDICATOR_COLUMNS.values()):
+            values = computed[spec].to_numpy(dtype=np.float64)
+            valid = ~np.isnan(values)
+            positions = np.searchsorted(index_ns[valid], dates_ns, side="right")
+            extra_sequences[indicator_key(spec, length)] = _tail_windows(np.round(values[valid], 2), positions, length)
+        
+        distances = calculate_price_distance_batch(ticker, dates, daily_df, extrema=extrema) if price_distance else None
+        
+        results = []
+        for i, start_date in enumerate(dates):
+            if pos_before[i] == 0:
+                print(f"  警告: {ticker} 找不到 {start_date.date()} 之前的資料")
+                results.append(None)
+                continue
+            
+            if pos_through[i] - pos_window[i] < days_180:
+                print(f"  警告: {ticker} 在 {start_date.date()} 之前的資料不足 {days_180} 天")
+            
+            result = {
+                "RSI_5天": sequences["RSI"][days_5][i].tolist(),
+                "RSI_30天": sequences["RSI"][days_30][i].tolist(),
+                "RSI_180天": sequences["RSI"][days_180][i].tolist(),
+                "ADX_5天": sequences["ADX"][days_5][i].tolist(),
+                "ADX_30天": sequences["ADX"][days_30][i].tolist(),
+                "ADX_180天": sequences["ADX"][days_180][i].tolist(),
+                "昨日日期": index[pos_before[i] - 1],
+                "實際資料天數": int(rsi_counts[i])
+            }
+            for key, windows in extra_sequences.items():
+                result[key] = windows[i].tolist()
+            if distances is not None:
+                result.update(distances[i])
+            results.append(result)
+        return results
+    
+    except Exception as e:
+        print(f"  處理 {ticker} 時發生錯誤: {str(e)}")
+        return [None] * len(start_dates)
+
+def find_column_indices(df):
+    """
+    找出工作表中要寫入的欄位索引（RSI/ADX 序列、價格距離、盤中價格）
+    
+    返回:
+        dict: {欄位名稱: 欄位索引（從 1 開始）}
+    """
+    col_indices = {}
+    for col_name in [*SEQUENCE_COLUMNS, *INDICATOR_COLUMNS, *PRICE_DISTANCE_COLUMNS, *INTRADAY_PRICE_COLUMNS]:
         if col_name in df.columns:
             col_indices[col_name] = df.columns.get_loc(col_name) + 1
+    return col_indices
+
+def find_pending_rows(df, ticker_col, date_col):
+    """
+    找出每列需要計算的項目（已有資料的欄位不再計算）
     
-    # 統計變數
-    processed_count = 0
-    skipped_count = 0
-    failed_count = 0
+    參數:
+        df: 工作表資料
+        ticker_col: 股票代碼欄位名稱
+        date_col: 開盤日期欄位名稱
     
-    # 儲存需要更新的資料
-    updates = {}
+    返回:
+        tuple: ([(idx, ticker, date, need_rsi_adx, need_price_dist, need_intraday), ...], 跳過的筆數)
+    """
+    pending_rows = []
+    skipped_count = 0
+    columns = set(df.columns)
+    # 工作表中有的其他指標欄位與 RSI/ADX 序列一起判斷（任一欄是空的就重新計算）
+    sequence_columns = {**SEQUENCE_COLUMNS, **{col: spec for col, spec in INDICATOR_COLUMNS.items() if col in columns}}
     
-    # 逐行處理
     for idx, row in df.iterrows():
         ticker = row[ticker_col]
         date = row[date_col]
@@ -404,30 +899,14 @@ if __name__ == "__main__":
             skipped_count += 1
             continue
         
-        # 檢查 RSI/ADX 是否已經計算過
-        has_rsi_5 = not pd.isna(row[rsi_5_col]) and str(row[rsi_5_col]).strip() not in ['', '[]', 'nan']
-        has_rsi_30 = not pd.isna(row[rsi_30_col]) and str(row[rsi_30_col]).strip() not in ['', '[]', 'nan']
-        has_rsi_180 = not pd.isna(row[rsi_180_col]) and str(row[rsi_180_col]).strip() not in ['', '[]', 'nan']
-        has_adx_5 = not pd.isna(row[adx_5_col]) and str(row[adx_5_col]).strip() not in ['', '[]', 'nan']
-        has_adx_30 = not pd.isna(row[adx_30_col]) and str(row[adx_30_col]).strip() not in ['', '[]', 'nan']
-        has_adx_180 = not pd.isna(row[adx_180_col]) and str(row[adx_180_col]).strip() not in ['', '[]', 'nan']
-        
-        # 檢查是否需要計算 RSI/ADX
-        need_rsi_adx = not (has_rsi_5 and has_rsi_30 and has_rsi_180 and has_adx_5 and has_adx_30 and has_adx_180)
-        
-        # 檢查是否需要計算價格距離（檢查昨日收盤價欄位）
-        need_price_dist = False
-        yesterday_close_col = '*昨日收盤價' if '*昨日收盤價' in df.columns else '昨日收盤價'
-        if yesterday_close_col in df.columns:
-            has_yesterday_close = not pd.isna(row[yesterday_close_col]) and str(row[yesterday_close_col]).strip() not in ['', 'nan']
-            need_price_dist = not has_yesterday_close
-        
-        # 檢查是否需要計算盤中數據（檢查開盤價欄位）
-        need_intraday = False
-        open_price_col = '*開盤價格' if '*開盤價格' in df.columns else '開盤價格'
-        if open_price_col in df.columns:
-            has_open_price = not pd.isna(row[open_price_col]) and str(row[open_price_col]).strip() not in ['', 'nan']
-            need_intraday = not has_open_price
+        # 台灣時間欄位中含時間的值轉成對應的美國交易日
+        date = trading_calendar.sheet_session_date(date, date_col)
+        
+        # 檢查是否需要計算 RSI/ADX（序列欄位）、價格距離（昨日收盤價欄位）、盤中數據（開盤價欄位）
+        need_rsi_adx, need_price_dist, need_intraday = sheet_config.pending_items(
+            row.__getitem__, columns, sequence_columns, PRICE_DISTANCE_COLUMNS, INTRADAY_PRICE_COLUMNS)
+        if INTRADAY_ONLY:
+            need_rsi_adx = need_price_dist = False
         
         # 如果所有資料都已經有了，跳過
         if not need_rsi_adx and not need_price_dist and not need_intraday:
@@ -435,7 +914,166 @@ if __name__ == "__main__":
             skipped_count += 1
             continue
         
+        pending_rows.append((idx, ticker, date, need_rsi_adx, need_price_dist, need_intraday))
+    
+    return pending_rows, skipped_count
+
+def build_row_updates(result, intraday_data, need_rsi_adx, need_price_dist, need_intraday, col_indices,
+                      sidecar=False):
+    """
+    把一列的計算結果轉成要寫入的欄位值
+    
+    參數:
+        result: calculate_rsi_adx_sequences_batch 的結果（可為 None）
+        intraday_data: calculate_intraday_prices 的結果（可為 None）
+        need_rsi_adx, need_price_dist, need_intraday: 該列需要更新的項目
+        col_indices: {欄位名稱: 欄位索引}（只寫入工作表中存在的欄位）
+        sidecar: 序列是否存到側存檔（工作表只寫入最近一天的值）
+    
+    返回:
+        dict: {欄位名稱: 值}
+    """
+    row_updates = {}
+    
+    # 只在需要時更新 RSI/ADX
+    if need_rsi_adx and result and len(result["RSI_5天"]) > 0:
+        for col_name, result_key in SEQUENCE_COLUMNS.items():
+            row_updates[col_name] = result[result_key][-1] if sidecar else str(result[result_key])
+        # 其他指標：序列長度為 1 時寫入數值，否則寫入序列字串（不存到側存檔）
+        for col_name, (spec, length) in INDICATOR_COLUMNS.items():
+            values = result.get(indicator_key(spec, length))
+            if col_name in col_indices and values:
+                row_updates[col_name] = values[-1] if length == 1 else str(values)
+    
+    # 只在需要時更新價格距離
+    if need_price_dist and result:
+        for col_name, (result_key, sub_key) in PRICE_DISTANCE_COLUMNS.items():
+            if col_name in col_indices and result_key in result:
+                if sub_key:
+                    if result[result_key]:
+                        row_updates[col_name] = result[result_key][sub_key]
+                else:
+                    row_updates[col_name] = result[result_key]
+    
+    # 只在需要時更新盤中價格
+    if need_intraday and intraday_data:
+        for col_name, (result_key, sub_key) in INTRADAY_PRICE_COLUMNS.items():
+            if col_name in col_indices and sub_key in intraday_data:
+                if intraday_data[sub_key] is not None:
+                    row_updates[col_name] = intraday_data[sub_key]
+    
+    return row_updates
+
+def process_pending_rows(pending_rows, col_indices, updates, sidecar_results, journal=None, on_row_done=None):
+    """
+    下載、計算一批待處理列，並把每列的結果放進 updates
+    
+    參數:
+        pending_rows: find_pending_rows 的回傳列表
+        col_indices: {欄位名稱: 欄位索引}
+        updates: {Excel 列號: {欄位名稱: 值}}，完成的列會加入此 dict
+        sidecar_results: {(ticker, 日期): 結果 dict}，啟用序列側存檔時加入
+        journal: UpdateJournal（可選），每完成一列就記錄
+        on_row_done: 每完成一列（有更新）後呼叫 on_row_done(Excel 列號)（可選）
+    
+    返回:
+        tuple: (成功筆數, 失敗筆數)
+    """
+    processed_count = 0
+    failed_count = 0
+    
+    # 規劃下載：同一檔股票只下載一次，涵蓋所有列需要的區間
+    fetch_plan = plan_daily_fetches([
+        (ticker, date, required_sessions(need_rsi_adx, need_price_dist))
+        for _, ticker, date, need_rsi_adx, need_price_dist, _ in pending_rows if need_rsi_adx or need_price_dist
+    ])
+    if fetch_plan:
+        print(f"共需下載 {len(fetch_plan)} 檔股票的日 K 資料（{len(pending_rows)} 筆待處理）\n")
+    
+    # 並行下載日 K（無資料的股票記入負向快取，盤中資料也不再請求）
+    fetcher = ConcurrentFetcher(load_daily_bars, max_workers=FETCH_MAX_WORKERS,
+                                rate=None, max_retries=FETCH_MAX_RETRIES)
+    with instrumentation.span("下載"):
+        daily_bars = fetch_daily_bars(fetch_plan, fetcher)
+        
+        # 並行下載盤中 1 分鐘 K 線（只下載沒有封存且在 7 天內的日期）
+        intraday_requests = plan_intraday_fetches(pending_rows)
+        intraday_bars = fetcher.fetch_all(intraday_requests, fetch=load_intraday_bars, cache_empty=False)
+    if fetch_plan or intraday_requests:
+        print()
+    
+    # 每檔股票只計算一次指標，再一次取出所有列的序列
+    sequence_rows = {}
+    for idx, ticker, date, need_rsi_adx, need_price_dist, _ in pending_rows:
+        if need_rsi_adx or need_price_dist:
+            sequence_rows.setdefault(ticker, []).append((idx, date))
+    
+    # 待處理列數夠多時，依股票分片給多個行程平行計算（日 K 透過共用記憶體傳遞）
+    parallel_engine = None
+    if PARALLEL_WORKERS > 1 and sum(len(rows) for rows in sequence_rows.values()) >= PARALLEL_MIN_ROWS:
+        print(f"使用 {PARALLEL_WORKERS} 個行程平行計算 {len(sequence_rows)} 檔股票的指標\n")
+        parallel_engine = ParallelSequenceEngine(daily_bars, workers=PARALLEL_WORKERS, config=applied_config)
+    
+    try:
+        sequence_results = {}
+        with instrumentation.span("指標計算"):
+            if parallel_engine:
+                sequence_results = parallel_engine.run(sequence_rows, "sequences")
+            else:
+                for ticker, ticker_rows in sequence_rows.items():
+                    batch = calculate_rsi_adx_sequences_batch(ticker, [date for _, date in ticker_rows],
+                                                              daily_bars.get(ticker), price_distance=False)
+                    for (idx, _), result in zip(ticker_rows, batch):
+                        sequence_results[idx] = result
+        
+        with instrumentation.span("價格距離"):
+            if parallel_engine:
+                distances = parallel_engine.run(sequence_rows, "price_distance")
+            else:
+                distances = {}
+                for ticker, ticker_rows in sequence_rows.items():
+                    batch = calculate_price_distance_batch(ticker, [date for _, date in ticker_rows],
+                                                           daily_bars.get(ticker))
+                    distances.update((idx, distance) for (idx, _), distance in zip(ticker_rows, batch))
+            for idx, distance in distances.items():
+                if sequence_results.get(idx) and distance:
+                    sequence_results[idx].update(distance)
+    finally:
+        if parallel_engine:
+            parallel_engine.close()
+    
+    # 盤中數據：先取得每列當天的 1 分鐘 K 線，再一次批次計算所有列
+    intraday_frames = {}
+    for idx, ticker, date, need_rsi_adx, need_price_dist, need_intraday in pending_rows:
+        if not need_intraday or ticker in fetcher.negative_cache:
+            continue
+        if (need_rsi_adx or need_price_dist) and not sequence_results.get(idx):
+            continue
+        trade_date = pd.to_datetime(date)
+        try:
+            session_df = load_intraday_session(ticker, trade_date, intraday_bars.get((ticker, trade_date.normalize())))
+        except Exception as e:
+            print(f"  ✗ 獲取 {ticker} 在 {trade_date.date()} 的盤中數據時發生錯誤: {str(e)}")
+            session_df = None
+        if session_df is not None:
+            intraday_frames[idx] = session_df
+    
+    with instrumentation.span("盤中數據"):
+        intraday_results = calculate_intraday_prices_batch(intraday_frames)
+    if intraday_frames:
+        print()
+    
+    def row_fetch_seconds(ticker, date, need_intraday):
+        """分攤到一列的下載耗時：該股票日 K 下載時間平均分給所有列，加上當天盤中資料的下載時間"""
+        seconds = instrumentation.fetch_latency(ticker, "1d") / max(1, len(sequence_rows.get(ticker, ())))
+        if need_intraday:
+            seconds += instrumentation.fetch_latency(ticker, "1m", pd.to_datetime(date))
+        return seconds
+    
+    # 第二輪：逐行計算（完成的列寫入更新日誌）
+    for idx, ticker, date, need_rsi_adx, need_price_dist, need_intraday in pending_rows:
         print(f"處理第 {idx + 1} 筆: {ticker} (日期: {date})")
+        row_start_time = time.perf_counter()
         
         # 初始化結果
         result = None
@@ -443,140 +1081,453 @@ if __name__ == "__main__":
         
         # 只在需要時計算 RSI/ADX 和價格距離
         if need_rsi_adx or need_price_dist:
-            result = calculate_rsi_adx_sequences(ticker, date)
+            result = sequence_results.get(idx)
             if not result:
                 print(f"  ✗ 無法獲取股價資料")
                 failed_count += 1
+                instrumentation.record_row(idx + 2, ticker, date, time.perf_counter() - row_start_time, "failed",
+                                           row_fetch_seconds(ticker, date, need_intraday))
                 print()
                 continue
         
         # 只在需要時計算盤中數據
         if need_intraday:
-            intraday_data = calculate_intraday_prices(ticker, date)
+            if ticker in fetcher.negative_cache:
+                print(f"  ⚠ {ticker} 沒有資料，略過盤中數據")
+            else:
+                intraday_data = intraday_results.get(idx)
+                if intraday_data and intraday_data["數據分鐘數"] < 90:
+                    print(f"  ⚠ 數據不足 90 分鐘（只有 {intraday_data['數據分鐘數']} 分鐘）")
         
         # 儲存更新資料
         excel_row = idx + 2
-        updates[excel_row] = {}
-        
-        # 只在需要時更新 RSI/ADX
-        if need_rsi_adx and result and len(result["RSI_5天"]) > 0:
-            updates[excel_row].update({
-                rsi_5_col: str(result["RSI_5天"]),
-                rsi_30_col: str(result["RSI_30天"]),
-                rsi_180_col: str(result["RSI_180天"]),
-                adx_5_col: str(result["ADX_5天"]),
-                adx_30_col: str(result["ADX_30天"]),
-                adx_180_col: str(result["ADX_180天"])
-            })
-        
-        # 只在需要時更新價格距離
-        if need_price_dist and result:
-            for col_name, (result_key, sub_key) in price_dist_cols.items():
-                if col_name in col_indices and result_key in result:
-                    if sub_key:
-                        if result[result_key]:
-                            updates[excel_row][col_name] = result[result_key][sub_key]
-                    else:
-                        updates[excel_row][col_name] = result[result_key]
-        
-        # 只在需要時更新盤中價格
-        if need_intraday and intraday_data:
-            for col_name, (result_key, sub_key) in intraday_price_cols.items():
-                if col_name in col_indices and sub_key in intraday_data:
-                    if intraday_data[sub_key] is not None:
-                        updates[excel_row][col_name] = intraday_data[sub_key]
+        updates[excel_row] = build_row_updates(result, intraday_data, need_rsi_adx, need_price_dist, need_intraday,
+                                               col_indices, sidecar=bool(SEQUENCE_SIDECAR_FILE))
+        if SEQUENCE_SIDECAR_FILE and need_rsi_adx and result and len(result["RSI_5天"]) > 0:
+            sidecar_results[(ticker, date)] = result
+        
+        if journal and updates[excel_row]:
+            sequences = None
+            if SEQUENCE_SIDECAR_FILE and (ticker, date) in sidecar_results:
+                sequences = {key: result[key] for key in SEQUENCE_COLUMNS.values()}
+            journal.record(excel_row, ticker, date, updates[excel_row], sequences)
+        if on_row_done and updates[excel_row]:
+            on_row_done(excel_row)
         
         # 顯示處理結果
         if updates[excel_row]:  # 如果有任何更新
             print(f"  ✓ 完成")
-            
+        
+            if result:
+                print(f"    - 昨日日期: {result['昨日日期'].strftime('%Y-%m-%d')} (美國時間)")
+        
             if need_rsi_adx and result:
                 print(f"    - RSI/ADX 已更新 (實際資料: {result['實際資料天數']} 天)")
                 if len(result['RSI_5天']) >= 3:
                     print(f"    - RSI 5天前3筆: {result['RSI_5天'][:3]}")
-            
+        
             if need_price_dist and result:
                 if '價格距離_5日' in result and result['價格距離_5日']:
                     print(f"    - 昨日收盤價: ${result['昨日收盤價']}")
                     print(f"    - 5日距離: 高 {result['價格距離_5日']['距離最高價(%)']}%, 低 {result['價格距離_5日']['距離最低價(%)']}%")
-            
+        
             if need_intraday and intraday_data:
                 print(f"    - 盤中數據: 開盤 ${intraday_data['開盤價']}, 10分鐘低 ${intraday_data['10分鐘最低價']}")
-            
+        
             processed_count += 1
         else:
             print(f"  ⚠ 無可用資料")
             failed_count += 1
         
+        instrumentation.record_row(idx + 2, ticker, date, time.perf_counter() - row_start_time,
+                                   "processed" if updates[excel_row] else "failed",
+                                   row_fetch_seconds(ticker, date, need_intraday))
         print()
     
-    # 顯示統計資訊
+    return processed_count, failed_count
+
+
+def find_key_columns(columns):
+    """
+    找出股票代碼與開盤日期欄位（支援多種名稱），找不到時顯示錯誤並結束
+    
+    參數:
+        columns: 工作表的欄位名稱列表
+    
+    返回:
+        tuple: (股票代碼欄位, 日期欄位)
+    """
+    # 股票代碼欄位與日期欄位（支援多種名稱，可在設定檔修改）
+    ticker_col = TICKER_COLUMN
+    
+    # 嘗試找到日期欄位（支援多種名稱）
+    date_col = None
+    possible_date_cols = DATE_COLUMNS
+    for col in possible_date_cols:
+        if col in columns:
+            date_col = col
+            break
+    
+    # 檢查欄位是否存在
+    if ticker_col not in columns:
+        print(f"錯誤: 找不到 '{ticker_col}' 欄位")
+        print(f"現有欄位: {list(columns)}")
+        exit(1)
+    
+    if date_col is None:
+        print(f"錯誤: 找不到日期欄位")
+        print(f"支援的日期欄位名稱: {possible_date_cols}")
+        print(f"現有欄位: {list(columns)}")
+        exit(1)
+    
+    return ticker_col, date_col
+
+def print_summary(total_count, pending_count, processed_count, skipped_count, failed_count, resumed_count=0):
+    """顯示處理統計並記錄到執行記錄"""
     print(f"\n{'='*60}")
     print(f"處理完成統計:")
     print(f"  新計算: {processed_count} 筆")
     print(f"  已跳過: {skipped_count} 筆（已有資料或資料不完整）")
     print(f"  失敗: {failed_count} 筆")
-    print(f"  總計: {len(df)} 筆")
+    if resumed_count:
+        print(f"  從日誌恢復: {resumed_count} 筆")
+    print(f"  總計: {total_count} 筆")
     print(f"{'='*60}\n")
     
-    # 如果有需要更新的資料，使用 openpyxl 直接寫入
-    if updates:
+    instrumentation.count("rows.total", total_count)
+    instrumentation.count("rows.pending", pending_count)
+    instrumentation.count("rows.processed", processed_count)
+    instrumentation.count("rows.skipped", skipped_count)
+    instrumentation.count("rows.failed", failed_count)
+    instrumentation.count("rows.resumed", resumed_count)
+
+def process_workbook(input_file, sheet_name):
+    """
+    一般模式：以 pandas 讀取整張工作表，計算後以 openpyxl 寫回
+    
+    參數:
+        input_file: Excel 檔案路徑
+        sheet_name: 工作表名稱
+    """
+    # 讀取 Excel
+    print(f"正在讀取 {input_file} 的 '{sheet_name}' 工作表...")
+    with instrumentation.span("讀取 Excel"):
+        df = pd.read_excel(input_file, sheet_name=sheet_name)
+    
+    print(f"Excel 欄位: {df.columns.tolist()}")
+    print(f"共有 {len(df)} 筆資料\n")
+    
+    ticker_col, date_col = find_key_columns(df.columns.tolist())
+    
+    print(f"使用欄位: 股票代碼='{ticker_col}', 日期='{date_col}'\n")
+    
+    # 找到欄位索引（RSI/ADX 序列、價格距離、盤中價格）
+    col_indices = find_column_indices(df)
+    
+    # 儲存需要更新的資料
+    updates = {}
+    sidecar_results = {}
+    
+    # 第一輪：找出每列需要計算的項目
+    pending_rows, skipped_count = find_pending_rows(df, ticker_col, date_col)
+    
+    # 更新日誌：上次沒有完成時，重播已完成的列，只計算剩下的列
+    journal = None
+    resumed_count = 0
+    if USE_UPDATE_JOURNAL:
+        journal_file = update_journal.journal_path(input_file)
+        if os.path.exists(journal_file) and RESUME_FROM_JOURNAL:
+            entries, mismatched = update_journal.replay_journal(journal_file, df, ticker_col, date_col)
+            for excel_row, entry in entries.items():
+                updates[excel_row] = entry["updates"]
+                if SEQUENCE_SIDECAR_FILE and entry.get("sequences"):
+                    sidecar_results[(entry["ticker"], entry["date"])] = entry["sequences"]
+            resumed_count = len(entries)
+            pending_rows = [row for row in pending_rows if row[0] + 2 not in entries]
+            print(f"從更新日誌繼續：{resumed_count} 筆已完成，剩下 {len(pending_rows)} 筆待處理")
+            if mismatched:
+                print(f"  ⚠ 日誌中有 {mismatched} 筆與目前的工作表不符，將重新計算")
+            print()
+        elif os.path.exists(journal_file):
+            os.remove(journal_file)
+        journal = update_journal.UpdateJournal(journal_file)
+    
+    # 還沒寫回工作簿的列（定期寫回時使用）
+    unsaved_rows = set(updates)
+    ticker_col_idx = df.columns.get_loc(ticker_col) + 1
+    
+    def save_checkpoint():
+        """把還沒寫回的列寫回工作簿"""
+        with instrumentation.span("寫回 Excel"):
+            write_updates_to_workbook(input_file, sheet_name, {row: updates[row] for row in sorted(unsaved_rows)},
+                                      col_indices, ticker_col_idx=ticker_col_idx)
+        unsaved_rows.clear()
+    
+    def row_done(excel_row):
+        """完成一列：累積到一定筆數時定期寫回工作簿"""
+        unsaved_rows.add(excel_row)
+        if CHECKPOINT_EVERY_ROWS and len(unsaved_rows) >= CHECKPOINT_EVERY_ROWS:
+            print(f"  正在寫回 {len(unsaved_rows)} 筆結果（定期存檔）...")
+            save_checkpoint()
+    
+    try:
+        processed_count, failed_count = process_pending_rows(pending_rows, col_indices, updates, sidecar_results,
+                                                             journal=journal, on_row_done=row_done)
+    except KeyboardInterrupt:
+        print(f"\n⚠ 已中斷：已完成的列已記錄在更新日誌，再次執行即可繼續")
+        raise
+    finally:
+        if journal:
+            journal.close()
+    
+    print_summary(len(df), len(pending_rows), processed_count, skipped_count, failed_count, resumed_count)
+    
+    # 序列側存檔
+    if sidecar_results:
+        with instrumentation.span("序列側存檔"):
+            total = save_sequences(SEQUENCE_SIDECAR_FILE, sidecar_results)
+        print(f"✓ 已將 {len(sidecar_results)} 筆 RSI/ADX 序列寫入 {SEQUENCE_SIDECAR_FILE}（共 {total} 筆）\n")
+    
+    # 如果有需要更新的資料，使用 openpyxl 直接寫入（定期存檔已寫回的列不再重寫）
+    if unsaved_rows:
         print(f"正在更新 {input_file} 的 '{sheet_name}' 工作表（保留原有格式）...")
+        save_checkpoint()
+        print("✓ 完成！格式已保留。")
+    elif updates:
+        print("✓ 所有結果都已在定期存檔時寫回。")
+    else:
+        print("沒有需要更新的資料。")
+    
+    # 工作簿已儲存，不再需要日誌
+    if journal:
+        journal.discard()
+
+def scan_pending_rows_streaming(input_file, sheet_name):
+    """
+    以唯讀模式逐區塊掃描工作表，找出待處理的列（不把整張表讀進記憶體）
+    
+    參數:
+        input_file: Excel 檔案路徑
+        sheet_name: 工作表名稱
+    
+    返回:
+        tuple: (標題列, find_pending_rows 格式的待處理列, 跳過的筆數, 總筆數,
+                {欄位索引: 原本已有資料的列號}（寫回時決定參考格式用）)，工作表沒有資料時標題列為 None
+    """
+    header = None
+    pending_rows = []
+    skipped_count = 0
+    total_count = 0
+    filled_rows = {}
+    for header, block_start, block in iter_sheet_blocks(input_file, sheet_name, STREAM_CHUNK_ROWS):
+        if not total_count:
+            ticker_col, date_col = find_key_columns(header)
+            col_indices = find_column_indices(pd.DataFrame(columns=header))
+        total_count += len(block)
         
-        from openpyxl import load_workbook
-        from copy import copy
-        
-        wb = load_workbook(input_file)
-        ws = wb[sheet_name]
-        
-        # 更新儲存格
-        for excel_row, data in updates.items():
-            for col_name, value in data.items():
-                if col_name in col_indices:
-                    col_idx = col_indices[col_name]
-                    cell = ws.cell(row=excel_row, column=col_idx)
-                    
-                    # 策略：尋找同一欄位中已有手動輸入資料的儲存格作為格式參考
-                    # 如果找不到，則從同一行的「公司代碼」欄位複製格式
-                    reference_cell = None
-                    
-                    # 先嘗試在同一欄位中找到已有資料的儲存格（往上找最多 20 行）
-                    for ref_row in range(max(2, excel_row - 20), excel_row):
-                        ref_cell = ws.cell(row=ref_row, column=col_idx)
-                        if ref_cell.value is not None and str(ref_cell.value).strip() not in ['', 'nan']:
-                            reference_cell = ref_cell
-                            break
-                    
-                    # 如果找不到，使用同一行的「公司代碼」欄位
-                    if reference_cell is None:
-                        ticker_col_idx = df.columns.get_loc('公司代碼') + 1
-                        reference_cell = ws.cell(row=excel_row, column=ticker_col_idx)
-                    
-                    # 使用 copy() 完整複製參考格式（包括顏色、粗體等所有屬性）
-                    if reference_cell.font:
-                        cell.font = copy(reference_cell.font)
-                    if reference_cell.alignment:
-                        cell.alignment = copy(reference_cell.alignment)
-                    if reference_cell.border:
-                        cell.border = copy(reference_cell.border)
-                    if reference_cell.fill:
-                        cell.fill = copy(reference_cell.fill)
-                    if reference_cell.number_format:
-                        cell.number_format = reference_cell.number_format
-                    
-                    # 最後更新值（在設定格式之後）
-                    cell.value = value
-        
-        # 儲存工作簿
-        wb.save(input_file)
-        wb.close()
+        # 每個區塊轉成 DataFrame（索引與 pd.read_excel 相同：第 0 筆為 Excel 第 2 列），沿用相同的判斷
+        block_df = pd.DataFrame(block, columns=header, index=range(block_start - 2, block_start - 2 + len(block)))
+        block_rows, block_skipped = find_pending_rows(block_df, ticker_col, date_col)
+        pending_rows.extend(block_rows)
+        skipped_count += block_skipped
         
-        print("✓ 完成！格式已保留。")
+        for col_idx in set(col_indices.values()):
+            rows = filled_rows.setdefault(col_idx, [])
+            rows.extend(block_start + i for i, values in enumerate(block) if has_cell_value(values[col_idx - 1]))
+    return header, pending_rows, skipped_count, total_count, filled_rows
+
+def process_workbook_streaming(input_file, sheet_name):
+    """
+    串流模式：唯讀掃描工作表、分批計算、最後只改寫有更新的列
+    
+    每批最多 STREAM_CHUNK_ROWS 列，結果寫入更新日誌後就釋放；
+    寫回時依列號順序從日誌串流讀取，記憶體不隨工作表列數增加。
+    序列側存檔同樣在所有批次完成後從日誌讀出，只合併寫入一次。
+    
+    參數:
+        input_file: Excel 檔案路徑
+        sheet_name: 工作表名稱
+    """
+    print(f"正在以串流模式掃描 {input_file} 的 '{sheet_name}' 工作表...")
+    with instrumentation.span("讀取 Excel"):
+        header, pending_rows, skipped_count, total_count, filled_rows = scan_pending_rows_streaming(input_file,
+                                                                                                   sheet_name)
+    if header is None:
+        print("工作表沒有資料。")
+        return
+    
+    ticker_col, date_col = find_key_columns(header)
+    col_indices = find_column_indices(pd.DataFrame(columns=header))
+    print(f"共有 {total_count} 筆資料，{len(pending_rows)} 筆待處理")
+    print(f"使用欄位: 股票代碼='{ticker_col}', 日期='{date_col}'\n")
+    
+    # 更新日誌是串流模式的暫存區：上次沒有完成時，日誌中已完成的列不再計算
+    journal_file = update_journal.journal_path(input_file)
+    row_keys = {idx + 2: (ticker, date) for idx, ticker, date, _, _, _ in pending_rows}
+    pending_count = len(pending_rows)
+    resumed_count = 0
+    if os.path.exists(journal_file) and RESUME_FROM_JOURNAL:
+        offsets, mismatched = update_journal.index_journal(journal_file, row_keys)
+        resumed_count = len(offsets)
+        pending_rows = [row for row in pending_rows if row[0] + 2 not in offsets]
+        print(f"從更新日誌繼續：{resumed_count} 筆已完成，剩下 {len(pending_rows)} 筆待處理")
+        if mismatched:
+            print(f"  ⚠ 日誌中有 {mismatched} 筆與目前的工作表不符，將重新計算")
+        print()
+    elif os.path.exists(journal_file):
+        os.remove(journal_file)
+    journal = update_journal.UpdateJournal(journal_file)
+    
+    # 依股票排序後分批，同一檔股票的列盡量在同一批；每批的日 K 與結果處理完就釋放
+    pending_rows.sort(key=lambda row: (str(row[1]), row[0]))
+    processed_count = 0
+    failed_count = 0
+    try:
+        for start in range(0, len(pending_rows), STREAM_CHUNK_ROWS):
+            chunk = pending_rows[start:start + STREAM_CHUNK_ROWS]
+            print(f"--- 第 {start // STREAM_CHUNK_ROWS + 1} 批（{len(chunk)} 筆）---\n")
+            updates = {}
+            sidecar_results = {}
+            processed, failed = process_pending_rows(chunk, col_indices, updates, sidecar_results, journal=journal)
+            processed_count += processed
+            failed_count += failed
+            del updates, sidecar_results
+    except KeyboardInterrupt:
+        print(f"\n⚠ 已中斷：已完成的列已記錄在更新日誌，再次執行即可繼續")
+        raise
+    finally:
+        journal.close()
+    
+    print_summary(total_count, pending_count, processed_count, skipped_count, failed_count, resumed_count)
+    
+    offsets, _ = update_journal.index_journal(journal_file, row_keys)
+    
+    # 序列側存檔：所有批次（含上次中斷前完成的列）的序列都在日誌中，最後從日誌串流讀出、只合併寫入一次
+    if SEQUENCE_SIDECAR_FILE and offsets:
+        sequence_count = 0
+        
+        def journal_sequences():
+            nonlocal sequence_count
+            for entry in update_journal.iter_journal_entries(journal_file, offsets):
+                if entry.get("sequences"):
+                    sequence_count += 1
+                    yield (entry["ticker"], entry["date"]), entry["sequences"]
+        
+        with instrumentation.span("序列側存檔"):
+            total = save_sequences(SEQUENCE_SIDECAR_FILE, journal_sequences())
+        if sequence_count:
+            print(f"✓ 已將 {sequence_count} 筆 RSI/ADX 序列寫入 {SEQUENCE_SIDECAR_FILE}（共 {total} 筆）\n")
+    
+    # 依列號順序從日誌讀出更新，串流改寫工作表
+    if offsets:
+        print(f"正在更新 {input_file} 的 '{sheet_name}' 工作表（串流改寫 {len(offsets)} 列，保留原有格式）...")
+        entries = update_journal.iter_journal_entries(journal_file, offsets)
+        with instrumentation.span("寫回 Excel"):
+            cells = patch_sheet(input_file, sheet_name, ((entry["row"], entry["updates"]) for entry in entries),
+                                col_indices, ticker_col_idx=header.index(ticker_col) + 1, filled_rows=filled_rows)
+        print(f"✓ 完成！寫入 {cells} 個儲存格，格式已保留。")
     else:
         print("沒有需要更新的資料。")
+    journal.discard()
+
+def warm_cache(input_file, sheet_name):
+    """
+    預先下載待處理列需要的資料（不計算、不寫回）
+    
+    日 K 存到本地 K 線快取，盤中 1 分鐘 K 線存到封存；之後執行計算時只需要讀取本地資料。
     
+    參數:
+        input_file: Excel 檔案路徑
+        sheet_name: 工作表名稱
+    """
+    if not market_data_provider.is_remote or not (USE_BAR_CACHE or USE_INTRADAY_ARCHIVE):
+        print(f"資料來源 {market_data_provider.name} 不需要預先下載（或未啟用快取與封存）")
+        return
+    
+    print(f"正在掃描 {input_file} 的 '{sheet_name}' 工作表...")
+    header, pending_rows, _, _, _ = scan_pending_rows_streaming(input_file, sheet_name)
+    if not pending_rows:
+        print("沒有待處理的資料。")
+        return
+    
+    fetch_plan = plan_daily_fetches([
+        (ticker, date, required_sessions(need_rsi_adx, need_price_dist))
+        for _, ticker, date, need_rsi_adx, need_price_dist, _ in pending_rows if need_rsi_adx or need_price_dist
+    ]) if USE_BAR_CACHE else {}
+    intraday_requests = plan_intraday_fetches(pending_rows)
+    print(f"共需下載 {len(fetch_plan)} 檔股票的日 K、{len(intraday_requests)} 天的盤中數據"
+          f"（{len(pending_rows)} 筆待處理）\n")
+    
+    fetcher = ConcurrentFetcher(load_daily_bars, max_workers=FETCH_MAX_WORKERS,
+                                rate=None, max_retries=FETCH_MAX_RETRIES)
+    with instrumentation.span("下載"):
+        daily_bars = fetch_daily_bars(fetch_plan, fetcher)
+        intraday_bars = fetcher.fetch_all(intraday_requests, fetch=load_intraday_bars, cache_empty=False)
+    
+    archived = 0
+    if USE_INTRADAY_ARCHIVE:
+        today = pd.Timestamp.now().normalize()
+        for (ticker, trade_date), df in intraday_bars.items():
+            # 只封存已收盤的交易日
+            if df is not None and not df.empty and trade_date < today:
+                archived += intraday_archive.archive_bars(ticker, df)
+    
+    cached = sum(1 for df in daily_bars.values() if df is not None and not df.empty)
+    print(f"\n✓ 預先下載完成：{cached} 檔股票的日 K 已存到快取，封存 {archived} 根盤中 K 棒")
+    if fetcher.negative_cache:
+        print(f"  ⚠ {len(fetcher.negative_cache)} 檔股票沒有資料: {', '.join(sorted(fetcher.negative_cache))}")
+
+def main(input_file=None, sheet_name=None, command="compute"):
+    """
+    執行主程式
+    
+    參數:
+        input_file: Excel 檔案路徑，預設為 INPUT_FILE
+        sheet_name: 工作表名稱，預設為 SHEET_NAME
+        command: "compute"（計算並寫回）或 "warm-cache"（只預先下載資料）
+    """
+    input_file = input_file or INPUT_FILE
+    sheet_name = sheet_name or SHEET_NAME
+    
+    print("="*60)
+    print("美股技術指標計算系統 - RSI & ADX")
+    print("="*60)
+    print("\n計算指標：")
+    if not INTRADAY_ONLY:
+        print("  ✓ RSI (相對強弱指標) - 5天、30天和6個月序列")
+        print("  ✓ ADX (平均趨向指標) - 5天、30天和6個月序列")
+        print("  ✓ 價格距離 - 昨日收盤價距離過去高低點的百分比")
+    print("  ✓ 盤中價格 - 開盤價、10分鐘最低價、1.5小時最高價等")
+    print("    ⚠ 盤中數據僅限最近 7 天（yfinance 免費版限制）")
+    print(f"\n資料來源：{market_data_provider.description}")
+    print("="*60 + "\n")
+    
+    if WRITE_RUN_REPORT:
+        instrumentation.start_run(profile=PROFILE_RUN, trace_memory=TRACE_MEMORY)
+    
+    if command == "warm-cache":
+        warm_cache(input_file, sheet_name)
+    elif STREAM_WORKBOOK:
+        process_workbook_streaming(input_file, sheet_name)
+    else:
+        process_workbook(input_file, sheet_name)
+    
+    # 執行記錄
+    report_path, alerts = instrumentation.finish_run()
+    if report_path:
+        print(f"\n執行記錄已存到 {report_path}")
+        for alert in alerts:
+            print(f"  ⚠ 執行變慢: {alert}")
+    
+    if command == "warm-cache":
+        return
     print("\n提示：")
     print("  - 序列排序為從最遠到最近 [第N天前, ..., 第1天前]")
     print("  - RSI > 70: 超買，RSI < 30: 超賣")
     print("  - ADX > 25: 強趨勢，ADX < 20: 弱趨勢")
     print("  - 6個月序列約包含 120 個交易日的資料")
+
+if __name__ == "__main__":
+    # 直接執行時等同於 `python cli.py compute`（工作目錄有 indicators.json 時套用其中的設定）
+    apply_config(sheet_config.load_config())
+    main()
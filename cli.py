@@ -0,0 +1,246 @@
+"""
+命令列入口（子命令）
+
+  python cli.py compute                 # 計算所有缺少的指標並寫回工作簿（與 python calculate_indicators.py 相同）
+  python cli.py intraday                # 只計算盤中價格（開盤價、10分鐘最低價...）
+  python cli.py missing [--list]        # 只檢查哪些列還缺資料，不下載也不寫入
+  python cli.py warm-cache              # 預先下載待處理列需要的日 K 與盤中 K 線到本地快取
+  python cli.py serve [--preload]       # 常駐的盤前查詢服務（本機 HTTP，見 indicator_service.py）
+  python cli.py screen universe.txt --rule "RSI < 30" --rule "ADX > 25"   # 全市場篩選（見 screener.py）
+  python cli.py backtest --param rsi_max=30,40 --param target_pct=1,2,3    # 當沖規則回測（見 backtest.py）
+
+共用選項：--config 設定檔（預設為工作目錄的 indicators.json）、--file 工作簿、--sheet 工作表。
+設定檔可以修改欄位名稱、價格距離視窗與資料來源，格式見 sheet_config.py。
+
+這個模組只載入標準函式庫：pandas、numpy、openpyxl 與 yfinance 在子命令需要時才載入，
+missing 直接以 zipfile 讀取工作表，不需要載入任何大型套件。
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+import sheet_config
+
+# Excel 日期序號的起點
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+def build_parser():
+    """建立命令列參數解析器"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--config", help=f"設定檔（預設為 {sheet_config.DEFAULT_CONFIG_FILE}，不存在時使用預設值）")
+    common.add_argument("--file", help=f"工作簿路徑（預設為 {sheet_config.INPUT_FILE}）")
+    common.add_argument("--sheet", help=f"工作表名稱（預設為 {sheet_config.SHEET_NAME}）")
+
+    fetch = argparse.ArgumentParser(add_help=False)
+    fetch.add_argument("--provider", help="行情資料來源：yfinance、replay:<資料夾> 或 synthetic")
+
+    run = argparse.ArgumentParser(add_help=False)
+    run.add_argument("--stream", action="store_true", help="串流模式（大型工作表，記憶體不隨列數增加）")
+    run.add_argument("--no-resume", action="store_true", help="捨棄上次未完成的更新日誌，全部重新計算")
+
+    parser = argparse.ArgumentParser(prog="cli.py", description="美股技術指標計算系統")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compute = commands.add_parser("compute", parents=[common, fetch, run], help="計算所有缺少的指標並寫回工作簿")
+    compute.add_argument("--workers", type=int, help="平行計算的行程數（0 或 1 表示單一行程）")
+    commands.add_parser("intraday", parents=[common, fetch, run], help="只計算盤中價格")
+    missing = commands.add_parser("missing", parents=[common], help="檢查哪些列還缺資料（不下載、不寫入）")
+    missing.add_argument("--list", action="store_true", help="列出每一筆待處理的列")
+    commands.add_parser("warm-cache", parents=[common, fetch], help="預先下載待處理列需要的資料到本地快取")
+    serve = commands.add_parser("serve", parents=[common, fetch], help="啟動盤前查詢服務（只接受本機連線）")
+    serve.add_argument("--port", type=int, help="連接埠（預設為 8765 或環境變數 INDICATOR_SERVICE_PORT）")
+    serve.add_argument("--preload", action="store_true", help="啟動時先載入工作表中所有股票的日 K 與指標")
+    screen = commands.add_parser("screen", parents=[common, fetch], help="篩選股票清單（RSI/ADX/價格距離）")
+    screen.add_argument("universe", nargs="?", help="股票清單檔（每行一個代碼），預設為工作表中所有股票")
+    screen.add_argument("--rule", action="append", default=[], help="篩選規則，例如 \"RSI < 30\"（可重複，全部成立才列出）")
+    screen.add_argument("--sort", help="排序欄位（預設為 RSI，由小到大）")
+    screen.add_argument("--desc", action="store_true", help="由大到小排序")
+    screen.add_argument("--top", type=int, help="只顯示前幾名")
+    screen.add_argument("--date", help="開盤日期（預設為今天，只使用這一天之前的日 K）")
+    screen.add_argument("--offline", action="store_true", help="只使用本地 K 線快取，不連網")
+    screen.add_argument("--output", help="另存結果的 CSV 檔")
+    backtest = commands.add_parser("backtest", parents=[common, fetch], help="以工作表的特徵回測當沖進出場規則")
+    backtest.add_argument("--param", action="append", default=[],
+                          help="參數網格，例如 target_pct=1,2,3（可重複，評估所有組合）")
+    backtest.add_argument("--sort", help="排序欄位（預設為 總報酬(%%)，由大到小）")
+    backtest.add_argument("--top", type=int, help="只顯示前幾名")
+    backtest.add_argument("--workers", type=int, help="平行計算的行程數（0 或 1 表示單一行程）")
+    backtest.add_argument("--output", help="另存結果的 CSV 檔")
+    return parser
+
+def _format_date(value):
+    """顯示日期（Excel 日期序號轉成 YYYY-MM-DD）"""
+    if isinstance(value, float):
+        return (EXCEL_EPOCH + timedelta(days=value)).strftime("%Y-%m-%d")
+    return str(value)
+
+def check_missing(input_file, sheet_name, config, show_rows=False):
+    """
+    檢查工作表中哪些列還缺資料（只用標準函式庫讀取，不載入 pandas/openpyxl）
+
+    參數:
+        input_file: Excel 檔案路徑
+        sheet_name: 工作表名稱
+        config: 設定（sheet_config.load_config 的結果）
+        show_rows: 是否列出每一筆待處理的列
+
+    返回:
+        int: 結束代碼（0 為正常，1 為找不到必要欄位）
+    """
+    from streaming_workbook import iter_sheet_values
+
+    ticker_column = config.get("ticker_column", sheet_config.TICKER_COLUMN)
+    date_columns = config.get("date_columns", sheet_config.DATE_COLUMNS)
+    sequence_columns = config.get("sequence_columns", sheet_config.SEQUENCE_COLUMNS)
+    indicator_columns = config.get("indicator_columns", sheet_config.INDICATOR_COLUMNS)
+    price_distance_columns = sheet_config.window_columns(
+        config.get("price_distance_windows", sheet_config.PRICE_DISTANCE_WINDOWS),
+        config.get("price_distance_columns", sheet_config.PRICE_DISTANCE_COLUMNS))
+    intraday_price_columns = config.get("intraday_price_columns", sheet_config.INTRADAY_PRICE_COLUMNS)
+
+    rows = iter_sheet_values(input_file, sheet_name)
+    _, header_values = next(rows, (None, {}))
+    header = {str(name): col_idx for col_idx, name in header_values.items()}
+    date_column = next((col for col in date_columns if col in header), None)
+    if ticker_column not in header or date_column is None:
+        print(f"錯誤: 找不到股票代碼欄位 '{ticker_column}' 或日期欄位 {date_columns}")
+        print(f"現有欄位: {list(header)}")
+        return 1
+    # 工作表中有的其他指標欄位與 RSI/ADX 序列一起檢查
+    sequence_columns = {**sequence_columns, **{col: spec for col, spec in indicator_columns.items() if col in header}}
+
+    total_count = 0
+    incomplete_count = 0
+    item_counts = {"RSI/ADX": 0, "價格距離": 0, "盤中數據": 0}
+    pending_tickers = {}
+    for excel_row, values in rows:
+        if not values:
+            continue
+        total_count += 1
+        ticker = values.get(header[ticker_column])
+        date = values.get(header[date_column])
+        if not sheet_config.has_value(ticker) or not sheet_config.has_value(date):
+            incomplete_count += 1
+            continue
+
+        needs = sheet_config.pending_items(lambda col: values.get(header.get(col)), header, sequence_columns,
+                                           price_distance_columns, intraday_price_columns)
+        if not any(needs):
+            continue
+        names = [name for name, need in zip(item_counts, needs) if need]
+        for name in names:
+            item_counts[name] += 1
+        pending_tickers[ticker] = pending_tickers.get(ticker, 0) + 1
+        if show_rows:
+            print(f"  第 {excel_row} 列: {ticker} ({_format_date(date)}) - 缺少 {'、'.join(names)}")
+
+    pending_count = sum(pending_tickers.values())
+    if show_rows and pending_count:
+        print()
+    print(f"{input_file} 的 '{sheet_name}' 工作表：共 {total_count} 筆")
+    print(f"  待處理: {pending_count} 筆（{len(pending_tickers)} 檔股票）")
+    for name, count in item_counts.items():
+        print(f"    - 缺少{name}: {count} 筆")
+    print(f"  資料完整: {total_count - pending_count - incomplete_count} 筆")
+    if incomplete_count:
+        print(f"  資料不完整（沒有股票代碼或日期）: {incomplete_count} 筆")
+    if pending_tickers:
+        busiest = sorted(pending_tickers.items(), key=lambda item: item[1], reverse=True)[:10]
+        print(f"  待處理最多的股票: {', '.join(f'{ticker} ({count})' for ticker, count in busiest)}")
+    return 0
+
+def serve(input_file, sheet_name, config, port=None, preload=False):
+    """
+    啟動盤前查詢服務
+
+    參數:
+        input_file: Excel 檔案路徑（預先載入時讀取股票代碼）
+        sheet_name: 工作表名稱
+        config: 設定（sheet_config.load_config 的結果）
+        port: 連接埠，None 表示使用 indicator_service.SERVICE_PORT
+        preload: 是否先載入工作表中所有股票
+
+    返回:
+        int: 結束代碼
+    """
+    import indicator_service
+    from intraday_archive import workbook_tickers
+
+    service = indicator_service.IndicatorService()
+    if preload:
+        tickers = workbook_tickers(input_file, sheet_name, config.get("ticker_column", sheet_config.TICKER_COLUMN))
+        print(f"正在預先載入 {len(tickers)} 檔股票...")
+        print(f"✓ 已載入 {service.preload(tickers)} 檔股票\n")
+    indicator_service.serve(service, port=port or indicator_service.SERVICE_PORT)
+    return 0
+
+def main(argv=None):
+    """
+    命令列入口
+
+    返回:
+        int: 結束代碼
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        config = sheet_config.load_config(args.config)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # 命令列參數優先於設定檔
+    for key, value in (("file", args.file), ("sheet", args.sheet), ("provider", getattr(args, "provider", None)),
+                       ("parallel_workers", getattr(args, "workers", None))):
+        if value is not None:
+            config[key] = value
+    if getattr(args, "stream", False):
+        config["stream_workbook"] = True
+
+    input_file = config.get("file", sheet_config.INPUT_FILE)
+    sheet_name = config.get("sheet", sheet_config.SHEET_NAME)
+    if args.command == "missing":
+        return check_missing(input_file, sheet_name, config, show_rows=args.list)
+
+    # 需要計算或下載時才載入主程式（pandas、numpy、資料來源）
+    import calculate_indicators
+
+    try:
+        calculate_indicators.apply_config(config)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.command == "serve":
+        return serve(input_file, sheet_name, config, port=args.port, preload=args.preload)
+    if args.command == "screen":
+        import screener
+        from intraday_archive import load_watchlist, workbook_tickers
+
+        if args.universe:
+            tickers = load_watchlist(args.universe)
+        else:
+            tickers = workbook_tickers(input_file, sheet_name, config.get("ticker_column", sheet_config.TICKER_COLUMN))
+        try:
+            sort = args.sort or screener.DEFAULT_SORT
+            screener.run_screen(tickers, args.date, rules=args.rule, sort=f"-{sort}" if args.desc else sort,
+                                top=args.top, offline=args.offline, output=args.output)
+        except ValueError as e:
+            parser.error(str(e))
+        return 0
+    if args.command == "backtest":
+        import backtest
+
+        try:
+            grid = dict(backtest.parse_param(text) for text in args.param)
+            backtest.run_backtest(input_file, sheet_name, grid, sort=args.sort or backtest.DEFAULT_SORT,
+                                  top=args.top, workers=args.workers, output=args.output)
+        except ValueError as e:
+            parser.error(str(e))
+        return 0
+    if getattr(args, "no_resume", False):
+        calculate_indicators.RESUME_FROM_JOURNAL = False
+    if args.command == "intraday":
+        calculate_indicators.INTRADAY_ONLY = True
+    calculate_indicators.main(input_file, sheet_name,
+                              command="warm-cache" if args.command == "warm-cache" else "compute")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+把計算結果寫回 Excel（保留原有格式）
+
+格式規則與原本相同：
+  - 參考同一欄位往上最多 20 列內、第一個已有資料的儲存格
+  - 找不到時參考同一列的「公司代碼」儲存格
+  - 複製字型、對齊、框線、填滿與數值格式
+
+為了讓數萬個儲存格也能快速寫入：
+  - 每個欄位只掃描一次，建立「有資料的列」排序索引，之後用 bisect 找參考列
+  - 直接沿用工作簿共用的樣式編號（fontId、fillId...），不複製樣式物件
+  - 所有更新依 (列, 欄) 排序後一次寫完
+"""
+import os
+import time
+from bisect import bisect_left
+from copy import copy
+
+from openpyxl import load_workbook
+from openpyxl.styles.cell_style import StyleArray
+
+# 往上尋找參考格式的最大列數
+STYLE_LOOKBACK_ROWS = 20
+
+# 視為空白的儲存格內容
+EMPTY_VALUES = ['', 'nan']
+
+# 從參考儲存格沿用的樣式欄位（對應字型、對齊、框線、填滿、數值格式）
+STYLE_FIELDS = ('fontId', 'alignmentId', 'borderId', 'fillId', 'numFmtId')
+
+def _has_value(value):
+    return value is not None and str(value).strip() not in EMPTY_VALUES
+
+def build_style_index(ws, col_idx, first_row=2):
+    """
+    掃描一個欄位，回傳已有資料的列號（已排序）
+
+    參數:
+        ws: 工作表
+        col_idx: 欄位索引（從 1 開始）
+        first_row: 資料起始列
+
+    返回:
+        list: 已有資料的列號
+    """
+    rows = []
+    for offset, (value,) in enumerate(ws.iter_rows(min_row=first_row, min_col=col_idx, max_col=col_idx,
+                                                   values_only=True)):
+        if _has_value(value):
+            rows.append(first_row + offset)
+    return rows
+
+def _apply_style(cell, reference_cell):
+    """沿用參考儲存格的共用樣式編號（不建立新的樣式物件）"""
+    style = copy(cell._style) if cell._style is not None else StyleArray()
+    reference_style = reference_cell._style if reference_cell._style is not None else StyleArray()
+    for field in STYLE_FIELDS:
+        setattr(style, field, getattr(reference_style, field))
+    cell._style = style
+
+def apply_updates(ws, updates, col_indices, ticker_col_idx):
+    """
+    把更新套用到工作表（依列、欄排序後一次寫完）
+
+    參數:
+        ws: 工作表
+        updates: {excel_row: {欄位名稱: 值}}
+        col_indices: {欄位名稱: 欄位索引}
+        ticker_col_idx: 「公司代碼」欄位索引（找不到參考格式時使用）
+
+    返回:
+        int: 寫入的儲存格數
+    """
+    cells = sorted(
+        (excel_row, col_indices[col_name], value)
+        for excel_row, data in updates.items()
+        for col_name, value in data.items()
+        if col_name in col_indices
+    )
+
+    # 每個欄位只掃描一次
+    style_index = {col_idx: build_style_index(ws, col_idx) for col_idx in {c for _, c, _ in cells}}
+
+    for excel_row, col_idx, value in cells:
+        cell = ws.cell(row=excel_row, column=col_idx)
+
+        # 往上最多 20 列內第一個已有資料的儲存格，找不到時用同一列的「公司代碼」
+        filled_rows = style_index[col_idx]
+        pos = bisect_left(filled_rows, max(2, excel_row - STYLE_LOOKBACK_ROWS))
+        if pos < len(filled_rows) and filled_rows[pos] < excel_row:
+            reference_cell = ws.cell(row=filled_rows[pos], column=col_idx)
+        else:
+            reference_cell = ws.cell(row=excel_row, column=ticker_col_idx)
+
+        _apply_style(cell, reference_cell)
+
+        # 最後更新值（在設定格式之後）
+        cell.value = value
+
+        # 剛寫入的儲存格也可以當作後面列的參考格式
+        if _has_value(value):
+            pos = bisect_left(filled_rows, excel_row)
+            if pos == len(filled_rows) or filled_rows[pos] != excel_row:
+                filled_rows.insert(pos, excel_row)
+
+    return len(cells)
+
+def write_updates_to_workbook(input_file, sheet_name, updates, col_indices, ticker_col_idx):
+    """
+    開啟工作簿、寫入更新並儲存，並顯示寫入速度
+
+    參數:
+        input_file: Excel 檔案路徑
+        sheet_name: 工作表名稱
+        updates: {excel_row: {欄位名稱: 值}}
+        col_indices: {欄位名稱: 欄位索引}
+        ticker_col_idx: 「公司代碼」欄位索引
+
+    返回:
+        int: 寫入的儲存格數
+    """
+    start_time = time.perf_counter()
+    wb = load_workbook(input_file)
+    ws = wb[sheet_name]
+    load_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    cell_count = apply_updates(ws, updates, col_indices, ticker_col_idx)
+    apply_time = time.perf_counter() - start_time
+
+    # 儲存工作簿（先寫暫存檔再取代，中斷時不會留下壞檔）
+    start_time = time.perf_counter()
+    base, ext = os.path.splitext(input_file)
+    tmp_file = f"{base}.tmp{ext}"
+    wb.save(tmp_file)
+    wb.close()
+    os.replace(tmp_file, input_file)
+    save_time = time.perf_counter() - start_time
+
+    rate = cell_count / apply_time if apply_time > 0 else float('inf')
+    print(f"  寫入 {cell_count} 個儲存格：載入 {load_time:.2f} 秒、寫入 {apply_time:.2f} 秒"
+          f"（{rate:,.0f} 格/秒）、儲存 {save_time:.2f} 秒")
+    return cell_count
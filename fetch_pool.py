@@ -0,0 +1,170 @@
+"""
+並行下載（執行緒池 + 令牌桶限速 + 指數退避重試 + 空資料負向快取）
+
+主程式的日 K 與 1 分鐘 K 線下載幾乎都在等網路，
+這裡用執行緒池同時發出請求，並以令牌桶控制每秒請求數，避免被 Yahoo 限流。
+
+SimulatedFetch 是本地替身，可注入延遲與失敗，用來在沒有網路時驗證並行與重試行為。
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from market_data import EmptyResponseError
+
+class TokenBucket:
+    """
+    令牌桶限速器（執行緒安全）
+
+    參數:
+        rate: 每秒補充的令牌數（即平均每秒請求數）
+        capacity: 桶容量（允許的瞬間爆量），預設與 rate 相同
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一個令牌，不足時等待"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+class ConcurrentFetcher:
+    """
+    並行執行下載函式
+
+    - max_workers: 同時進行的請求數上限
+    - rate: 每秒請求數上限（令牌桶），None 表示不限速
+    - max_retries: 發生例外時的最大重試次數，間隔為 backoff * 2^n 加上隨機抖動
+    - 資料來源以 EmptyResponseError 表示空回應（可能是限流）時同樣重試，重試完仍沒有資料才當成空結果
+    - 空結果（空 DataFrame 或重試完的 EmptyResponseError）的股票會記入負向快取，本次執行中不再請求
+
+    參數:
+        fetch: 下載函式 fetch(ticker, *args)，回傳 DataFrame
+    """
+
+    def __init__(self, fetch, max_workers=4, rate=2.0, burst=None, max_retries=3, backoff=0.5,
+                 sleep=time.sleep):
+        self.fetch = fetch
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._sleep = sleep
+        self._bucket = TokenBucket(rate, burst, sleep=sleep) if rate else None
+        self._lock = threading.Lock()
+        self.negative_cache = set()
+        self.stats = {"requests": 0, "retries": 0, "failed": 0, "empty": 0, "skipped": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _retry(self, attempt):
+        self._count("retries")
+        self._sleep(self.backoff * (2 ** attempt) + random.uniform(0, self.backoff))
+
+    def _fetch_one(self, fetch, args, cache_empty):
+        ticker = args[0]
+        if ticker in self.negative_cache:
+            self._count("skipped")
+            return None
+
+        for attempt in range(self.max_retries + 1):
+            if self._bucket:
+                self._bucket.acquire()
+            self._count("requests")
+            try:
+                df = fetch(*args)
+            except EmptyResponseError as e:
+                if attempt < self.max_retries:
+                    self._retry(attempt)
+                    continue
+                print(f"  ⚠ {ticker} 沒有資料（已重試 {self.max_retries} 次）: {str(e)}")
+                df = pd.DataFrame()
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"  ✗ {ticker} 下載失敗（已重試 {self.max_retries} 次）: {str(e)}")
+                    self._count("failed")
+                    return None
+                self._retry(attempt)
+                continue
+
+            if df is None or df.empty:
+                self._count("empty")
+                if cache_empty:
+                    with self._lock:
+                        self.negative_cache.add(ticker)
+            return df
+
+    def fetch_all(self, requests, fetch=None, cache_empty=True):
+        """
+        並行執行多個下載請求
+
+        參數:
+            requests: {key: (ticker, *args)}，key 用來對應結果
+            fetch: 本次使用的下載函式，預設為建構時傳入的函式
+            cache_empty: 空結果是否記入負向快取（只有「股票本身無資料」的請求才應該設為 True）
+
+        返回:
+            dict: {key: DataFrame 或 None}（失敗或被負向快取略過時為 None）
+        """
+        if not requests:
+            return {}
+
+        fetch = fetch or self.fetch
+        keys = list(requests)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self._fetch_one, fetch, requests[key], cache_empty) for key in keys]
+            return {key: future.result() for key, future in zip(keys, futures)}
+
+class SimulatedFetch:
+    """
+    本地替身下載函式：包裝任一資料來源並注入延遲與失敗
+
+    參數:
+        source: 實際產生資料的函式 source(ticker, *args)
+        latency: 每次請求的基本延遲（秒）
+        jitter: 延遲的隨機抖動上限（秒）
+        failure_rate: 每次請求拋出例外的機率
+        empty_tickers: 固定回傳空資料的股票代碼
+        seed: 亂數種子（讓失敗序列可重現）
+    """
+
+    def __init__(self, source, latency=0.05, jitter=0.0, failure_rate=0.0, empty_tickers=(), seed=0):
+        self.source = source
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.empty_tickers = set(empty_tickers)
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, ticker, *args):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            fail = self._rng.random() < self.failure_rate
+        time.sleep(delay)
+        if fail:
+            raise ConnectionError(f"simulated failure for {ticker}")
+        if ticker in self.empty_tickers:
+            return pd.DataFrame()
+        return self.source(ticker, *args)
@@ -0,0 +1,221 @@
+"""
+宣告式指標登錄表：每個指標宣告自己的參數與輸入，計算時共用中間結果
+
+原本每個指標是一個獨立的函式（calculate_rsi、calculate_adx），各自重算 close.diff()、True Range、
+位移序列；新增指標就要再寫一個函式、再加一組寫死的欄位對應。這裡把計算拆成節點：
+
+  - 節點以 (名稱, *參數) 為鍵，例如 ("sma", ("tr",), 14) 是 14 日的平均 True Range
+  - NODES 宣告每個節點的輸入節點與計算方式，INDICATORS 宣告每個指標的參數預設值與輸出節點
+  - IndicatorPlan 依要計算的指標建立 DAG（同一個鍵只出現一次），依拓撲順序計算；
+    每檔股票計算一次，所有中間結果在同一次計算中共用
+
+例如同時計算 ADX 與 ATR 時，ATR(14) 就是 ADX 內部的 ("sma", ("tr",), 14)，True Range 只算一次；
+MACD 的三個輸出共用同一組 EMA，布林通道上下緣共用同一個平均與標準差。
+
+指標以字串指定：名稱(參數).輸出，參數與輸出可省略，例如
+    "RSI"、"RSI(6)"、"ATR(14)"、"MACD(12,26,9).hist"、"BOLL(20,2).upper"、"VWAP(20)"
+
+用法:
+    plan = IndicatorPlan(["RSI", "ADX", "ATR"])
+    values = plan.compute(daily_df)        # {"RSI": Series, "ADX": Series, "ATR": Series}
+"""
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# 基本欄位節點 -> 日 K 的欄位名稱
+BASE_COLUMNS = {
+    "open": "Open",
+    "high": "High",
+    "low": "Low",
+    "close": "Close",
+    "volume": "Volume",
+}
+
+def _directional_move(move, other):
+    return pd.Series(np.where((move > other) & (move > 0), move, 0), index=move.index)
+
+# 中間結果節點：名稱 -> (輸入節點的鍵（依參數）, 計算函式(輸入值..., 參數...))
+# RSI / ADX 的定義與原本的 calculate_rsi / calculate_adx 相同（rolling mean），結果逐位元相同
+NODES = {
+    "prev_close": (lambda: [("close",)], lambda close: close.shift()),
+    "delta": (lambda: [("close",)], lambda close: close.diff()),
+    "gain": (lambda: [("delta",)], lambda delta: delta.where(delta > 0, 0)),
+    "loss": (lambda: [("delta",)], lambda delta: -delta.where(delta < 0, 0)),
+    "tr": (lambda: [("high",), ("low",), ("prev_close",)],
+           lambda high, low, prev_close: pd.concat(
+               [high - low, np.abs(high - prev_close), np.abs(low - prev_close)], axis=1).max(axis=1)),
+    "up_move": (lambda: [("high",)], lambda high: high - high.shift()),
+    "down_move": (lambda: [("low",)], lambda low: low.shift() - low),
+    "plus_dm": (lambda: [("up_move",), ("down_move",)], _directional_move),
+    "minus_dm": (lambda: [("down_move",), ("up_move",)], _directional_move),
+    "typical_price": (lambda: [("high",), ("low",), ("close",)], lambda high, low, close: (high + low + close) / 3),
+    "price_volume": (lambda: [("typical_price",), ("volume",)], lambda price, volume: price * volume),
+
+    # 參數化的平滑：source 是另一個節點的鍵
+    "sma": (lambda source, period: [source],
+            lambda values, source, period: values.rolling(window=period).mean()),
+    "ema": (lambda source, span: [source],
+            lambda values, source, span: values.ewm(span=span, adjust=False).mean()),
+    "std": (lambda source, period: [source],
+            lambda values, source, period: values.rolling(window=period).std(ddof=0)),
+
+    "rsi": (lambda period: [("sma", ("gain",), period), ("sma", ("loss",), period)],
+            lambda gain, loss, period: 100 - (100 / (1 + gain / loss))),
+    "plus_di": (lambda period: [("sma", ("plus_dm",), period), ("sma", ("tr",), period)],
+                lambda dm, atr, period: 100 * (dm / atr)),
+    "minus_di": (lambda period: [("sma", ("minus_dm",), period), ("sma", ("tr",), period)],
+                 lambda dm, atr, period: 100 * (dm / atr)),
+    "dx": (lambda period: [("plus_di", period), ("minus_di", period)],
+           lambda plus_di, minus_di, period: 100 * np.abs(plus_di - minus_di) / (plus_di + minus_di)),
+    "macd": (lambda fast, slow: [("ema", ("close",), fast), ("ema", ("close",), slow)],
+             lambda fast_ema, slow_ema, fast, slow: fast_ema - slow_ema),
+    "macd_hist": (lambda fast, slow, signal: [("macd", fast, slow), ("ema", ("macd", fast, slow), signal)],
+                  lambda macd, signal_line, fast, slow, signal: macd - signal_line),
+    "boll_band": (lambda period, width, side: [("sma", ("close",), period), ("std", ("close",), period)],
+                  lambda mean, std, period, width, side: mean + side * width * std),
+    "vwap": (lambda period: [("sma", ("price_volume",), period), ("sma", ("volume",), period)],
+             lambda price_volume, volume, period: price_volume / volume),
+}
+
+# 指標：名稱 -> (參數預設值, {輸出名稱: 輸出節點的鍵}, 暖機 K 棒數)
+# 輸出名稱 "" 是預設輸出；暖機是第一個穩定的值之前需要的 K 棒數（決定日 K 往前下載多少交易日）
+# EMA 沒有固定的起點，暖機取 3 倍週期，之後起點造成的差異小於四捨五入的位數
+INDICATORS = {
+    "RSI": ({"period": 14},
+            {"": lambda period: ("rsi", period)},
+            lambda period: period),
+    "ADX": ({"period": 14},
+            {"": lambda period: ("sma", ("dx", period), period),
+             "plus_di": lambda period: ("plus_di", period),
+             "minus_di": lambda period: ("minus_di", period)},
+            lambda period: 2 * (period - 1)),
+    "ATR": ({"period": 14},
+            {"": lambda period: ("sma", ("tr",), period)},
+            lambda period: period - 1),
+    "MACD": ({"fast": 12, "slow": 26, "signal": 9},
+             {"": lambda fast, slow, signal: ("macd", fast, slow),
+              "signal": lambda fast, slow, signal: ("ema", ("macd", fast, slow), signal),
+              "hist": lambda fast, slow, signal: ("macd_hist", fast, slow, signal)},
+             lambda fast, slow, signal: 3 * (slow + signal)),
+    "BOLL": ({"period": 20, "width": 2},
+             {"": lambda period, width: ("sma", ("close",), period),
+              "upper": lambda period, width: ("boll_band", period, width, 1),
+              "lower": lambda period, width: ("boll_band", period, width, -1)},
+             lambda period, width: period - 1),
+    "VWAP": ({"period": 20},
+             {"": lambda period: ("vwap", period)},
+             lambda period: period - 1),
+}
+
+_SPEC_PATTERN = re.compile(r"^\s*([A-Za-z]\w*)\s*(?:\(([^()]*)\))?\s*(?:\.(\w+))?\s*$")
+
+def _number(text):
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+@lru_cache(maxsize=None)
+def parse_spec(spec):
+    """
+    解析指標字串
+
+    參數:
+        spec: 例如 "RSI"、"ATR(20)"、"MACD(12,26,9).hist"
+
+    返回:
+        tuple: (指標名稱, {參數: 值}, 輸出名稱)
+
+    例外:
+        ValueError: 格式錯誤、未知的指標、參數個數不符或未知的輸出
+    """
+    match = _SPEC_PATTERN.match(spec)
+    if not match:
+        raise ValueError(f"無法解析指標: {spec!r}（格式為 名稱(參數).輸出，例如 MACD(12,26,9).hist）")
+    name, args, output = match.group(1).upper(), match.group(2), match.group(3) or ""
+    if name not in INDICATORS:
+        raise ValueError(f"未知的指標: {name}（可用的指標: {', '.join(INDICATORS)}）")
+    defaults, outputs, _ = INDICATORS[name]
+    values = [text.strip() for text in args.split(",")] if args and args.strip() else []
+    if len(values) > len(defaults):
+        raise ValueError(f"指標 {name} 最多有 {len(defaults)} 個參數（{', '.join(defaults)}）: {spec!r}")
+    try:
+        params = dict(defaults, **{key: _number(value) for key, value in zip(defaults, values)})
+    except ValueError:
+        raise ValueError(f"指標 {name} 的參數必須是數字: {spec!r}")
+    if output not in outputs:
+        available = ", ".join(f"{name}.{key}" if key else name for key in outputs)
+        raise ValueError(f"指標 {name} 沒有輸出 {output!r}（可用的輸出: {available}）")
+    return name, params, output
+
+def resolve(spec):
+    """指標字串對應的輸出節點鍵"""
+    name, params, output = parse_spec(spec)
+    return INDICATORS[name][1][output](**params)
+
+def warmup(spec):
+    """指標第一個穩定的值之前需要的 K 棒數"""
+    name, params, _ = parse_spec(spec)
+    return INDICATORS[name][2](**params)
+
+def _inputs(key):
+    if key[0] in BASE_COLUMNS:
+        return []
+    return NODES[key[0]][0](*key[1:])
+
+class IndicatorPlan:
+    """
+    多個指標的計算計畫（節點 DAG，同一個中間結果只計算一次）
+
+    參數:
+        specs: 指標字串列表
+
+    例外:
+        ValueError: 指標字串無效
+    """
+
+    def __init__(self, specs):
+        self.outputs = {spec: resolve(spec) for spec in specs}
+        self.order = []
+        visited = set()
+
+        def visit(key):
+            if key in visited:
+                return
+            visited.add(key)
+            for dependency in _inputs(key):
+                visit(dependency)
+            self.order.append(key)
+
+        for key in self.outputs.values():
+            visit(key)
+
+    def compute(self, bars):
+        """
+        計算一檔股票的所有指標
+
+        參數:
+            bars: 日 K DataFrame（或 {欄位名稱: Series}），只需要計畫用到的欄位
+
+        返回:
+            dict: {指標字串: Series}（與 bars 的索引對齊）
+        """
+        values = {}
+        for key in self.order:
+            name, params = key[0], key[1:]
+            if name in BASE_COLUMNS:
+                values[key] = bars[BASE_COLUMNS[name]]
+            else:
+                inputs, function = NODES[name]
+                values[key] = function(*(values[dependency] for dependency in inputs(*params)), *params)
+        return {spec: values[key] for spec, key in self.outputs.items()}
+
+@lru_cache(maxsize=64)
+def plan_for(specs):
+    """指標字串 tuple 對應的計算計畫（同一組指標只建立一次）"""
+    return IndicatorPlan(specs)
+
+def compute(spec, bars):
+    """計算單一指標（返回 Series）"""
+    return plan_for((spec,)).compute(bars)[spec]
@@ -0,0 +1,351 @@
+"""
+盤前查詢服務（常駐程式，指標狀態保留在記憶體中）
+
+每次盤前檢查都重新執行一次批次計算，要重新讀取工作簿、重新下載歷史資料、重新計算所有指標。
+這個服務啟動後持續執行，每檔股票只在第一次查詢（或預先載入）時讀取一次日 K：
+
+  - 日 K、整段 RSI/ADX（streaming_indicators 的 "sma" 模式，與 calculate_rsi / calculate_adx 相同）
+    與收盤價的滾動最高/最低價索引（rolling_extrema）都保留在記憶體中
+  - 查詢直接從已計算好的陣列取出序列與價格距離，結果與批次計算的該列相同，每次查詢約 1 毫秒
+  - 新的 K 棒只以 StreamingIndicatorEngine.update 逐根加入（O(1)），不重新計算整段歷史；
+    查詢日期超出記憶體中的資料時自動下載缺少的區間（同一檔股票每 REFRESH_SECONDS 秒最多一次）
+
+只接受本機連線（127.0.0.1）的 HTTP 查詢，回傳 JSON：
+
+  GET  /indicators?ticker=NVDA&date=2024-05-01   RSI/ADX 序列、價格距離、昨日收盤價（date 預設為今天）
+  GET  /status                                    已載入的股票、K 棒數、查詢次數與平均耗時
+  POST /bars      {"ticker": "NVDA", "bars": [{"date": "2024-05-01", "open": ..., "high": ..., "low": ...,
+                   "close": ..., "volume": ...}, ...]}        加入新的 K 棒
+  POST /refresh?ticker=NVDA                       從資料來源下載新的 K 棒（不指定 ticker 時更新所有股票）
+
+用法:
+    python cli.py serve --port 8765 --preload
+    curl "http://127.0.0.1:8765/indicators?ticker=NVDA&date=2024-05-01"
+"""
+import json
+import math
+import os
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+import calculate_indicators as ci
+from fetch_pool import ConcurrentFetcher
+from market_data import COLUMNS
+from rolling_extrema import RollingExtremaIndex
+from streaming_indicators import StreamingIndicatorEngine
+
+# 只接受本機連線
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = int(os.environ.get("INDICATOR_SERVICE_PORT", "8765"))
+
+# 同一檔股票兩次自動下載新 K 棒的最短間隔（秒）
+REFRESH_SECONDS = 60
+
+# 第一次載入時額外保留的歷史天數（日曆天），之後查詢較早的日期時不需要重新下載
+HISTORY_PADDING_DAYS = 30
+
+def _to_json(value):
+    """把結果轉成可 JSON 序列化的值（時間戳轉成日期字串、NaN 轉成 null）"""
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+class _TickerHistory:
+    """一檔股票在記憶體中的日 K 與指標（bars 涵蓋 [start, end) 的下載區間）"""
+
+    def __init__(self, bars, start, end, rsi, adx):
+        self.bars = bars
+        self.start = start
+        self.end = end
+        self.rsi = rsi
+        self.adx = adx
+        self.extrema = RollingExtremaIndex(bars["Close"].to_numpy(dtype=np.float64))
+        self.refreshed_at = time.monotonic()
+        self.lock = threading.Lock()
+
+class IndicatorService:
+    """
+    保留每檔股票的日 K 與指標狀態，回答任意日期的查詢
+
+    參數:
+        engine: StreamingIndicatorEngine（必須是 "sma" 模式，預設建立新的）
+    """
+
+    def __init__(self, engine=None):
+        self.engine = engine or StreamingIndicatorEngine(period=14, mode="sma")
+        if self.engine.mode != "sma":
+            raise ValueError("查詢服務必須使用 sma 模式（與批次計算相同）")
+        self._histories = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.query_count = 0
+        self.query_seconds = 0.0
+
+    def _load_range(self, need_start, need_end, history=None):
+        """第一次載入（或需要更早的資料）時的下載區間：至少涵蓋今天的查詢，另保留一些較早的歷史"""
+        today = pd.Timestamp.now().normalize()
+        start = min(need_start, ci.daily_fetch_window(today)[0] - timedelta(days=HISTORY_PADDING_DAYS))
+        end = max(need_end, today + timedelta(days=1), history.end if history else need_end)
+        return start, end
+
+    def _build(self, ticker, bars, start, end):
+        """以 [start, end) 的日 K 建立指標狀態並保留，沒有資料時回傳 None"""
+        history = None
+        if bars is not None and not bars.empty:
+            # 快取回傳的是映射檔案的視圖，之後更新快取會改寫同一段資料；複製一份，重疊的 K 棒才比較得出差異
+            bars = bars.reindex(columns=COLUMNS).astype(np.float64).copy()
+            indicators = self.engine.warm_up(ticker, bars)
+            history = _TickerHistory(bars, start, end, indicators["RSI"].to_numpy(), indicators["ADX"].to_numpy())
+        with self._lock:
+            if history is None:
+                self._histories.pop(ticker, None)
+            else:
+                self._histories[ticker] = history
+        return history
+
+    def _history(self, ticker, need_start, need_end):
+        """取得涵蓋 [need_start, need_end) 的狀態（需要更早的資料時重新建立，需要更新的資料時只加入新 K 棒）"""
+        with self._lock:
+            history = self._histories.get(ticker)
+        if history is None or need_start < history.start:
+            start, end = self._load_range(need_start, need_end, history)
+            return self._build(ticker, ci.load_or_empty(ci.load_daily_bars, ticker, start, end), start, end)
+        if need_end > history.end and time.monotonic() - history.refreshed_at >= REFRESH_SECONDS:
+            self.refresh(ticker, need_end)
+        return history
+
+    def _append(self, history, ticker, new_bars):
+        """
+        加入新的 K 棒（呼叫時必須持有 history.lock）
+
+        返回:
+            int: 加入的 K 棒數；與記憶體中的 K 棒重疊且數值不同時（例如盤中的未完成日 K 被更新）重新建立狀態，回傳 -1
+        """
+        new_bars = new_bars.reindex(columns=history.bars.columns).astype(np.float64).copy().sort_index()
+        last = history.bars.index[-1]
+        overlap = new_bars[new_bars.index <= last]
+        if not overlap.empty:
+            # 只比較指標會用到的欄位
+            columns = ["High", "Low", "Close"]
+            stored = history.bars.reindex(overlap.index)[columns].to_numpy(dtype=np.float64)
+            if not np.allclose(stored, overlap[columns].to_numpy(dtype=np.float64), equal_nan=True):
+                bars = pd.concat([history.bars[~history.bars.index.isin(overlap.index)],
+                                  overlap]).sort_index()
+                indicators = self.engine.warm_up(ticker, bars)
+                history.bars = bars
+                history.rsi = indicators["RSI"].to_numpy()
+                history.adx = indicators["ADX"].to_numpy()
+                history.extrema = RollingExtremaIndex(bars["Close"].to_numpy(dtype=np.float64))
+                return -1
+
+        new_bars = new_bars[new_bars.index > last]
+        if new_bars.empty:
+            return 0
+        values = [self.engine.update(ticker, high, low, close)
+                  for high, low, close in new_bars[["High", "Low", "Close"]].itertuples(index=False)]
+        history.bars = pd.concat([history.bars, new_bars])
+        history.rsi = np.concatenate([history.rsi, [rsi for rsi, _ in values]])
+        history.adx = np.concatenate([history.adx, [adx for _, adx in values]])
+        history.extrema = RollingExtremaIndex(history.bars["Close"].to_numpy(dtype=np.float64))
+        return len(new_bars)
+
+    def add_bars(self, ticker, bars):
+        """
+        加入外部提供的新 K 棒
+
+        參數:
+            ticker: 股票代碼
+            bars: 日 K DataFrame（含 High/Low/Close，索引為日期）
+
+        返回:
+            int: 加入的 K 棒數（-1 表示重新建立狀態）
+        """
+        with self._lock:
+            history = self._histories.get(ticker)
+        if history is None:
+            raise KeyError(f"{ticker} 尚未載入")
+        with history.lock:
+            added = self._append(history, ticker, bars)
+            history.end = max(history.end, bars.index.max().normalize() + timedelta(days=1))
+        return added
+
+    def refresh(self, ticker, end=None):
+        """
+        從資料來源下載 [已載入區間的結尾, end) 的新 K 棒並加入
+
+        參數:
+            ticker: 股票代碼
+            end: 下載區間的結尾（不包含），預設為明天
+
+        返回:
+            int: 加入的 K 棒數（-1 表示重新建立狀態）
+        """
+        with self._lock:
+            history = self._histories.get(ticker)
+        if history is None:
+            raise KeyError(f"{ticker} 尚未載入")
+        end = end or pd.Timestamp.now().normalize() + timedelta(days=1)
+        with history.lock:
+            # 從最後一根 K 棒當天重新下載，盤中的未完成日 K 會被更新
+            start = min(history.end, history.bars.index[-1].normalize())
+            new_bars = ci.load_or_empty(ci.load_daily_bars, ticker, start, max(end, history.end))
+            added = self._append(history, ticker, new_bars) if new_bars is not None and not new_bars.empty else 0
+            history.end = max(history.end, end)
+            history.refreshed_at = time.monotonic()
+        return added
+
+    def preload(self, tickers):
+        """
+        預先載入多檔股票（批次/並行下載日 K 後逐檔建立指標狀態）
+
+        返回:
+            int: 成功載入的股票數
+        """
+        start, end = self._load_range(*ci.daily_fetch_window(pd.Timestamp.now().normalize()))
+        fetch_plan = {ticker: (start, end) for ticker in tickers}
+        fetcher = ConcurrentFetcher(ci.load_daily_bars, max_workers=ci.FETCH_MAX_WORKERS,
+                                    rate=None, max_retries=ci.FETCH_MAX_RETRIES)
+        daily_bars = ci.fetch_daily_bars(fetch_plan, fetcher)
+        loaded = [self._build(ticker, bars, start, end) for ticker, bars in daily_bars.items()]
+        return sum(1 for history in loaded if history is not None)
+
+    def query(self, ticker, date=None):
+        """
+        查詢一檔股票在某個開盤日期的 RSI/ADX 序列與價格距離
+
+        參數:
+            ticker: 股票代碼
+            date: 開盤日期，預設為今天
+
+        返回:
+            dict: 與 calculate_rsi_adx_sequences_batch 相同格式的結果，沒有資料時為 None
+        """
+        start_time = time.perf_counter()
+        date = pd.Timestamp(date if date is not None else pd.Timestamp.now().normalize())
+        need_start, need_end = ci.daily_fetch_window(date)
+        history = self._history(ticker, need_start, need_end)
+        result = None
+        if history is not None:
+            with history.lock:
+                result = ci.calculate_rsi_adx_sequences_batch(ticker, [date], history.bars,
+                                                              indicators=(history.rsi, history.adx),
+                                                              extrema=history.extrema)[0]
+        with self._lock:
+            self.query_count += 1
+            self.query_seconds += time.perf_counter() - start_time
+        return result
+
+    def status(self):
+        """服務狀態"""
+        with self._lock:
+            histories = dict(self._histories)
+            average = self.query_seconds / self.query_count if self.query_count else 0.0
+            return {
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                "queries": self.query_count,
+                "average_query_ms": round(average * 1000, 3),
+                "provider": ci.market_data_provider.name,
+                "tickers": {
+                    ticker: {"bars": len(history.bars), "first": history.bars.index[0],
+                             "last": history.bars.index[-1]}
+                    for ticker, history in histories.items()
+                },
+            }
+
+def _parse_bars(rows):
+    """把 POST /bars 的 K 棒列表轉成日 K DataFrame"""
+    df = pd.DataFrame(rows)
+    df.columns = [str(col).capitalize() for col in df.columns]
+    if "Date" not in df.columns or not {"High", "Low", "Close"} <= set(df.columns):
+        raise ValueError("每根 K 棒必須有 date、high、low、close")
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.pop("Date")))
+    return df.reindex(columns=COLUMNS).astype(np.float64)
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None
+
+    def _reply(self, status, payload):
+        body = json.dumps(_to_json(payload), ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _params(self):
+        url = urlparse(self.path)
+        return url.path, {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+    def do_GET(self):
+        path, params = self._params()
+        try:
+            if path == "/indicators":
+                ticker = params.get("ticker", "").strip().upper()
+                if not ticker:
+                    return self._reply(400, {"error": "缺少 ticker"})
+                date = pd.Timestamp(params.get("date") or pd.Timestamp.now().normalize())
+                result = self.service.query(ticker, date)
+                if result is None:
+                    return self._reply(404, {"error": f"{ticker} 在 {date.date()} 之前沒有資料"})
+                return self._reply(200, {"ticker": ticker, "date": date, **result})
+            if path == "/status":
+                return self._reply(200, self.service.status())
+            return self._reply(404, {"error": f"未知的路徑: {path}"})
+        except ValueError as e:
+            return self._reply(400, {"error": str(e)})
+
+    def do_POST(self):
+        path, params = self._params()
+        try:
+            if path == "/bars":
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                ticker = str(payload.get("ticker", "")).strip().upper()
+                added = self.service.add_bars(ticker, _parse_bars(payload.get("bars", [])))
+                return self._reply(200, {"ticker": ticker, "added": added})
+            if path == "/refresh":
+                tickers = [params["ticker"].strip().upper()] if params.get("ticker") else list(
+                    self.service.status()["tickers"])
+                return self._reply(200, {"added": {ticker: self.service.refresh(ticker) for ticker in tickers}})
+            return self._reply(404, {"error": f"未知的路徑: {path}"})
+        except KeyError as e:
+            return self._reply(404, {"error": str(e.args[0]) if e.args else str(e)})
+        except ValueError as e:
+            return self._reply(400, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        # 查詢很頻繁，不逐筆顯示
+        pass
+
+def serve(service, host=SERVICE_HOST, port=SERVICE_PORT):
+    """
+    啟動 HTTP 服務（直到 Ctrl-C）
+
+    參數:
+        service: IndicatorService
+        host: 監聽位址（預設只接受本機連線）
+        port: 連接埠
+    """
+    handler = type("Handler", (_Handler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"✓ 查詢服務已啟動: http://{host}:{port}/indicators?ticker=NVDA&date=YYYY-MM-DD")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n服務已停止")
+    finally:
+        server.server_close()
@@ -0,0 +1,317 @@
+"""
+執行記錄與分階段計時
+
+主程式每次執行建立一份 RunReport，記錄：
+  - 各階段耗時（下載、指標計算、價格距離、盤中數據、寫回 Excel...）
+  - 每檔股票的下載延遲與下載量
+  - K 線快取與盤中封存的命中率
+  - 最慢的資料列
+  - 可選的 cProfile 熱點與 tracemalloc 記憶體峰值
+
+執行結束時寫成 JSON（reports/run_YYYYmmdd_HHMMSS.json），
+並與上一次的記錄比較，每筆平均耗時變慢超過門檻時顯示警告。
+
+沒有啟動記錄時，所有記錄函式都不做任何事，可以在任何地方呼叫。
+"""
+import contextlib
+import cProfile
+import glob
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+import bar_cache
+
+# 執行記錄目錄
+REPORT_DIR = "reports"
+
+# 每筆平均耗時比上次慢超過這個倍數時警告
+SLOWDOWN_ALERT_RATIO = 1.5
+
+# 耗時低於此值（秒）的階段不警告，避免計時雜訊造成誤報
+MIN_ALERT_SECONDS = 1.0
+
+# 記錄中保留的最慢資料列數
+SLOWEST_ROWS = 10
+
+# cProfile 熱點保留的函式數
+PROFILE_TOP_FUNCTIONS = 20
+
+class RunReport:
+    """
+    單次執行的計時與統計
+
+    參數:
+        profile: 是否以 cProfile 記錄整次執行的熱點（只記錄主執行緒，下載執行緒的時間會算在等待中）
+        trace_memory: 是否以 tracemalloc 記錄各階段的記憶體峰值（會讓執行變慢）
+    """
+
+    def __init__(self, profile=False, trace_memory=False):
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.started_at = datetime.now()
+        self.stages = {}
+        self.counters = {}
+        self.fetches = {}
+        self.rows = []
+        self.latency = {}
+        self.info = {}
+        self.total_seconds = None
+        self._lock = threading.Lock()
+        self._start_time = time.perf_counter()
+        self._cache_start = dict(bar_cache.CACHE_STATS)
+        self._profiler = None
+
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+        self.total_seconds = time.perf_counter() - self._start_time
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.info["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+            tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """
+        計時一個階段（同名的階段會累加，例如逐列計算盤中數據）
+        """
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start_time
+            with self._lock:
+                stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+                stage["seconds"] += seconds
+                stage["calls"] += 1
+                if self.trace_memory and tracemalloc.is_tracing():
+                    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                    stage["peak_mb"] = round(max(stage.get("peak_mb", 0.0), peak), 2)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def _fetch_stats(self, ticker, interval):
+        return self.fetches.setdefault(interval, {}).setdefault(ticker, {
+            "requests": 0, "seconds": 0.0, "max_seconds": 0.0, "downloads": 0, "bytes": 0})
+
+    def record_fetch(self, ticker, interval, seconds, start=None):
+        """記錄一次資料取得的延遲（含讀取快取），start 為請求的開始日期"""
+        with self._lock:
+            key = (interval, ticker, pd.Timestamp(start).date() if start is not None else None)
+            self.latency[key] = self.latency.get(key, 0.0) + seconds
+            stats = self._fetch_stats(ticker, interval)
+            stats["requests"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def record_download(self, ticker, interval, nbytes):
+        """記錄一次實際從資料來源下載的資料量"""
+        with self._lock:
+            stats = self._fetch_stats(ticker, interval)
+            stats["downloads"] += 1
+            stats["bytes"] += int(nbytes)
+
+    def fetch_latency(self, ticker, interval, start=None):
+        """
+        查詢資料取得的延遲
+
+        返回:
+            float: 指定開始日期那次請求的秒數；start 為 None 時為該股票此週期的總秒數
+        """
+        if start is None:
+            stats = self.fetches.get(interval, {}).get(ticker)
+            return stats["seconds"] if stats else 0.0
+        return self.latency.get((interval, ticker, pd.Timestamp(start).date()), 0.0)
+
+    def record_row(self, row, ticker, date, seconds, status, fetch_seconds=0.0):
+        """記錄一列的計算耗時與分攤到這一列的下載耗時"""
+        with self._lock:
+            self.rows.append({"row": row, "ticker": str(ticker), "date": str(date), "status": status,
+                              "seconds": round(seconds + fetch_seconds, 4),
+                              "compute_seconds": round(seconds, 4), "fetch_seconds": round(fetch_seconds, 4)})
+
+    def _profile_summary(self):
+        if self._profiler is None:
+            return None
+        stats = pstats.Stats(self._profiler, stream=io.StringIO())
+        functions = []
+        for (filename, line, name), (_, calls, _, cumulative, _) in sorted(
+                stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP_FUNCTIONS]:
+            functions.append({"function": f"{os.path.basename(filename)}:{line}({name})",
+                              "calls": calls, "cumulative_seconds": round(cumulative, 4)})
+        return functions
+
+    def to_dict(self):
+        """轉成可 JSON 序列化的記錄"""
+        cache = {name: bar_cache.CACHE_STATS[name] - self._cache_start.get(name, 0)
+                 for name in bar_cache.CACHE_STATS}
+        cache_requests = sum(cache.values())
+        archive_hits = self.counters.get("intraday_archive.hit", 0)
+        archive_requests = archive_hits + self.counters.get("intraday_archive.miss", 0)
+
+        fetches = {}
+        for interval, tickers in self.fetches.items():
+            fetches[interval] = {
+                ticker: {**stats, "seconds": round(stats["seconds"], 4), "max_seconds": round(stats["max_seconds"], 4)}
+                for ticker, stats in sorted(tickers.items(), key=lambda item: item[1]["seconds"], reverse=True)
+            }
+
+        total_seconds = self.total_seconds if self.total_seconds is not None else time.perf_counter() - self._start_time
+        pending_rows = self.counters.get("rows.pending", 0)
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "total_seconds": round(total_seconds, 4),
+            "seconds_per_row": round(total_seconds / pending_rows, 4) if pending_rows else None,
+            "info": self.info,
+            "counters": self.counters,
+            "stages": {name: {**stage, "seconds": round(stage["seconds"], 4)} for name, stage in self.stages.items()},
+            "cache": {
+                "bar_cache": {**cache, "hit_rate": round(cache["hit"] / cache_requests, 3) if cache_requests else None},
+                "intraday_archive": {"hit": archive_hits, "requests": archive_requests,
+                                     "hit_rate": round(archive_hits / archive_requests, 3) if archive_requests else None},
+            },
+            "bytes_fetched": sum(stats["bytes"] for tickers in self.fetches.values() for stats in tickers.values()),
+            "fetches": fetches,
+            "slowest_rows": sorted(self.rows, key=lambda row: row["seconds"], reverse=True)[:SLOWEST_ROWS],
+            "profile": self._profile_summary(),
+        }
+
+def find_previous_report(report_dir=REPORT_DIR):
+    """回傳最近一次的執行記錄路徑，沒有時為 None"""
+    paths = sorted(glob.glob(os.path.join(report_dir, "run_*.json")))
+    return paths[-1] if paths else None
+
+def check_slowdown(report, previous, ratio=SLOWDOWN_ALERT_RATIO):
+    """
+    與上一次的記錄比較（以每筆待處理資料的平均耗時比較，避免資料量不同造成誤報）
+
+    參數:
+        report: 本次記錄（to_dict 的結果）
+        previous: 上一次的記錄
+
+    返回:
+        list: 警告訊息
+    """
+    rows = report["counters"].get("rows.pending", 0)
+    previous_rows = previous.get("counters", {}).get("rows.pending", 0)
+    if not rows or not previous_rows:
+        return []
+
+    alerts = []
+    items = [("總計", report["total_seconds"], previous.get("total_seconds", 0))]
+    items += [(name, stage["seconds"], previous.get("stages", {}).get(name, {}).get("seconds", 0))
+              for name, stage in report["stages"].items()]
+    for name, seconds, previous_seconds in items:
+        if seconds < MIN_ALERT_SECONDS or previous_seconds <= 0:
+            continue
+        per_row = seconds / rows
+        previous_per_row = previous_seconds / previous_rows
+        if per_row > previous_per_row * ratio:
+            alerts.append(f"{name} 每筆 {per_row:.3f} 秒，上次 {previous_per_row:.3f} 秒"
+                          f"（慢 {per_row / previous_per_row:.1f} 倍）")
+    return alerts
+
+_current = None
+
+def start_run(profile=False, trace_memory=False):
+    """開始記錄本次執行"""
+    global _current
+    _current = RunReport(profile=profile, trace_memory=trace_memory)
+    _current.start()
+    return _current
+
+def current():
+    return _current
+
+def span(name):
+    """計時一個階段（沒有啟動記錄時不做任何事）"""
+    return _current.span(name) if _current else contextlib.nullcontext()
+
+def count(name, n=1):
+    if _current:
+        _current.count(name, n)
+
+def record_fetch(ticker, interval, seconds, start=None):
+    if _current:
+        _current.record_fetch(ticker, interval, seconds, start)
+
+def fetch_latency(ticker, interval, start=None):
+    return _current.fetch_latency(ticker, interval, start) if _current else 0.0
+
+def record_download(ticker, interval, df):
+    """記錄從資料來源實際下載的資料量（以 DataFrame 佔用的記憶體估算）"""
+    if _current and df is not None:
+        _current.record_download(ticker, interval, df.memory_usage(index=True).sum() if not df.empty else 0)
+
+def record_row(row, ticker, date, seconds, status, fetch_seconds=0.0):
+    if _current:
+        _current.record_row(row, ticker, date, seconds, status, fetch_seconds)
+
+def discard_run():
+    """
+    結束記錄但不寫出 JSON（例如效能基準測試只需要各階段的計時）
+
+    返回:
+        RunReport: 本次的記錄，沒有啟動記錄時為 None
+    """
+    global _current
+    report = _current
+    _current = None
+    if report is not None:
+        report.stop()
+    return report
+
+def finish_run(report_dir=REPORT_DIR):
+    """
+    結束記錄：寫出 JSON、與上一次比較並顯示警告
+
+    返回:
+        tuple: (記錄路徑, 警告訊息列表)，沒有啟動記錄時為 (None, [])
+    """
+    global _current
+    if _current is None:
+        return None, []
+    report = _current
+    _current = None
+    report.stop()
+
+    data = report.to_dict()
+    alerts = []
+    previous_path = find_previous_report(report_dir)
+    if previous_path:
+        try:
+            with open(previous_path, encoding="utf-8") as f:
+                alerts = check_slowdown(data, json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"  ⚠ 無法讀取上一次的執行記錄 {previous_path}: {e}")
+        data["previous_report"] = os.path.basename(previous_path)
+    data["alerts"] = alerts
+
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f"run_{report.started_at:%Y%m%d_%H%M%S}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+    if report._profiler is not None:
+        report._profiler.dump_stats(os.path.splitext(path)[0] + ".prof")
+    return path, alerts
@@ -0,0 +1,190 @@
+"""
+盤中 1 分鐘 K 線封存（依日期分區，只附加不改寫）
+
+yfinance 只提供最近 7 天的 1 分鐘資料，錯過就補不回來。
+此模組每天把工作表（或觀察清單）中所有股票的 1 分鐘 K 線存到本地：
+  <archive_dir>/<YYYY-MM-DD>/<TICKER>.bin
+
+每根 K 棒是一筆 32 bytes 的固定長度紀錄（時間戳 + float32 OHLC + 成交量），
+查詢某一天時只讀取該日的分區檔，不需要載入整個檔案。
+
+用法:
+    python intraday_archive.py                  # 封存 量化交易.xlsx 中所有股票
+    python intraday_archive.py watchlist.txt    # 封存觀察清單中的股票（每行一個代碼）
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 預設封存目錄
+ARCHIVE_DIR = "intraday_archive"
+
+# 美股交易所時區（分區日期以美東時間為準）
+MARKET_TZ = "America/New_York"
+
+# yfinance 1 分鐘資料可回溯的天數
+ARCHIVE_LOOKBACK_DAYS = 7
+
+# 每根 1 分鐘 K 棒的紀錄格式
+RECORD_DTYPE = np.dtype([
+    ('ts', '<i8'),       # UTC 奈秒
+    ('open', '<f4'),
+    ('high', '<f4'),
+    ('low', '<f4'),
+    ('close', '<f4'),
+    ('volume', '<i8'),
+])
+
+def _partition_path(ticker, trade_date, archive_dir):
+    day = pd.Timestamp(trade_date).strftime("%Y-%m-%d")
+    return os.path.join(archive_dir, day, f"{ticker.upper()}.bin")
+
+def _to_market_index(index):
+    """把索引轉成美東時間（沒有時區的資料視為美東時間）"""
+    index = pd.DatetimeIndex(index)
+    if index.tz is None:
+        return index.tz_localize(MARKET_TZ)
+    return index.tz_convert(MARKET_TZ)
+
+def archive_bars(ticker, df, archive_dir=ARCHIVE_DIR):
+    """
+    把 1 分鐘 K 線依交易日附加到對應的分區檔
+
+    分區中已存在的時間戳會略過，重複執行不會產生重複資料。
+
+    參數:
+        ticker: 股票代碼
+        df: 1 分鐘 K 線（需包含 Open/High/Low/Close 欄位）
+        archive_dir: 封存目錄
+
+    返回:
+        int: 新寫入的 K 棒數
+    """
+    if df is None or df.empty:
+        return 0
+
+    index = _to_market_index(df.index)
+    utc_ns = index.tz_convert("UTC").tz_localize(None).as_unit("ns").asi8
+
+    records = np.empty(len(df), dtype=RECORD_DTYPE)
+    records['ts'] = utc_ns
+    records['open'] = df['Open'].to_numpy(dtype=np.float32)
+    records['high'] = df['High'].to_numpy(dtype=np.float32)
+    records['low'] = df['Low'].to_numpy(dtype=np.float32)
+    records['close'] = df['Close'].to_numpy(dtype=np.float32)
+    volume = df['Volume'].to_numpy(dtype=np.float64) if 'Volume' in df.columns else np.zeros(len(df))
+    records['volume'] = np.nan_to_num(volume).astype(np.int64)
+
+    written = 0
+    days = index.normalize().tz_localize(None)
+    for day in days.unique():
+        day_records = records[days == day]
+        path = _partition_path(ticker, day, archive_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # 略過分區中已存在的時間戳
+        if os.path.exists(path):
+            existing_ts = np.fromfile(path, dtype=RECORD_DTYPE)['ts']
+            day_records = day_records[~np.isin(day_records['ts'], existing_ts)]
+
+        if len(day_records) > 0:
+            with open(path, "ab") as f:
+                f.write(day_records.tobytes())
+            written += len(day_records)
+
+    return written
+
+def has_archived_day(ticker, trade_date, archive_dir=ARCHIVE_DIR):
+    """檢查某檔股票某一天是否已封存"""
+    path = _partition_path(ticker, trade_date, archive_dir)
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+def read_archived_day(ticker, trade_date, archive_dir=ARCHIVE_DIR):
+    """
+    讀取某檔股票某一天的 1 分鐘 K 線（只讀取該日的分區檔）
+
+    參數:
+        ticker: 股票代碼
+        trade_date: 交易日期（美國時間）
+        archive_dir: 封存目錄
+
+    返回:
+        DataFrame: 美東時間索引的 OHLCV，沒有封存時為空的 DataFrame
+    """
+    if not has_archived_day(ticker, trade_date, archive_dir):
+        return pd.DataFrame()
+
+    records = np.fromfile(_partition_path(ticker, trade_date, archive_dir), dtype=RECORD_DTYPE)
+
+    # 依時間排序並去除重複（保留最後寫入的）
+    order = np.argsort(records['ts'], kind="stable")
+    records = records[order]
+    last = np.append(records['ts'][1:] != records['ts'][:-1], True)
+    records = records[last]
+
+    index = pd.DatetimeIndex(records['ts'].view("datetime64[ns]")).tz_localize("UTC").tz_convert(MARKET_TZ)
+    return pd.DataFrame({
+        'Open': records['open'].astype(np.float64),
+        'High': records['high'].astype(np.float64),
+        'Low': records['low'].astype(np.float64),
+        'Close': records['close'].astype(np.float64),
+        'Volume': records['volume'],
+    }, index=index)
+
+def load_watchlist(path):
+    """讀取觀察清單（每行一個股票代碼，# 開頭為註解）"""
+    tickers = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                tickers.append(line.upper())
+    return list(dict.fromkeys(tickers))
+
+def workbook_tickers(input_file, sheet_name, ticker_col='公司代碼'):
+    """讀取工作表中出現過的所有股票代碼"""
+    df = pd.read_excel(input_file, sheet_name=sheet_name, usecols=[ticker_col])
+    return list(dict.fromkeys(str(t).strip().upper() for t in df[ticker_col].dropna()))
+
+def archive_tickers(tickers, fetch, lookback_days=ARCHIVE_LOOKBACK_DAYS, archive_dir=ARCHIVE_DIR):
+    """
+    下載並封存多檔股票最近幾天（不含今天）的 1 分鐘 K 線
+
+    參數:
+        tickers: 股票代碼列表
+        fetch: 下載函式 fetch(ticker, start, end)，回傳 1 分鐘 K 線
+        lookback_days: 回溯天數（受 yfinance 7 天限制）
+        archive_dir: 封存目錄
+
+    返回:
+        dict: {ticker: 新寫入的 K 棒數}
+    """
+    # 只封存已收盤的交易日：今天的交易可能還在進行，封存後會被當成完整的交易日、不再重新下載
+    end = pd.Timestamp.now().normalize()
+    start = end - pd.Timedelta(days=lookback_days)
+
+    summary = {}
+    for ticker in tickers:
+        try:
+            df = fetch(ticker, start, end)
+            summary[ticker] = archive_bars(ticker, df, archive_dir)
+            print(f"  ✓ {ticker}: 新增 {summary[ticker]} 根 K 棒")
+        except Exception as e:
+            print(f"  ✗ {ticker} 封存失敗: {str(e)}")
+            summary[ticker] = 0
+    return summary
+
+if __name__ == "__main__":
+    from calculate_indicators import download_intraday_bars
+
+    if len(sys.argv) > 1:
+        tickers = load_watchlist(sys.argv[1])
+        print(f"觀察清單 {sys.argv[1]}: {len(tickers)} 檔股票")
+    else:
+        tickers = workbook_tickers("量化交易.xlsx", "資料庫")
+        print(f"量化交易.xlsx: {len(tickers)} 檔股票")
+
+    summary = archive_tickers(tickers, download_intraday_bars)
+    print(f"\n✓ 封存完成：共新增 {sum(summary.values())} 根 K 棒（{ARCHIVE_DIR}/）")
@@ -0,0 +1,230 @@
+"""
+盤中價格指標的批次計算（多檔股票、多個交易日一次算完）
+
+calculate_intraday_prices 每次處理一檔股票的一天，用 head / iloc / idxmax / get_loc 逐筆取值。
+這裡把 1 分鐘 K 線排成 (股票 × 交易日 × 分鐘) 的 NumPy 陣列，第 0 分鐘對齊美東 9:30 開盤，
+四個指標全部以陣列運算一次求出：
+
+  - 開盤價            : 第 0 分鐘的 Open
+  - 10分鐘最低價      : 第 0 ~ 9 分鐘 Low 的最小值
+  - 1.5小時最高價     : 第 10 ~ 89 分鐘 High 的最大值（argmax 取第一次出現的位置）
+  - 最高價前的最低價  : 第 10 分鐘到最高價位置（含）的 Low 累積最小值，在 argmax 位置取值；
+                        最高價就在第 10 分鐘時等於最高價本身（與 calculate_intraday_prices 相同）
+
+對齊方式:
+  - "clock"   : 依時間戳放到對應的分鐘（缺少的分鐘為 NaN），適合補算大量歷史資料
+  - "position": 依 K 棒順序放置（第 i 根放在第 i 格），結果與 calculate_intraday_prices 完全相同
+
+用法:
+    cube = pack_sessions({("NVDA", "2024-05-01"): df1, ("AAPL", "2024-05-01"): df2})
+    cube.high.shape                                  # (股票數, 交易日數, 390)
+    results = calculate_intraday_prices_batch({key: df, ...})
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import intraday_archive
+
+# 美股交易所時區
+MARKET_TZ = "America/New_York"
+
+# 一個正常交易日的分鐘數（09:30 - 16:00）
+SESSION_MINUTES = 390
+
+# 開盤後「10 分鐘」與「1.5 小時」對應的 K 棒數
+OPENING_MINUTES = 10
+HIGH_WINDOW_END = 90
+
+# 盤中價格指標只用到開盤後 1.5 小時的資料
+METRIC_MINUTES = HIGH_WINDOW_END
+
+@dataclass
+class SessionCube:
+    """
+    (股票 × 交易日 × 分鐘) 的 1 分鐘 K 線陣列，沒有資料的格子為 NaN
+
+    屬性:
+        tickers: 第 0 軸的股票代碼
+        days: 第 1 軸的交易日（datetime64[D]）
+        open, high, low, close: (股票數, 交易日數, 分鐘數) 的 float64 陣列
+        bar_counts: (股票數, 交易日數) 每格原始的 K 棒數
+    """
+    tickers: list
+    days: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    bar_counts: np.ndarray
+
+def _session_slots(index, minutes, align):
+    """回傳每根 K 棒所在的分鐘格（超出範圍的為 -1）"""
+    if align == "position":
+        slots = np.arange(len(index))
+    else:
+        index = pd.DatetimeIndex(index)
+        index = index.tz_localize(MARKET_TZ) if index.tz is None else index.tz_convert(MARKET_TZ)
+        session_open = index.normalize() + pd.Timedelta(hours=9, minutes=30)
+        slots = (index - session_open).to_numpy().astype("timedelta64[m]").astype(np.int64)
+    return np.where((slots >= 0) & (slots < minutes), slots, -1)
+
+def pack_rows(frames, minutes=SESSION_MINUTES, align="clock"):
+    """
+    把多天的 1 分鐘 K 線排成 (筆數 × 分鐘) 陣列
+
+    參數:
+        frames: {key: DataFrame}，每個 DataFrame 是一檔股票一天的 1 分鐘 K 線
+        minutes: 每天保留的分鐘數
+        align: "clock" 或 "position"
+
+    返回:
+        tuple: (keys, {"Open"/"High"/"Low"/"Close": (筆數, 分鐘數) 陣列}, 每筆原始 K 棒數)
+    """
+    if align not in ("clock", "position"):
+        raise ValueError("align 必須是 'clock' 或 'position'")
+    if minutes < METRIC_MINUTES:
+        raise ValueError(f"minutes 至少要 {METRIC_MINUTES}")
+
+    keys = list(frames)
+    arrays = {col: np.full((len(keys), minutes), np.nan) for col in ("Open", "High", "Low", "Close")}
+    bar_counts = np.zeros(len(keys), dtype=np.int64)
+
+    for row, key in enumerate(keys):
+        df = frames[key]
+        if df is None or df.empty:
+            continue
+        bar_counts[row] = len(df)
+        slots = _session_slots(df.index, minutes, align)
+        keep = slots >= 0
+        for col, array in arrays.items():
+            if col in df.columns:
+                array[row, slots[keep]] = df[col].to_numpy(dtype=np.float64)[keep]
+    return keys, arrays, bar_counts
+
+def pack_sessions(frames, minutes=SESSION_MINUTES, align="clock"):
+    """
+    把多檔股票、多個交易日的 1 分鐘 K 線排成 (股票 × 交易日 × 分鐘) 陣列
+
+    參數:
+        frames: {(ticker, 交易日): DataFrame}
+        minutes: 每天保留的分鐘數
+        align: "clock"（依時間對齊 9:30）或 "position"（依 K 棒順序）
+
+    返回:
+        SessionCube
+    """
+    keys, arrays, bar_counts = pack_rows(frames, minutes, align)
+    tickers = sorted({ticker for ticker, _ in keys})
+    days = np.array(sorted({np.datetime64(pd.Timestamp(day).date(), "D") for _, day in keys}), dtype="datetime64[D]")
+
+    ticker_pos = np.array([tickers.index(ticker) for ticker, _ in keys], dtype=np.int64)
+    day_pos = np.searchsorted(days, np.array([np.datetime64(pd.Timestamp(day).date(), "D") for _, day in keys],
+                                             dtype="datetime64[D]"))
+
+    cube = {}
+    for col, array in arrays.items():
+        cube[col] = np.full((len(tickers), len(days), minutes), np.nan)
+        cube[col][ticker_pos, day_pos] = array
+    counts = np.zeros((len(tickers), len(days)), dtype=np.int64)
+    counts[ticker_pos, day_pos] = bar_counts
+
+    return SessionCube(tickers, days, cube["Open"], cube["High"], cube["Low"], cube["Close"], counts)
+
+def session_metrics(open_, high, low):
+    """
+    以陣列運算計算盤中價格指標（最後一軸為分鐘，前面的軸可以是任意形狀）
+
+    參數:
+        open_, high, low: (..., 分鐘數) 陣列，第 0 格為 9:30，缺少的資料為 NaN（分鐘數至少為 METRIC_MINUTES）
+
+    返回:
+        dict: {"開盤價", "10分鐘最低價", "1.5小時最高價", "最高價前的最低價"} -> (...) 陣列，無法計算時為 NaN；
+              另有 "high_valid"（1.5 小時視窗內是否有資料）
+    """
+    opening_low = low[..., :OPENING_MINUTES]
+    window_high = high[..., OPENING_MINUTES:HIGH_WINDOW_END]
+    window_low = low[..., OPENING_MINUTES:HIGH_WINDOW_END]
+
+    # 全部為 NaN 時 fmin 的結果為 NaN（與 pandas 的 min 相同）
+    low_10min = np.fmin.reduce(opening_low, axis=-1)
+
+    # argmax 取第一次出現的最大值（與 idxmax 相同），NaN 以 -inf 代替
+    high_valid = ~np.isnan(window_high).all(axis=-1)
+    filled_high = np.where(np.isnan(window_high), -np.inf, window_high)
+    high_position = filled_high.argmax(axis=-1)[..., None]
+    high_90min = np.where(high_valid, np.take_along_axis(filled_high, high_position, -1)[..., 0], np.nan)
+
+    # 最高價之前（含）的最低價：累積最小值在 argmax 位置取值；最高價在第 10 分鐘時為最高價本身
+    running_low = np.fmin.accumulate(window_low, axis=-1)
+    low_before_high = np.take_along_axis(running_low, high_position, -1)[..., 0]
+    low_before_high = np.where(high_position[..., 0] == 0, high_90min, low_before_high)
+    low_before_high = np.where(high_valid, low_before_high, np.nan)
+
+    return {
+        "開盤價": open_[..., 0],
+        "10分鐘最低價": low_10min,
+        "1.5小時最高價": high_90min,
+        "最高價前的最低價": low_before_high,
+        "high_valid": high_valid,
+    }
+
+def _rounded(value):
+    # 與 calculate_intraday_prices 相同：0 或缺少時為 None
+    return round(value, 2) if value else None
+
+def calculate_intraday_prices_batch(frames, align="position"):
+    """
+    一次計算多檔股票、多個交易日的盤中價格指標
+
+    參數:
+        frames: {key: DataFrame}，每個 DataFrame 是一檔股票一天的 1 分鐘 K 線（key 可以是任何可雜湊的值）
+        align: "position"（預設，與 calculate_intraday_prices 相同）或 "clock"（依時間對齊 9:30）
+
+    返回:
+        dict: {key: 與 calculate_intraday_prices 相同格式的 dict}，資料不完整時為 None
+    """
+    valid = {key: df for key, df in frames.items()
+             if df is not None and not df.empty and {'Open', 'High', 'Low'} <= set(df.columns)}
+    results = {key: None for key in frames}
+    if not valid:
+        return results
+
+    keys, arrays, bar_counts = pack_rows(valid, METRIC_MINUTES, align)
+    metrics = session_metrics(arrays["Open"], arrays["High"], arrays["Low"])
+
+    for row, key in enumerate(keys):
+        high_90min = _rounded(metrics["1.5小時最高價"][row])
+        low_before_high = _rounded(metrics["最高價前的最低價"][row])
+        if not metrics["high_valid"][row]:
+            # 與 calculate_intraday_prices 相同：不足 11 根 K 棒時沒有最高價；
+            # 有第 11 根之後的 K 棒但全部是 NaN 時，原本的 idxmax 會失敗而回傳 None
+            if align == "position" and bar_counts[row] > OPENING_MINUTES:
+                continue
+            high_90min = low_before_high = None
+        results[key] = {
+            "開盤價": _rounded(metrics["開盤價"][row]),
+            "10分鐘最低價": _rounded(metrics["10分鐘最低價"][row]),
+            "1.5小時最高價": high_90min,
+            "最高價前的最低價": low_before_high,
+            "數據分鐘數": int(bar_counts[row]),
+        }
+    return results
+
+def load_archived_sessions(ticker_days, archive_dir=intraday_archive.ARCHIVE_DIR):
+    """
+    從盤中封存讀取多檔股票、多個交易日的 1 分鐘 K 線（用於大量補算）
+
+    參數:
+        ticker_days: [(ticker, 交易日), ...]
+
+    返回:
+        dict: {(ticker, 交易日): DataFrame}，沒有封存的組合不包含在內
+    """
+    frames = {}
+    for ticker, day in ticker_days:
+        df = intraday_archive.read_archived_day(ticker, day, archive_dir)
+        if not df.empty:
+            frames[(ticker, pd.Timestamp(day).normalize())] = df
+    return frames
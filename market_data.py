@@ -0,0 +1,411 @@
+"""
+行情資料來源介面
+
+所有下載都透過 MarketDataProvider，主程式不再直接呼叫 yf.download，
+可以用設定切換資料來源，例如改用本地檔案重播，在沒有網路時得到可重現的結果。
+
+內建來源:
+  - "yfinance"          : Yahoo Finance（預設）
+  - "replay:<資料夾>"   : 本地檔案重播，檔案結構為
+                            <資料夾>/1d/<TICKER>.csv  (或 .parquet)
+                            <資料夾>/1m/<TICKER>.csv  (或 .parquet)
+                          CSV 第一欄為日期時間索引，其餘為 Open/High/Low/Close/Volume
+  - "synthetic"         : 合成行情（隨機漫步，同一檔股票每次結果相同），用於效能測試
+"""
+import os
+import time
+import zlib
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+# 統一的 OHLCV 欄位
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# 美股交易所時區
+MARKET_TZ = "America/New_York"
+
+class EmptyResponseError(Exception):
+    """
+    網路來源回傳空資料（yfinance 遇到錯誤或限流時不拋例外，只回傳空的 DataFrame）
+
+    以例外表示讓呼叫端可以重試；重試後仍然沒有資料才當成「股票本身沒有資料」。
+    """
+
+def _chunks(items, size):
+    for i in range(0, len(items), max(1, size)):
+        yield items[i:i + max(1, size)]
+
+def split_ticker_frame(df, tickers):
+    """
+    把一次請求多檔股票得到的多層欄位 DataFrame 拆成每檔股票的 OHLCV
+
+    每檔股票的欄位在原始資料中是連續的區塊，以位置切片取出的是原始資料的視圖（不複製）；
+    只有前後的空白列被切掉，中間有整列空白（例如各交易所的假日不同）時才會複製。
+
+    參數:
+        df: yf.download(tickers, group_by="ticker") 的結果，欄位為 (ticker, 欄位) 或 (欄位, ticker)
+        tickers: 這批請求的股票代碼
+
+    返回:
+        dict: {ticker: DataFrame}，沒有資料（下載失敗或代碼錯誤）的股票不包含在內
+    """
+    if df is None or df.empty:
+        return {}
+    if not isinstance(df.columns, pd.MultiIndex):
+        # 只請求一檔股票時可能回傳單層欄位
+        return {tickers[0]: _normalize_frame(df)} if len(tickers) == 1 else {}
+
+    # 找出股票代碼所在的層級（yfinance 會把代碼轉成大寫）
+    by_upper = {ticker.upper(): ticker for ticker in tickers}
+    level = 0 if {str(symbol).upper() for symbol in df.columns.get_level_values(0)} & set(by_upper) else 1
+    symbols = df.columns.get_level_values(level)
+    fields = df.columns.get_level_values(1 - level)
+
+    frames = {}
+    for symbol in symbols.unique():
+        ticker = by_upper.get(str(symbol).upper())
+        if ticker is None:
+            continue
+        positions = np.flatnonzero(symbols == symbol)
+        if positions[-1] - positions[0] + 1 == len(positions):
+            # 連續的欄位以 iloc 切片取出，是原始資料的視圖
+            sub = df.iloc[:, positions[0]:positions[-1] + 1]
+        else:
+            sub = df.iloc[:, positions]
+        sub.columns = pd.Index(fields[positions])
+        valid = sub.notna().any(axis=1).to_numpy()
+        if not valid.any():
+            continue
+        first = int(valid.argmax())
+        last = len(valid) - int(valid[::-1].argmax())
+        sub = sub.iloc[first:last]
+        if not valid[first:last].all():
+            sub = sub[valid[first:last]]
+        frames[ticker] = sub
+    return frames
+
+def _normalize_frame(df):
+    """整理成單層、一維的 OHLCV 欄位"""
+    if df is None or df.empty:
+        return pd.DataFrame()
+
+    # 處理多層索引的情況
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+
+    # 確保資料是一維的
+    for col in COLUMNS:
+        if col in df.columns and df[col].ndim > 1:
+            df[col] = df[col].iloc[:, 0]
+    return df
+
+class MarketDataProvider:
+    """
+    行情資料來源基底類別
+
+    能力旗標:
+        name: 來源名稱
+        description: 顯示用的說明
+        intraday_lookback_days: 1 分鐘資料可回溯的天數，None 表示沒有限制
+        supports_batch: 是否支援一次請求多檔股票
+        is_remote: 是否為網路來源（只有網路來源會經過本地 K 線快取）
+    """
+
+    name = "base"
+    description = "base"
+    intraday_lookback_days = None
+    supports_batch = False
+    is_remote = False
+
+    def get_daily_bars(self, ticker, start, end):
+        """取得 [start, end) 的日 K，無資料時回傳空的 DataFrame"""
+        raise NotImplementedError
+
+    def get_intraday_bars(self, ticker, start, end):
+        """取得 [start, end) 的 1 分鐘 K 線（美東時間索引），無資料時回傳空的 DataFrame"""
+        raise NotImplementedError
+
+    def get_daily_bars_batch(self, tickers, start, end, chunk_size=None):
+        """
+        一次取得多檔股票的日 K
+
+        參數:
+            chunk_size: 每次請求的股票數（支援批次的來源才使用），預設為來源本身的設定
+
+        返回:
+            dict: {ticker: DataFrame}，沒有出現在結果中的股票表示這批請求失敗，呼叫端應改為逐檔下載
+        """
+        return {ticker: self.get_daily_bars(ticker, start, end) for ticker in tickers}
+
+    def get_intraday_bars_batch(self, tickers, start, end):
+        """
+        一次取得多檔股票的 1 分鐘 K 線
+
+        返回:
+            dict: {ticker: DataFrame}
+        """
+        return {ticker: self.get_intraday_bars(ticker, start, end) for ticker in tickers}
+
+class YFinanceProvider(MarketDataProvider):
+    """
+    Yahoo Finance（yfinance 只在第一次下載時才載入）
+
+    參數:
+        batch_chunk_size: 批次下載日 K 時每次請求的股票數
+    """
+
+    name = "yfinance"
+    description = "Yahoo Finance (免費)"
+    intraday_lookback_days = 7
+    supports_batch = True
+    is_remote = True
+
+    # yfinance 1 分鐘資料單次請求的最大天數
+    intraday_chunk_days = 7
+
+    def __init__(self, batch_chunk_size=50):
+        self.batch_chunk_size = batch_chunk_size
+
+    @staticmethod
+    def _require_data(df, ticker):
+        """空的回應改為拋出 EmptyResponseError（附上 yfinance 記錄的錯誤訊息）"""
+        if df is not None and not df.empty:
+            return df
+        import yfinance as yf
+
+        errors = getattr(getattr(yf, "shared", None), "_ERRORS", None) or {}
+        reason = errors.get(ticker.upper()) or "回傳空資料"
+        raise EmptyResponseError(f"yfinance 沒有 {ticker} 的資料: {reason}")
+
+    def get_daily_bars(self, ticker, start, end):
+        """取得 [start, end) 的日 K，沒有資料時拋出 EmptyResponseError"""
+        import yfinance as yf
+
+        return _normalize_frame(self._require_data(yf.download(ticker, start=start, end=end, progress=False), ticker))
+
+    def get_daily_bars_batch(self, tickers, start, end, chunk_size=None):
+        import yfinance as yf
+
+        frames = {}
+        for chunk in _chunks(list(tickers), chunk_size or self.batch_chunk_size):
+            try:
+                raw = yf.download(chunk, start=start, end=end, group_by="ticker", progress=False)
+            except Exception as e:
+                # 整批失敗時不回傳這批股票，由呼叫端逐檔下載
+                print(f"  ✗ 批次下載失敗（{len(chunk)} 檔）: {str(e)}")
+                continue
+            frames.update(split_ticker_frame(raw, chunk))
+        return frames
+
+    def get_intraday_bars(self, ticker, start, end):
+        """取得 [start, end) 的 1 分鐘 K 線，所有分段都沒有資料時拋出 EmptyResponseError"""
+        import yfinance as yf
+
+        start = pd.Timestamp(start)
+        end = pd.Timestamp(end)
+
+        # 超過單次上限時分段下載
+        frames = []
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_start + timedelta(days=self.intraday_chunk_days), end)
+            chunk = yf.download(ticker, start=chunk_start.strftime("%Y-%m-%d"), end=chunk_end.strftime("%Y-%m-%d"),
+                                interval="1m", progress=False)
+            if not chunk.empty:
+                frames.append(_normalize_frame(chunk))
+            chunk_start = chunk_end
+
+        if not frames:
+            self._require_data(None, ticker)
+        return pd.concat(frames)
+
+class ReplayProvider(MarketDataProvider):
+    """
+    本地檔案重播（CSV 或 Parquet），每檔股票的檔案只讀取一次
+
+    參數:
+        root: 資料夾，內含 1d/ 與 1m/ 子資料夾
+    """
+
+    name = "replay"
+
+    def __init__(self, root):
+        self.root = root
+        self.description = f"本地檔案重播 ({root})"
+        self._frames = {}
+
+    def _load(self, ticker, interval):
+        key = (ticker.upper(), interval)
+        if key not in self._frames:
+            base = os.path.join(self.root, interval, ticker.upper())
+            if os.path.exists(base + ".parquet"):
+                df = pd.read_parquet(base + ".parquet")
+            elif os.path.exists(base + ".csv"):
+                df = pd.read_csv(base + ".csv", index_col=0)
+            else:
+                df = pd.DataFrame(columns=COLUMNS)
+
+            if interval == "1m":
+                index = pd.to_datetime(df.index, utc=True).tz_convert(MARKET_TZ)
+            else:
+                index = pd.to_datetime(df.index)
+                if index.tz is not None:
+                    index = index.tz_localize(None)
+            df.index = index
+            self._frames[key] = df.sort_index()
+        return self._frames[key]
+
+    def _slice(self, df, start, end):
+        start = pd.Timestamp(start)
+        end = pd.Timestamp(end)
+        if df.index.tz is not None:
+            start = start.tz_localize(df.index.tz) if start.tz is None else start
+            end = end.tz_localize(df.index.tz) if end.tz is None else end
+        i = df.index.searchsorted(start, side="left")
+        j = df.index.searchsorted(end, side="left")
+        return df.iloc[i:j].copy()
+
+    def get_daily_bars(self, ticker, start, end):
+        return self._slice(self._load(ticker, "1d"), start, end)
+
+    def get_intraday_bars(self, ticker, start, end):
+        return self._slice(self._load(ticker, "1m"), start, end)
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    合成行情：以股票代碼為亂數種子的隨機漫步，不需要網路，結果可重現
+
+    參數:
+        latency: 每次請求的模擬延遲（秒）
+        first_date: 日 K 的第一天
+        last_date: 日 K 的最後一天（預設為今天）
+        empty_tickers: 沒有資料的股票代碼（模擬下市或代碼錯誤）
+        batch_chunk_size: 批次下載日 K 時每次請求的股票數
+    """
+
+    name = "synthetic"
+    description = "合成行情 (效能測試)"
+    supports_batch = True
+
+    # 每個交易日的 1 分鐘 K 線數（09:30 - 16:00）
+    minutes_per_session = 390
+
+    def __init__(self, latency=0.0, first_date="2015-01-02", last_date=None, empty_tickers=(), batch_chunk_size=50):
+        self.latency = latency
+        self.batch_chunk_size = batch_chunk_size
+        self.first_date = pd.Timestamp(first_date)
+        self.last_date = pd.Timestamp(last_date).normalize() if last_date else pd.Timestamp.now().normalize()
+        self.empty_tickers = {ticker.upper() for ticker in empty_tickers}
+        self._daily = {}
+
+    def _seed(self, ticker, *extra):
+        return [zlib.crc32(ticker.upper().encode()), *extra]
+
+    def _full_daily(self, ticker):
+        if ticker not in self._daily:
+            rng = np.random.default_rng(self._seed(ticker))
+            index = pd.bdate_range(self.first_date, self.last_date)
+            n = len(index)
+            close = rng.uniform(20, 500) * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+            high = close * (1 + rng.uniform(0, 0.02, n))
+            low = close * (1 - rng.uniform(0, 0.02, n))
+            self._daily[ticker] = pd.DataFrame({
+                "Open": (high + low) / 2,
+                "High": high,
+                "Low": low,
+                "Close": close,
+                "Volume": rng.integers(100_000, 10_000_000, n).astype(np.float64),
+            }, index=index)
+        return self._daily[ticker]
+
+    def _session(self, ticker, day, prev_close):
+        rng = np.random.default_rng(self._seed(ticker, day.toordinal()))
+        n = self.minutes_per_session
+        index = pd.date_range(pd.Timestamp(day).tz_localize(MARKET_TZ) + timedelta(hours=9, minutes=30),
+                              periods=n, freq="min")
+        close = prev_close * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+        return pd.DataFrame({
+            "Open": np.concatenate([[prev_close], close[:-1]]),
+            "High": close * (1 + rng.uniform(0, 0.001, n)),
+            "Low": close * (1 - rng.uniform(0, 0.001, n)),
+            "Close": close,
+            "Volume": rng.integers(100, 100_000, n).astype(np.float64),
+        }, index=index)
+
+    def get_daily_bars(self, ticker, start, end):
+        if self.latency:
+            time.sleep(self.latency)
+        if ticker.upper() in self.empty_tickers:
+            return pd.DataFrame()
+        df = self._full_daily(ticker.upper())
+        i = df.index.searchsorted(pd.Timestamp(start), side="left")
+        j = df.index.searchsorted(pd.Timestamp(end), side="left")
+        return df.iloc[i:j].copy()
+
+    def get_daily_bars_batch(self, tickers, start, end, chunk_size=None):
+        # 與 yfinance 相同：每批一次請求，回傳 (ticker, 欄位) 多層欄位後再拆開
+        frames = {}
+        for chunk in _chunks(list(tickers), chunk_size or self.batch_chunk_size):
+            if self.latency:
+                time.sleep(self.latency)
+            parts = {}
+            for ticker in chunk:
+                if ticker.upper() not in self.empty_tickers:
+                    df = self._full_daily(ticker.upper())
+                    i = df.index.searchsorted(pd.Timestamp(start), side="left")
+                    j = df.index.searchsorted(pd.Timestamp(end), side="left")
+                    parts[ticker.upper()] = df.iloc[i:j]
+            if parts:
+                frames.update(split_ticker_frame(pd.concat(parts, axis=1), chunk))
+        return frames
+
+    def get_intraday_bars(self, ticker, start, end):
+        if self.latency:
+            time.sleep(self.latency)
+        if ticker.upper() in self.empty_tickers:
+            return pd.DataFrame()
+        daily = self._full_daily(ticker.upper())
+        i = daily.index.searchsorted(pd.Timestamp(start), side="left")
+        j = daily.index.searchsorted(pd.Timestamp(end), side="left")
+        frames = [self._session(ticker, daily.index[k].date(), daily["Open"].iat[k]) for k in range(i, j)]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames)
+
+def save_replay_bars(root, ticker, interval, df):
+    """
+    把 K 線存成重播來源可讀取的 CSV（用來錄製離線資料）
+
+    參數:
+        root: 重播資料夾
+        ticker: 股票代碼
+        interval: "1d" 或 "1m"
+        df: OHLCV 資料
+    """
+    os.makedirs(os.path.join(root, interval), exist_ok=True)
+    df.reindex(columns=COLUMNS).to_csv(os.path.join(root, interval, f"{ticker.upper()}.csv"))
+
+def get_provider(spec="yfinance"):
+    """
+    依設定字串建立資料來源
+
+    參數:
+        spec: "yfinance"、"replay:<資料夾>" 或 "synthetic"
+
+    返回:
+        MarketDataProvider
+    """
+    if isinstance(spec, MarketDataProvider):
+        return spec
+    name, _, arg = spec.partition(":")
+    if name == "yfinance":
+        return YFinanceProvider()
+    if name == "replay":
+        if not arg:
+            raise ValueError("replay 資料來源需要指定資料夾，例如 replay:market_data")
+        return ReplayProvider(arg)
+    if name == "synthetic":
+        return SyntheticProvider()
+    raise ValueError(f"未知的資料來源: {spec}")
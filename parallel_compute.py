@@ -0,0 +1,199 @@
+"""
+多行程平行計算 RSI / ADX 序列與價格距離（依股票分片）
+
+資料已經快取在本地時，大量補算是 CPU 密集的工作，單一行程只能用到一個核心。
+這裡把待處理的列依股票分片給行程池，每檔股票的所有列都在同一個行程中計算：
+
+  - 所有股票的日 K 放在一塊共用記憶體（shared_memory）中：
+      [時間戳 int64 × N][OHLCV float64 × N × 5]
+    子行程以名稱連結後直接在共用記憶體上建立 DataFrame，不需要 pickle 整份資料
+  - 傳給子行程的只有每檔股票在共用記憶體中的位置與要計算的 (列號, 日期)
+  - 子行程啟動時套用主行程的設定（價格距離視窗、其他指標欄位等），回傳的結果與單一行程的結果相同，
+    由主程式合併到同一份 updates 後一次寫回
+
+用法:
+    with ParallelSequenceEngine(daily_bars, workers=4) as engine:
+        sequence_results = engine.run(sequence_rows, "sequences")
+        distances = engine.run(sequence_rows, "price_distance")
+"""
+import contextlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# 共用記憶體中的欄位順序
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# 每個行程分到的分片數（分片越多，負載越平均）
+SHARDS_PER_WORKER = 4
+
+def default_workers():
+    """預設的行程數（CPU 核心數）"""
+    return os.cpu_count() or 1
+
+def _views(buffer, total):
+    timestamps = np.ndarray((total,), dtype=np.int64, buffer=buffer)
+    values = np.ndarray((total, len(COLUMNS)), dtype=np.float64, buffer=buffer, offset=total * 8)
+    return timestamps, values
+
+class SharedBars:
+    """
+    把多檔股票的日 K 放進一塊共用記憶體
+
+    參數:
+        daily_bars: {ticker: DataFrame 或 None}
+    """
+
+    def __init__(self, daily_bars):
+        frames = {ticker: df for ticker, df in daily_bars.items() if df is not None and not df.empty}
+        self.total = sum(len(df) for df in frames.values())
+        self.layout = {}
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, self.total * 8 * (1 + len(COLUMNS))))
+
+        timestamps, values = _views(self.shm.buf, self.total)
+        start = 0
+        for ticker, df in frames.items():
+            stop = start + len(df)
+            timestamps[start:stop] = pd.DatetimeIndex(df.index).as_unit("ns").asi8
+            values[start:stop] = df.reindex(columns=COLUMNS).to_numpy(dtype=np.float64)
+            self.layout[ticker] = (start, stop)
+            start = stop
+        del timestamps, values
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+def frame_from_shared(buffer, total, start, stop):
+    """在共用記憶體上建立一檔股票的日 K DataFrame（不複製資料）"""
+    timestamps, values = _views(buffer, total)
+    index = pd.DatetimeIndex(timestamps[start:stop].view("datetime64[ns]"))
+    return pd.DataFrame(values[start:stop], index=index, columns=COLUMNS, copy=False)
+
+def _init_worker(config):
+    """
+    子行程啟動時套用主行程的設定（spawn 模式的子行程重新匯入模組，主行程中 apply_config 的覆寫不會帶過來）
+
+    參數:
+        config: calculate_indicators.applied_config
+    """
+    if config:
+        from calculate_indicators import apply_config
+
+        apply_config(config)
+
+def _compute_shard(shm_name, total, shard, part):
+    """
+    子行程：計算一個分片中所有股票的序列或價格距離
+
+    參數:
+        shm_name: 共用記憶體名稱
+        total: 共用記憶體中的 K 棒總數
+        shard: [(ticker, (start, stop) 或 None, [(idx, date), ...]), ...]
+        part: "sequences"（RSI/ADX 序列）或 "price_distance"（價格距離）
+
+    返回:
+        tuple: ([(idx, 結果 dict 或 None), ...], 子行程的輸出文字)
+    """
+    # 在子行程中才載入主程式模組（避免循環匯入，spawn 模式也能使用）
+    from calculate_indicators import calculate_price_distance_batch, calculate_rsi_adx_sequences_batch
+
+    # 行程池的子行程與主行程共用同一個 resource_tracker，由主行程負責 unlink
+    shm = shared_memory.SharedMemory(name=shm_name)
+    output = io.StringIO()
+    results = []
+    try:
+        with contextlib.redirect_stdout(output):
+            for ticker, bounds, rows in shard:
+                df = frame_from_shared(shm.buf, total, *bounds) if bounds else None
+                dates = [date for _, date in rows]
+                if part == "sequences":
+                    batch = calculate_rsi_adx_sequences_batch(ticker, dates, df, price_distance=False)
+                else:
+                    batch = calculate_price_distance_batch(ticker, dates, df)
+                # 結果中不能留下共用記憶體的視圖
+                results.extend((idx, result) for (idx, _), result in zip(rows, batch))
+                del df
+    finally:
+        shm.close()
+    return results, output.getvalue()
+
+def make_shards(sequence_rows, count):
+    """
+    依股票把列分成 count 個分片（列數多的股票先分配給目前最輕的分片）
+
+    參數:
+        sequence_rows: {ticker: [(idx, date), ...]}
+        count: 分片數
+
+    返回:
+        list: [[ticker, ...], ...]（不含空分片）
+    """
+    shards = [[] for _ in range(max(1, count))]
+    loads = [0] * len(shards)
+    for ticker, rows in sorted(sequence_rows.items(), key=lambda item: len(item[1]), reverse=True):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(ticker)
+        loads[lightest] += len(rows)
+    return [shard for shard in shards if shard]
+
+class ParallelSequenceEngine:
+    """
+    以行程池平行計算序列與價格距離（日 K 只放進共用記憶體一次，可重複執行多次）
+
+    參數:
+        daily_bars: {ticker: DataFrame 或 None}
+        workers: 行程數，預設為 CPU 核心數
+        config: 子行程啟動時以 apply_config 套用的設定（calculate_indicators.applied_config）
+    """
+
+    def __init__(self, daily_bars, workers=None, config=None):
+        self.workers = workers or default_workers()
+        self.shared = SharedBars(daily_bars)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                        initargs=(dict(config or {}),))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.shutdown()
+        self.shared.close()
+
+    def run(self, sequence_rows, part="sequences"):
+        """
+        平行計算所有列
+
+        參數:
+            sequence_rows: {ticker: [(idx, date), ...]}
+            part: "sequences" 或 "price_distance"
+
+        返回:
+            dict: {idx: 結果 dict 或 None}（與單一行程的結果相同）
+        """
+        if part not in ("sequences", "price_distance"):
+            raise ValueError("part 必須是 'sequences' 或 'price_distance'")
+
+        futures = []
+        for tickers in make_shards(sequence_rows, self.workers * SHARDS_PER_WORKER):
+            shard = [(ticker, self.shared.layout.get(ticker), sequence_rows[ticker]) for ticker in tickers]
+            futures.append(self.pool.submit(_compute_shard, self.shared.name, self.shared.total, shard, part))
+
+        results = {}
+        for future in futures:
+            shard_results, output = future.result()
+            if output:
+                print(output, end="")
+            results.update(shard_results)
+        return results
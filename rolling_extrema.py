@@ -0,0 +1,131 @@
+"""
+滾動最高/最低價索引（Sparse Table，任意視窗 O(1) 查詢）
+
+calculate_price_distance 對每一列、每個視窗都要 tail(days) 再 max()/min()，
+視窗越多、資料列越多，重複掃描的成本越高。這裡對每檔股票的收盤價只建一次索引：
+
+  - 第 k 層存放每個位置起長度 2^k 的區間最大值/最小值，建立成本 O(n log n)
+  - 查詢 [start, stop) 時取兩個長度 2^k（k = floor(log2(stop - start))）且互相重疊的區間，
+    兩者的最大值/最小值就是整個區間的結果，任意視窗長度都是 O(1)
+  - 以 fmax/fmin 合併，NaN 會被略過（與 pandas 的 max/min 相同）
+
+用法:
+    index = RollingExtremaIndex(close_values)
+    highest, lowest = index.window_extrema(ends, 60)          # 每個 ends[i] 之前 60 筆的最高/最低價
+    distances = index.price_distances(ends, 250, current)     # 距離最高/最低價的百分比
+"""
+import numpy as np
+
+class SparseTable:
+    """
+    區間最大值或最小值的 Sparse Table
+
+    參數:
+        values: 一維數值陣列
+        func: np.fmax 或 np.fmin
+    """
+
+    def __init__(self, values, func):
+        self.func = func
+        self.levels = [np.asarray(values, dtype=np.float64)]
+        span = 1
+        while span * 2 <= len(self.levels[0]):
+            previous = self.levels[-1]
+            self.levels.append(func(previous[:-span], previous[span:]))
+            span *= 2
+
+    def query(self, starts, stops):
+        """
+        查詢多個區間 [starts[i], stops[i]) 的結果（區間長度必須大於 0）
+
+        返回:
+            np.ndarray: 每個區間的最大值或最小值
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        stops = np.asarray(stops, dtype=np.int64)
+        lengths = stops - starts
+        if len(lengths) and lengths.min() <= 0:
+            raise ValueError("區間長度必須大於 0")
+
+        levels = np.floor(np.log2(np.maximum(lengths, 1))).astype(np.int64)
+        result = np.empty(len(starts), dtype=np.float64)
+        # 同一層的區間一起查詢
+        for level in np.unique(levels):
+            mask = levels == level
+            table = self.levels[level]
+            result[mask] = self.func(table[starts[mask]], table[stops[mask] - (1 << level)])
+        return result
+
+class RollingExtremaIndex:
+    """
+    一檔股票收盤價的滾動最高/最低價索引
+
+    參數:
+        values: 收盤價（依日期排序的一維陣列）
+    """
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float64)
+        self.high = SparseTable(self.values, np.fmax)
+        self.low = SparseTable(self.values, np.fmin)
+
+    def __len__(self):
+        return len(self.values)
+
+    def window_extrema(self, ends, window):
+        """
+        每個結尾位置之前 window 筆（values[end - window:end]）的最高與最低價
+
+        參數:
+            ends: 視窗的結尾位置（不包含）
+            window: 視窗長度
+
+        返回:
+            tuple: (最高價, 最低價)，資料不足 window 筆的位置為 NaN
+        """
+        ends = np.asarray(ends, dtype=np.int64)
+        highest = np.full(len(ends), np.nan)
+        lowest = np.full(len(ends), np.nan)
+        full = (ends >= window) & (ends <= len(self.values))
+        if window > 0 and full.any():
+            starts = ends[full] - window
+            highest[full] = self.high.query(starts, ends[full])
+            lowest[full] = self.low.query(starts, ends[full])
+        return highest, lowest
+
+    def price_distances(self, ends, window, current_prices, available=None):
+        """
+        計算當前價格距離過去 window 筆最高/最低價的百分比（與 calculate_price_distance 相同格式）
+
+        參數:
+            ends: 視窗的結尾位置（不包含）
+            window: 視窗長度
+            current_prices: 每個位置的當前價格（通常是昨日收盤價）
+            available: 每個位置可以使用的資料筆數（可選），不足 window 筆時為 None
+
+        返回:
+            list: dict 或 None
+        """
+        ends = np.asarray(ends, dtype=np.int64)
+        highest, lowest = self.window_extrema(ends, window)
+        current_prices = np.asarray(current_prices, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            to_high = ((current_prices - highest) / highest) * 100
+            to_low = ((current_prices - lowest) / lowest) * 100
+
+        enough = ends >= window
+        if available is not None:
+            enough &= np.asarray(available) >= window
+
+        results = []
+        for i in range(len(ends)):
+            if not enough[i]:
+                results.append(None)
+                continue
+            results.append({
+                "最高價": round(highest[i], 2),
+                "最低價": round(lowest[i], 2),
+                "距離最高價(%)": round(to_high[i], 1),
+                "距離最低價(%)": round(to_low[i], 1)
+            })
+        return results
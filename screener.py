@@ -0,0 +1,345 @@
+"""
+全市場篩選（以 股票 x 時間 的 NumPy 矩陣一次計算所有股票的指標）
+
+工作表只計算已經輸入的列；篩選模式讀取一份股票清單（數千檔），對下一個交易日計算與工作表相同的特徵：
+
+  - RSI / ADX：與 calculate_rsi / calculate_adx 相同的 rolling mean 定義，但在整個矩陣上沿時間軸計算
+  - 5 / 30 / 120 日價格距離：與 calculate_price_distance 相同（PRICE_DISTANCE_WINDOWS 的所有視窗）
+
+每檔股票取開盤日期之前下載區間內的日 K，靠右對齊放進 (股票數 x K 棒數) 的矩陣（最後一欄是昨日），
+上市較晚、K 棒較少的股票左側補 NaN；NaN 在滾動平均中傳遞，所以每檔股票的結果與逐檔計算相同。
+之後依規則（例如 RSI < 30、ADX > 25）過濾並排序，整個篩選只有幾次矩陣運算。
+
+用法:
+    python cli.py screen universe.txt --rule "RSI < 30" --rule "ADX > 25" --sort ADX --desc --top 50
+    python cli.py screen universe.txt --offline           # 只使用本地 K 線快取，不連網
+"""
+import operator
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+import bar_cache
+import calculate_indicators as ci
+from fetch_pool import ConcurrentFetcher
+
+# RSI / ADX 的週期（與 calculate_rsi_adx_sequences_batch 相同）
+INDICATOR_PERIOD = 14
+
+# 預設的排序欄位（前面加 - 表示由大到小）
+DEFAULT_SORT = "RSI"
+
+# 規則的比較運算子
+RULE_OPERATORS = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+_RULE_PATTERN = re.compile(r"^\s*(.+?)\s*(<=|>=|==|!=|<|>)\s*(-?\d+(?:\.\d+)?)\s*$")
+
+class UniverseBars:
+    """
+    多檔股票的日 K 矩陣（每列一檔股票，靠右對齊：最後一欄是開盤日期前一個交易日）
+
+    參數:
+        daily_bars: {ticker: 日 K DataFrame}
+        session_date: 開盤日期，只使用這一天之前、下載區間內的 K 棒
+    """
+
+    def __init__(self, daily_bars, session_date):
+        session = pd.Timestamp(session_date).normalize()
+        fetch_start, _ = ci.daily_fetch_window(session)
+        bounds = pd.DatetimeIndex([fetch_start, session]).as_unit("ns").asi8
+
+        slices = {}
+        for ticker, df in daily_bars.items():
+            if df is None or df.empty:
+                continue
+            # 與 calculate_rsi_adx_sequences_batch 相同，以 UTC 奈秒時間戳比較
+            index = df.index if isinstance(df.index, pd.DatetimeIndex) else pd.DatetimeIndex(df.index)
+            index_ns = index.as_unit("ns").asi8
+            i, j = np.searchsorted(index_ns, bounds, side="left")
+            if j > i:
+                slices[ticker] = (df, i, j)
+
+        self.session_date = session
+        self.tickers = np.array(list(slices), dtype=object)
+        self.counts = np.array([j - i for _, i, j in slices.values()], dtype=np.int64)
+        length = int(self.counts.max()) if len(self.counts) else 0
+        self.high = np.full((len(slices), length), np.nan)
+        self.low = np.full((len(slices), length), np.nan)
+        self.close = np.full((len(slices), length), np.nan)
+        self.last_dates = []
+        for row, (df, i, j) in enumerate(slices.values()):
+            # 整個 DataFrame 轉成陣列再取欄位（日 K 快取是單一 float64 區塊，不需要複製）
+            values = df.to_numpy(dtype=np.float64)[i:j]
+            columns = list(df.columns)
+            high, low, close = columns.index("High"), columns.index("Low"), columns.index("Close")
+            self.high[row, length - (j - i):] = values[:, high]
+            self.low[row, length - (j - i):] = values[:, low]
+            self.close[row, length - (j - i):] = values[:, close]
+            self.last_dates.append(df.index[j - 1])
+
+    def __len__(self):
+        return len(self.tickers)
+
+def rolling_mean(matrix, period):
+    """
+    沿時間軸（axis=1）的滑動平均，與 pandas rolling(period).mean() 相同：視窗內有 NaN 時為 NaN
+
+    參數:
+        matrix: (股票數 x 時間) 陣列
+        period: 視窗長度
+
+    返回:
+        ndarray: 同樣形狀的陣列，前 period - 1 欄為 NaN
+    """
+    result = np.full(matrix.shape, np.nan)
+    if matrix.shape[1] >= period:
+        windows = np.lib.stride_tricks.sliding_window_view(matrix, period, axis=1)
+        result[:, period - 1:] = windows.sum(axis=-1) / period
+    return result
+
+def _shift(matrix):
+    """沿時間軸往後移一欄（第一欄為 NaN），與 Series.shift() 相同"""
+    shifted = np.full(matrix.shape, np.nan)
+    shifted[:, 1:] = matrix[:, :-1]
+    return shifted
+
+def rsi_matrix(close, period=INDICATOR_PERIOD):
+    """
+    計算整個矩陣的 RSI（與 calculate_rsi 相同）
+
+    參數:
+        close: (股票數 x 時間) 收盤價，左側補的 NaN 表示沒有 K 棒
+        period: RSI 週期
+
+    返回:
+        ndarray: 同樣形狀的 RSI 矩陣
+    """
+    padding = np.isnan(close)
+    delta = close - _shift(close)
+    # 與 delta.where(delta > 0, 0) 相同：第一根 K 棒的 NaN 變動視為 0；補上的欄位維持 NaN
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    gain[padding] = np.nan
+    loss[padding] = np.nan
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = rolling_mean(gain, period) / rolling_mean(loss, period)
+        return 100 - (100 / (1 + rs))
+
+def adx_matrix(high, low, close, period=INDICATOR_PERIOD):
+    """
+    計算整個矩陣的 ADX（與 calculate_adx 相同）
+
+    參數:
+        high, low, close: (股票數 x 時間) 最高價、最低價、收盤價
+        period: ADX 週期
+
+    返回:
+        ndarray: 同樣形狀的 ADX 矩陣
+    """
+    padding = np.isnan(close)
+    prev_close = _shift(close)
+    # 與 concat(...).max(axis=1) 相同：略過 NaN（第一根 K 棒的 TR 為最高價 - 最低價）
+    tr = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+
+    up_move = high - _shift(high)
+    down_move = _shift(low) - low
+    plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+    minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+    plus_dm[padding] = np.nan
+    minus_dm[padding] = np.nan
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        atr = rolling_mean(tr, period)
+        plus_di = 100 * (rolling_mean(plus_dm, period) / atr)
+        minus_di = 100 * (rolling_mean(minus_dm, period) / atr)
+        dx = 100 * np.abs(plus_di - minus_di) / (plus_di + minus_di)
+    return rolling_mean(dx, period)
+
+def price_distance_matrix(close, days):
+    """
+    最後一欄收盤價距離最近 days 欄最高/最低價的百分比（與 calculate_price_distance 相同）
+
+    參數:
+        close: (股票數 x 時間) 收盤價（靠右對齊）
+        days: 回溯的交易日數
+
+    返回:
+        tuple: (距離最高價(%), 距離最低價(%))，K 棒不足 days 根的股票為 NaN
+    """
+    if close.shape[1] < days:
+        missing = np.full(len(close), np.nan)
+        return missing, missing.copy()
+    # 靠右對齊時，K 棒不足的股票在視窗內有 NaN，max/min 直接得到 NaN
+    recent = close[:, -days:]
+    highest = recent.max(axis=1)
+    lowest = recent.min(axis=1)
+    current = close[:, -1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.round((current - highest) / highest * 100, 1), np.round((current - lowest) / lowest * 100, 1)
+
+def feature_names(windows=None):
+    """篩選可以使用的特徵名稱（compute_features 的數值欄位）"""
+    if windows is None:
+        windows = ci.PRICE_DISTANCE_WINDOWS
+    names = ["昨日收盤價", "RSI", "ADX"]
+    for days in sorted(set(windows.values())):
+        names += [f"{days}日高價距離", f"{days}日低價距離"]
+    return names
+
+def compute_features(universe, windows=None):
+    """
+    計算篩選用的特徵（每檔股票在開盤日期前一個交易日的值）
+
+    參數:
+        universe: UniverseBars
+        windows: {結果鍵: 交易日數}，預設為 PRICE_DISTANCE_WINDOWS
+
+    返回:
+        DataFrame: 以股票代碼為索引，欄位為 昨日日期、昨日收盤價、RSI、ADX 與各視窗的
+                   「N日高價距離」/「N日低價距離」
+    """
+    if windows is None:
+        windows = ci.PRICE_DISTANCE_WINDOWS
+
+    columns = {"昨日日期": universe.last_dates}
+    if not len(universe):
+        columns.update({name: [] for name in feature_names(windows)})
+    else:
+        columns["昨日收盤價"] = np.round(universe.close[:, -1], 2)
+        columns["RSI"] = np.round(rsi_matrix(universe.close)[:, -1], 1)
+        columns["ADX"] = np.round(adx_matrix(universe.high, universe.low, universe.close)[:, -1], 1)
+        for days in sorted(set(windows.values())):
+            to_high, to_low = price_distance_matrix(universe.close, days)
+            columns[f"{days}日高價距離"] = to_high
+            columns[f"{days}日低價距離"] = to_low
+    return pd.DataFrame(columns, index=pd.Index(universe.tickers, name="股票代碼"))
+
+def parse_rule(text):
+    """
+    解析篩選規則（例如 "RSI < 30"、"30日低價距離 <= 5"）
+
+    返回:
+        tuple: (特徵名稱, 運算子函式, 門檻值)
+
+    例外:
+        ValueError: 格式錯誤
+    """
+    match = _RULE_PATTERN.match(text)
+    if match is None:
+        raise ValueError(f"無法解析規則: {text!r}（格式為「特徵 運算子 數值」，例如 RSI < 30）")
+    name, op, value = match.groups()
+    return name, RULE_OPERATORS[op], float(value)
+
+def apply_rules(features, rules=(), sort=DEFAULT_SORT, top=None):
+    """
+    依規則過濾並排序（所有規則都要成立；特徵為 NaN 的股票不符合任何規則）
+
+    參數:
+        features: compute_features 的結果
+        rules: 規則字串列表
+        sort: 排序欄位，前面加 - 表示由大到小（例如 "-ADX"），None 表示不排序
+        top: 只保留前幾名，None 表示全部
+
+    返回:
+        DataFrame: 符合條件的股票
+
+    例外:
+        ValueError: 規則格式錯誤或特徵不存在
+    """
+    names = list(features.columns[1:])
+    conditions = [parse_rule(rule) for rule in rules]
+    for name in [name for name, _, _ in conditions] + ([sort.lstrip("-")] if sort else []):
+        if name not in names:
+            raise ValueError(f"未知的特徵: {name}（可用的特徵: {', '.join(names)}）")
+
+    mask = np.ones(len(features), dtype=bool)
+    for name, compare, value in conditions:
+        mask &= compare(features[name].to_numpy(dtype=np.float64), value)
+    selected = features[mask]
+
+    if sort:
+        name = sort.lstrip("-")
+        selected = selected.sort_values(name, ascending=not sort.startswith("-"), na_position="last", kind="stable")
+    return selected.head(top) if top else selected
+
+def load_universe_bars(tickers, session_date, offline=False):
+    """
+    取得篩選所需的日 K（daily_fetch_window：開盤日期之前 required_sessions() 個交易日）
+
+    網路來源先以批次請求下載快取缺少的區間，快取或批次已涵蓋的股票直接讀取（不經過限速），
+    其餘股票才逐檔並行下載；offline=True 時只讀取本地 K 線快取。
+
+    參數:
+        tickers: 股票代碼列表
+        session_date: 開盤日期
+        offline: 是否只使用本地快取
+
+    返回:
+        dict: {ticker: 日 K DataFrame}
+    """
+    fetch_start, fetch_end = ci.daily_fetch_window(session_date)
+    provider = ci.market_data_provider
+    if offline and provider.is_remote:
+        return {ticker: bar_cache.read_cached_bars(ticker, "1d") for ticker in tickers}
+
+    fetcher = ConcurrentFetcher(ci.load_daily_bars, max_workers=ci.FETCH_MAX_WORKERS,
+                                rate=None, max_retries=ci.FETCH_MAX_RETRIES)
+    return ci.fetch_daily_bars({ticker: (fetch_start, fetch_end) for ticker in tickers}, fetcher)
+
+def run_screen(tickers, session_date=None, rules=(), sort=DEFAULT_SORT, top=None, offline=False, output=None):
+    """
+    篩選股票清單並顯示結果
+
+    參數:
+        tickers: 股票代碼列表
+        session_date: 開盤日期，預設為今天
+        rules: 規則字串列表
+        sort: 排序欄位（前面加 - 表示由大到小）
+        top: 只顯示前幾名
+        offline: 是否只使用本地 K 線快取
+        output: 另存結果的 CSV 路徑（可選）
+
+    返回:
+        DataFrame: 符合條件的股票
+    """
+    session = pd.Timestamp(session_date if session_date is not None else pd.Timestamp.now()).normalize()
+    # 先以空的特徵表檢查規則與排序欄位，避免下載完才發現錯誤
+    apply_rules(pd.DataFrame(columns=["昨日日期"] + feature_names()), rules, sort=sort)
+
+    print(f"篩選 {len(tickers)} 檔股票（開盤日期 {session.date()}）")
+    start_time = time.perf_counter()
+    daily_bars = load_universe_bars(tickers, session, offline=offline)
+    load_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    universe = UniverseBars(daily_bars, session)
+    features = compute_features(universe)
+    selected = apply_rules(features, rules, sort=sort)
+    compute_seconds = time.perf_counter() - start_time
+
+    print(f"  讀取日 K: {load_seconds:.2f} 秒，計算與篩選: {compute_seconds:.2f} 秒"
+          f"（{len(universe)} 檔有資料，矩陣 {universe.close.shape[0]} x {universe.close.shape[1]}）")
+    missing = len(tickers) - len(universe)
+    if missing:
+        print(f"  ⚠ {missing} 檔股票在 {session.date()} 之前沒有資料")
+
+    print(f"\n符合條件: {len(selected)} 檔" + (f"（規則: {' 且 '.join(rules)}）" if rules else ""))
+    if top:
+        selected = selected.head(top)
+    if len(selected):
+        display = selected.copy()
+        display["昨日日期"] = [date.strftime("%Y-%m-%d") for date in display["昨日日期"]]
+        print(display.to_string())
+    if output:
+        selected.to_csv(output, encoding="utf-8-sig")
+        print(f"\n✓ 已儲存到 {output}")
+    return selected
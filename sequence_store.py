@@ -0,0 +1,135 @@
+"""
+RSI / ADX 序列的二進位側存檔（.npz）
+
+工作表中每格存 `str(list)` 最多 120 個數字，讓檔案變大、讀取變慢，分析前還得先解析字串。
+啟用側存檔後，序列以 float32 矩陣存在 .npz 中，以 (股票代碼, 開盤日期) 為鍵：
+  tickers   : (N,)   股票代碼
+  dates     : (N,)   開盤日期（datetime64[D]）
+  rsi_5 ... : (N, L) float32，長度不足的序列右側補 NaN
+  *_len     : (N,)   每列實際序列長度
+
+讀取時每種序列直接是一個 2-D 陣列，不需要解析字串。
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# 結果 dict 的鍵 -> (npz 中的陣列名稱, 序列長度)
+SEQUENCE_FIELDS = {
+    "RSI_5天": ("rsi_5", 5),
+    "RSI_30天": ("rsi_30", 30),
+    "RSI_180天": ("rsi_120", 120),
+    "ADX_5天": ("adx_5", 5),
+    "ADX_30天": ("adx_30", 30),
+    "ADX_180天": ("adx_120", 120),
+}
+
+def _key(ticker, date):
+    return str(ticker).strip().upper(), np.datetime64(pd.Timestamp(date).date(), "D")
+
+def load_sequences(path):
+    """
+    讀取側存檔
+
+    參數:
+        path: .npz 檔案路徑
+
+    返回:
+        dict: {"tickers", "dates", 各序列矩陣, 各序列長度}，檔案不存在時為 None
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+def load_sequence_matrix(path, field):
+    """
+    讀取某一種序列的 2-D 矩陣
+
+    參數:
+        path: .npz 檔案路徑
+        field: 結果 dict 的鍵（例如 "RSI_30天"）或陣列名稱（例如 "rsi_30"）
+
+    返回:
+        tuple: (keys DataFrame[ticker, date], float32 矩陣)
+    """
+    name = SEQUENCE_FIELDS[field][0] if field in SEQUENCE_FIELDS else field
+    data = load_sequences(path)
+    if data is None:
+        return pd.DataFrame(columns=["ticker", "date"]), np.empty((0, 0), dtype=np.float32)
+    keys = pd.DataFrame({"ticker": data["tickers"], "date": data["dates"]})
+    return keys, data[name]
+
+def save_sequences(path, results):
+    """
+    把序列寫入側存檔（與既有資料合併，相同鍵以新資料為準）
+
+    參數:
+        path: .npz 檔案路徑
+        results: {(ticker, date): 結果 dict}（calculate_rsi_adx_sequences 的回傳格式），
+                 或逐筆產生 ((ticker, date), 結果 dict) 的可疊代物件（例如從更新日誌串流讀出）
+
+    返回:
+        int: 檔案中的總筆數（沒有新資料時不改寫檔案）
+    """
+    rows = {}
+
+    existing = load_sequences(path)
+    if existing is not None:
+        for i, key in enumerate(zip(existing["tickers"].tolist(), existing["dates"])):
+            rows[key] = {
+                name: existing[name][i, :existing[name + "_len"][i]]
+                for name, _ in SEQUENCE_FIELDS.values()
+            }
+
+    added = 0
+    for (ticker, date), result in (results.items() if isinstance(results, dict) else results):
+        rows[_key(ticker, date)] = {
+            name: np.asarray(result[field], dtype=np.float32)[-length:]
+            for field, (name, length) in SEQUENCE_FIELDS.items()
+        }
+        added += 1
+    if not added:
+        return len(rows)
+
+    keys = sorted(rows)
+    arrays = {
+        "tickers": np.array([ticker for ticker, _ in keys], dtype=str),
+        "dates": np.array([date for _, date in keys], dtype="datetime64[D]"),
+    }
+    for name, length in SEQUENCE_FIELDS.values():
+        matrix = np.full((len(keys), length), np.nan, dtype=np.float32)
+        lengths = np.zeros(len(keys), dtype=np.int16)
+        for i, key in enumerate(keys):
+            values = rows[key][name]
+            matrix[i, :len(values)] = values
+            lengths[i] = len(values)
+        arrays[name] = matrix
+        arrays[name + "_len"] = lengths
+
+    # 先寫暫存檔再取代，避免中斷時留下壞檔
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return len(keys)
+
+def get_sequences(path, ticker, date):
+    """
+    讀取單一 (股票代碼, 開盤日期) 的所有序列
+
+    返回:
+        dict: {結果 dict 的鍵: list}（四捨五入到 1 位小數），找不到時為 None
+    """
+    data = load_sequences(path)
+    if data is None:
+        return None
+    ticker, day = _key(ticker, date)
+    match = np.flatnonzero((data["tickers"] == ticker) & (data["dates"] == day))
+    if len(match) == 0:
+        return None
+    i = match[-1]
+    return {
+        field: data[name][i, :data[name + "_len"][i]].astype(np.float64).round(1).tolist()
+        for field, (name, _) in SEQUENCE_FIELDS.items()
+    }
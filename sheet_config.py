@@ -0,0 +1,192 @@
+"""
+工作表欄位設定與設定檔（只使用標準函式庫，載入很快）
+
+檔案路徑、欄位名稱與價格距離視窗的預設值都在這裡；放在工作目錄的 indicators.json
+（或以 --config 指定的檔案）可以覆寫其中任何一項，不需要修改程式：
+
+  {
+      "file": "量化交易.xlsx",
+      "sheet": "資料庫",
+      "ticker_column": "公司代碼",
+      "date_columns": ["開盤日期(台灣時間)", "開盤日期"],
+      "price_distance_windows": {"價格距離_5日": 5, "價格距離_60日": 60},
+      "sequence_columns": {"5天 RSI 序列": "RSI_5天"},
+      "provider": "replay:./replay_data"
+  }
+
+欄位對應（sequence_columns / price_distance_columns / intraday_price_columns / indicator_columns）整組取代預設值，
+價格距離欄位的值為 [結果鍵, 子鍵]（子鍵為 null 表示直接寫入結果值），
+其他指標欄位的值為 [指標, 序列長度]，例如 "5天 ATR 序列": ["ATR(14)", 5]（指標格式見 indicator_registry.py）。
+"""
+import json
+import math
+import os
+
+# 預設的設定檔（存在時自動載入）
+DEFAULT_CONFIG_FILE = "indicators.json"
+
+# 預設的工作簿與工作表
+INPUT_FILE = "量化交易.xlsx"
+SHEET_NAME = "資料庫"
+
+# 股票代碼欄位與開盤日期欄位（依序尋找第一個存在的名稱）
+TICKER_COLUMN = '公司代碼'
+DATE_COLUMNS = ['開盤日期(台灣時間)', '開盤日期', '日期', '交易日期']
+
+# 以台灣時間記錄的日期欄位（含時間的值會轉成對應的美國交易日，見 trading_calendar.us_session_date）
+TAIWAN_TIME_DATE_COLUMNS = ['開盤日期(台灣時間)']
+
+# 價格距離的視窗：結果 dict 的鍵 -> 交易日數
+# 可以加入更多視窗（例如 "價格距離_60日": 60），每個視窗都從同一份滾動最高/最低價索引 O(1) 查詢
+PRICE_DISTANCE_WINDOWS = {
+    "價格距離_5日": 5,
+    "價格距離_30日": 30,
+    "價格距離_180日": 120,
+}
+
+# RSI/ADX 序列欄位 -> 結果 dict 的鍵
+SEQUENCE_COLUMNS = {
+    '5天 RSI 序列': 'RSI_5天',
+    '1個月 RSI 序列': 'RSI_30天',
+    '6個月 RSI 序列': 'RSI_180天',
+    '5天 ADX 序列': 'ADX_5天',
+    '1個月 ADX 序列': 'ADX_30天',
+    '6個月 ADX 序列': 'ADX_180天'
+}
+
+# 其他指標欄位（可選）：欄位 -> (指標, 序列長度)，長度為 1 時只寫入最近一天的值
+# 指標以 indicator_registry 的格式指定，例如
+#   '5天 ATR 序列': ('ATR(14)', 5),
+#   'MACD 柱狀體': ('MACD(12,26,9).hist', 1),
+#   '布林通道上緣': ('BOLL(20,2).upper', 1),
+INDICATOR_COLUMNS = {}
+
+# 價格距離欄位（可選）
+PRICE_DISTANCE_COLUMNS = {
+    '5日高價距離 (%)': ('價格距離_5日', '距離最高價(%)'),
+    '5日低價距離 (%)': ('價格距離_5日', '距離最低價(%)'),
+    '1個月高價距離 (%)': ('價格距離_30日', '距離最高價(%)'),
+    '1個月低價距離 (%)': ('價格距離_30日', '距離最低價(%)'),
+    '6個月高價距離 (%)': ('價格距離_180日', '距離最高價(%)'),
+    '6個月低價距離 (%)': ('價格距離_180日', '距離最低價(%)'),
+    '*昨日收盤價': ('昨日收盤價', None),
+    '昨日收盤價': ('昨日收盤價', None)  # 支援兩種名稱
+}
+
+# 盤中價格欄位（可選）
+INTRADAY_PRICE_COLUMNS = {
+    '*開盤價格': ('盤中價格', '開盤價'),
+    '開盤價格': ('盤中價格', '開盤價'),
+    '*10分鐘最低價': ('盤中價格', '10分鐘最低價'),
+    '10分鐘最低價': ('盤中價格', '10分鐘最低價'),
+    '*1.5小時最高價': ('盤中價格', '1.5小時最高價'),
+    '1.5小時最高價': ('盤中價格', '1.5小時最高價'),
+    '*最高價前的最低價': ('盤中價格', '最高價前的最低價'),
+    '最高價前的最低價': ('盤中價格', '最高價前的最低價')
+}
+
+# 設定檔可以使用的鍵 -> 值的型別
+CONFIG_KEYS = {
+    "file": str,
+    "sheet": str,
+    "ticker_column": str,
+    "date_columns": list,
+    "price_distance_windows": dict,
+    "sequence_columns": dict,
+    "price_distance_columns": dict,
+    "intraday_price_columns": dict,
+    "indicator_columns": dict,
+    "provider": str,
+    "parallel_workers": int,
+    "stream_workbook": bool,
+    "stream_chunk_rows": int,
+    "sequence_sidecar_file": (str, type(None)),
+    "checkpoint_every_rows": int,
+}
+
+def load_config(path=None):
+    """
+    讀取設定檔
+
+    參數:
+        path: 設定檔路徑，None 表示使用 DEFAULT_CONFIG_FILE（不存在時回傳空 dict）
+
+    返回:
+        dict: 設定值（只含設定檔中有的鍵），價格距離與盤中欄位的值轉成 tuple
+
+    例外:
+        ValueError: 設定檔格式錯誤、有未知的鍵或值的型別不符
+    """
+    if path is None:
+        path = DEFAULT_CONFIG_FILE
+        if not os.path.exists(path):
+            return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"無法讀取設定檔 {path}: {e}")
+    if not isinstance(config, dict):
+        raise ValueError(f"設定檔 {path} 必須是 JSON 物件")
+
+    for key, value in config.items():
+        if key not in CONFIG_KEYS:
+            raise ValueError(f"設定檔 {path} 有未知的設定: {key}（可用的設定: {', '.join(CONFIG_KEYS)}）")
+        if not isinstance(value, CONFIG_KEYS[key]) or (CONFIG_KEYS[key] is int and isinstance(value, bool)):
+            raise ValueError(f"設定檔 {path} 的 {key} 型別錯誤: {value!r}")
+
+    for key in ("price_distance_columns", "intraday_price_columns", "indicator_columns"):
+        if key in config:
+            config[key] = {col_name: tuple(mapping) for col_name, mapping in config[key].items()}
+    return config
+
+def window_columns(windows, columns):
+    """
+    加上額外價格距離視窗的欄位
+
+    PRICE_DISTANCE_COLUMNS 沒有對應欄位的視窗使用「N日高價距離 (%)」/「N日低價距離 (%)」欄位。
+
+    參數:
+        windows: {結果鍵: 交易日數}
+        columns: 價格距離欄位 {欄位名稱: (結果鍵, 子鍵)}
+
+    返回:
+        dict: 新的價格距離欄位 dict
+    """
+    columns = dict(columns)
+    mapped = {key for key, _ in columns.values()}
+    for key, days in windows.items():
+        if key not in mapped:
+            columns[f'{days}日高價距離 (%)'] = (key, '距離最高價(%)')
+            columns[f'{days}日低價距離 (%)'] = (key, '距離最低價(%)')
+    return columns
+
+def has_value(value, empty_values=('', 'nan')):
+    """儲存格是否有資料（None、NaN 與 empty_values 視為空白）"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return False
+    return str(value).strip() not in empty_values
+
+def pending_items(value_of, columns, sequence_columns, price_distance_columns, intraday_price_columns):
+    """
+    判斷一列需要計算的項目（已有資料的欄位不再計算）
+
+    參數:
+        value_of: 取得該列某個欄位值的函式 value_of(欄位名稱)
+        columns: 工作表中存在的欄位名稱
+        sequence_columns, price_distance_columns, intraday_price_columns: 欄位對應
+
+    返回:
+        tuple: (need_rsi_adx, need_price_dist, need_intraday)
+    """
+    # 任一序列欄位是空的就重新計算 RSI/ADX
+    need_rsi_adx = not all(has_value(value_of(col), ('', '[]', 'nan')) for col in sequence_columns)
+
+    # 價格距離看昨日收盤價欄位、盤中數據看開盤價欄位（有多個名稱時使用第一個存在的）
+    yesterday_close_col = next((col for col, (key, sub_key) in price_distance_columns.items()
+                                if key == '昨日收盤價' and sub_key is None and col in columns), None)
+    open_price_col = next((col for col, (_, sub_key) in intraday_price_columns.items()
+                           if sub_key == '開盤價' and col in columns), None)
+    need_price_dist = yesterday_close_col is not None and not has_value(value_of(yesterday_close_col))
+    need_intraday = open_price_col is not None and not has_value(value_of(open_price_col))
+    return need_rsi_adx, need_price_dist, need_intraday
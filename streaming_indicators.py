@@ -0,0 +1,272 @@
+"""
+串流式 RSI / ADX 計算引擎（每根新 K 棒 O(1) 更新）
+
+每檔股票保存一份狀態（前一根 K 棒、平滑後的 gain/loss、TR、+DM/-DM、DX），
+新 K 棒進來時只更新狀態，不必重算整段歷史。狀態可序列化成 JSON，下次執行時還原。
+
+兩種模式:
+  - "sma"   : 與 calculate_rsi / calculate_adx 相同（rolling mean），結果可直接對照工作表
+  - "wilder": Wilder 平滑，與 TA-Lib 的 RSI / ADX 相同，可用 talib 驗證
+"""
+import json
+import math
+import os
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+MODES = ("sma", "wilder")
+
+# TA-Lib 的 TA_IS_ZERO 門檻
+_EPSILON = 1e-8
+
+def _div(a, b):
+    """與 NumPy 相同語意的除法（除以 0 得到 inf 或 NaN，不拋例外）"""
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a)
+    return a / b
+
+class _RollingMean:
+    """固定長度的滑動平均（與 pandas rolling(window).mean() 相同：視窗內有 NaN 時為 NaN）"""
+
+    def __init__(self, window, values=(), total=0.0, nan_count=0):
+        self.window = window
+        self.values = deque(values, maxlen=window)
+        self.total = total
+        self.nan_count = nan_count
+
+    def push(self, value):
+        if len(self.values) == self.window:
+            old = self.values[0]
+            if math.isnan(old):
+                self.nan_count -= 1
+            else:
+                self.total -= old
+        self.values.append(value)
+        if math.isnan(value):
+            self.nan_count += 1
+        else:
+            self.total += value
+        if len(self.values) < self.window or self.nan_count > 0:
+            return math.nan
+        return self.total / self.window
+
+    def to_dict(self):
+        return {"values": list(self.values), "total": self.total, "nan_count": self.nan_count}
+
+    @classmethod
+    def from_dict(cls, window, data):
+        return cls(window, data["values"], data["total"], data["nan_count"])
+
+class StreamingIndicatorEngine:
+    """
+    多檔股票的串流 RSI / ADX 引擎
+
+    參數:
+        period: 指標週期（預設 14）
+        mode: "sma"（與 calculate_rsi / calculate_adx 相同）或 "wilder"（與 TA-Lib 相同）
+
+    用法:
+        engine = StreamingIndicatorEngine()
+        engine.warm_up("NVDA", daily_df)              # 用歷史資料建立狀態
+        rsi, adx = engine.update("NVDA", high, low, close)
+        engine.save("indicator_state.json")
+    """
+
+    def __init__(self, period=14, mode="sma"):
+        if mode not in MODES:
+            raise ValueError(f"mode 必須是 {MODES} 之一")
+        self.period = period
+        self.mode = mode
+        self._states = {}
+
+    def tickers(self):
+        return list(self._states)
+
+    def latest(self, ticker):
+        """回傳最近一次的 (RSI, ADX)，尚未有狀態時為 (NaN, NaN)"""
+        state = self._states.get(ticker)
+        if state is None:
+            return math.nan, math.nan
+        return state["rsi"], state["adx"]
+
+    def reset(self, ticker):
+        self._states.pop(ticker, None)
+
+    def _new_state(self):
+        state = {"bars": 0, "prev_high": None, "prev_low": None, "prev_close": None,
+                 "rsi": math.nan, "adx": math.nan}
+        if self.mode == "sma":
+            state.update({name: _RollingMean(self.period)
+                          for name in ("gain", "loss", "tr", "plus_dm", "minus_dm", "dx")})
+        else:
+            state.update({"avg_gain": 0.0, "avg_loss": 0.0, "tr_sum": 0.0,
+                          "plus_dm_sum": 0.0, "minus_dm_sum": 0.0, "dx_sum": 0.0, "adx_value": math.nan})
+        return state
+
+    def update(self, ticker, high, low, close):
+        """
+        加入一根新的 K 棒並更新指標（O(1)）
+
+        參數:
+            ticker: 股票代碼
+            high, low, close: 該 K 棒的最高價、最低價、收盤價
+
+        返回:
+            tuple: (RSI, ADX)，暖機期間為 NaN
+        """
+        state = self._states.get(ticker)
+        if state is None:
+            state = self._states[ticker] = self._new_state()
+
+        high, low, close = float(high), float(low), float(close)
+        if state["prev_close"] is None:
+            delta = up_move = down_move = math.nan
+            tr = high - low
+        else:
+            delta = close - state["prev_close"]
+            up_move = high - state["prev_high"]
+            down_move = state["prev_low"] - low
+            tr = max(high - low, abs(high - state["prev_close"]), abs(low - state["prev_close"]))
+
+        plus_dm = up_move if (up_move > down_move and up_move > 0) else 0.0
+        minus_dm = down_move if (down_move > up_move and down_move > 0) else 0.0
+
+        if self.mode == "sma":
+            self._update_sma(state, delta, tr, plus_dm, minus_dm)
+        else:
+            self._update_wilder(state, delta, tr, plus_dm, minus_dm)
+
+        state["bars"] += 1
+        state["prev_high"], state["prev_low"], state["prev_close"] = high, low, close
+        return state["rsi"], state["adx"]
+
+    def _update_sma(self, state, delta, tr, plus_dm, minus_dm):
+        # 與 calculate_rsi 相同：第一根的 delta 為 NaN，視為 0
+        gain = state["gain"].push(delta if delta > 0 else 0.0)
+        loss = state["loss"].push(-delta if delta < 0 else 0.0)
+        state["rsi"] = 100 - _div(100, 1 + _div(gain, loss))
+
+        # 與 calculate_adx 相同
+        atr = state["tr"].push(tr)
+        plus_di = 100 * _div(state["plus_dm"].push(plus_dm), atr)
+        minus_di = 100 * _div(state["minus_dm"].push(minus_dm), atr)
+        dx = 100 * _div(abs(plus_di - minus_di), plus_di + minus_di)
+        state["adx"] = state["dx"].push(dx)
+
+    def _update_wilder(self, state, delta, tr, plus_dm, minus_dm):
+        period = self.period
+        bar = state["bars"]
+        if bar == 0:
+            return
+
+        # RSI：前 period 根取平均，之後 Wilder 平滑（TA-Lib TA_RSI）
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        if bar < period:
+            state["avg_gain"] += gain
+            state["avg_loss"] += loss
+        elif bar == period:
+            state["avg_gain"] = (state["avg_gain"] + gain) / period
+            state["avg_loss"] = (state["avg_loss"] + loss) / period
+        else:
+            state["avg_gain"] = (state["avg_gain"] * (period - 1) + gain) / period
+            state["avg_loss"] = (state["avg_loss"] * (period - 1) + loss) / period
+        if bar >= period:
+            total = state["avg_gain"] + state["avg_loss"]
+            state["rsi"] = 100.0 * state["avg_gain"] / total if abs(total) >= _EPSILON else 0.0
+
+        # ADX：前 period-1 根累加 TR/DM，之後 Wilder 平滑（TA-Lib TA_ADX）
+        if bar < period:
+            state["tr_sum"] += tr
+            state["plus_dm_sum"] += plus_dm
+            state["minus_dm_sum"] += minus_dm
+            return
+
+        state["tr_sum"] = state["tr_sum"] - state["tr_sum"] / period + tr
+        state["plus_dm_sum"] = state["plus_dm_sum"] - state["plus_dm_sum"] / period + plus_dm
+        state["minus_dm_sum"] = state["minus_dm_sum"] - state["minus_dm_sum"] / period + minus_dm
+
+        dx = None
+        if abs(state["tr_sum"]) >= _EPSILON:
+            plus_di = 100.0 * state["plus_dm_sum"] / state["tr_sum"]
+            minus_di = 100.0 * state["minus_dm_sum"] / state["tr_sum"]
+            di_total = plus_di + minus_di
+            if abs(di_total) >= _EPSILON:
+                dx = 100.0 * abs(minus_di - plus_di) / di_total
+
+        if bar < 2 * period - 1:
+            state["dx_sum"] += dx or 0.0
+        elif bar == 2 * period - 1:
+            state["dx_sum"] += dx or 0.0
+            state["adx_value"] = state["dx_sum"] / period
+        elif dx is not None:
+            state["adx_value"] = (state["adx_value"] * (period - 1) + dx) / period
+        state["adx"] = state["adx_value"]
+
+    def update_many(self, bars):
+        """
+        一次更新多檔股票的最新 K 棒
+
+        參數:
+            bars: {ticker: (high, low, close)}
+
+        返回:
+            dict: {ticker: (RSI, ADX)}
+        """
+        return {ticker: self.update(ticker, *bar) for ticker, bar in bars.items()}
+
+    def warm_up(self, ticker, df):
+        """
+        以歷史日 K 重新建立某檔股票的狀態
+
+        參數:
+            ticker: 股票代碼
+            df: 含 High/Low/Close 欄位的日 K 資料
+
+        返回:
+            DataFrame: 每根 K 棒的 RSI、ADX（與 df 同索引）
+        """
+        self.reset(ticker)
+        highs = df["High"].to_numpy(dtype=np.float64)
+        lows = df["Low"].to_numpy(dtype=np.float64)
+        closes = df["Close"].to_numpy(dtype=np.float64)
+        out = np.empty((len(df), 2))
+        for i in range(len(df)):
+            out[i] = self.update(ticker, highs[i], lows[i], closes[i])
+        return pd.DataFrame(out, index=df.index, columns=["RSI", "ADX"])
+
+    def to_dict(self):
+        """把所有股票的狀態轉成可 JSON 序列化的 dict"""
+        states = {}
+        for ticker, state in self._states.items():
+            states[ticker] = {
+                key: value.to_dict() if isinstance(value, _RollingMean) else value
+                for key, value in state.items()
+            }
+        return {"period": self.period, "mode": self.mode, "states": states}
+
+    @classmethod
+    def from_dict(cls, data):
+        engine = cls(period=data["period"], mode=data["mode"])
+        for ticker, state in data["states"].items():
+            engine._states[ticker] = {
+                key: _RollingMean.from_dict(engine.period, value) if isinstance(value, dict) else value
+                for key, value in state.items()
+            }
+        return engine
+
+    def save(self, path):
+        """把狀態存成 JSON（先寫暫存檔再取代，避免中斷時留下壞檔）"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
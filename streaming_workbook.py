@@ -0,0 +1,389 @@
+"""
+串流讀寫工作簿（記憶體不隨工作表列數增加）
+
+原本的流程先以 pd.read_excel 讀入整張表找出待處理的列，最後再以 load_workbook 載入
+包含所有樣式物件的整本工作簿寫回，兩次都把整個工作表放在記憶體中。這裡提供：
+
+  - iter_sheet_blocks: 以 openpyxl 唯讀模式（iter_rows）逐列讀取，每次交出固定列數的區塊
+  - patch_sheet: 直接串流改寫 xlsx 中該工作表的 XML，只重寫有更新的列，
+                 其他列與其他檔案（樣式、共用字串、其他工作表）原樣複製
+
+  - iter_sheet_values: 只用標準函式庫讀取儲存格的值（不載入 openpyxl，用於快速檢查待處理的列）
+
+格式規則與 excel_writer 相同（往上 20 列內第一個有資料的儲存格，找不到時用同一列的「公司代碼」），
+差別是直接沿用參考儲存格的樣式編號（s 屬性），不另外合併保護等設定。
+字串以 inlineStr 寫入，不需要載入共用字串表。openpyxl 只在 iter_sheet_blocks 中才載入。
+"""
+import math
+import os
+import re
+import zipfile
+from collections import deque
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+# 往上尋找參考格式的最大列數（與 excel_writer.STYLE_LOOKBACK_ROWS 相同）
+STYLE_LOOKBACK_ROWS = 20
+
+# 串流讀寫 XML 時每次讀取的位元組數
+READ_CHUNK_BYTES = 1 << 20
+
+_NS = {
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+_REL_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_MAIN = "{" + _NS["main"] + "}"
+
+_ROW_NUMBER = re.compile(rb'\br="(\d+)"')
+_CELL = re.compile(rb"<c\b[^>]*?(?:/>|>.*?</c>)", re.S)
+_CELL_REF = re.compile(rb'\br="([A-Z]+)\d+"')
+_CELL_STYLE = re.compile(rb'\bs="(\d+)"')
+
+def iter_sheet_blocks(path, sheet_name, block_rows=5000):
+    """
+    以唯讀模式逐列讀取工作表，每次交出一個區塊
+
+    參數:
+        path: xlsx 路徑
+        sheet_name: 工作表名稱
+        block_rows: 每個區塊的列數
+
+    返回:
+        generator: (標題列, 區塊第一列的 Excel 列號, [每列的值 tuple, ...])，
+                   全部為空白的列會略過（對應的列號不會出現在區塊中）
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(value) if value is not None else "" for value in header]
+        width = len(header)
+
+        block, block_start = [], None
+        for excel_row, values in enumerate(rows, start=2):
+            if all(value is None for value in values):
+                continue
+            values = tuple(values[:width]) + (None,) * (width - len(values))
+            if block and excel_row != block_start + len(block):
+                # 中間有略過的空白列：另起一個區塊，讓區塊內的列號連續
+                yield header, block_start, block
+                block = []
+            if not block:
+                block_start = excel_row
+            block.append(values)
+            if len(block) >= block_rows:
+                yield header, block_start, block
+                block = []
+        if block:
+            yield header, block_start, block
+    finally:
+        wb.close()
+
+def column_index(letters):
+    """欄位字母轉成欄位索引（"A" -> 1）"""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index
+
+def column_letter(index):
+    """欄位索引轉成欄位字母（1 -> "A"）"""
+    letters = ""
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+def _sheet_xml_path(archive, sheet_name):
+    """找出工作表在 xlsx 中的 XML 路徑"""
+    workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    rel_id = None
+    for sheet in workbook.iterfind("main:sheets/main:sheet", _NS):
+        if sheet.get("name") == sheet_name:
+            rel_id = sheet.get(_REL_ID)
+            break
+    if rel_id is None:
+        raise KeyError(f"找不到工作表: {sheet_name}")
+
+    rels = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    for rel in rels.iterfind("rel:Relationship", _NS):
+        if rel.get("Id") == rel_id:
+            target = rel.get("Target")
+            return target.lstrip("/") if target.startswith("/") else "xl/" + target
+    raise KeyError(f"找不到工作表 {sheet_name} 的關聯: {rel_id}")
+
+def _iter_row_segments(stream):
+    """
+    把工作表 XML 切成片段
+
+    返回:
+        generator: ("raw", bytes) 為原樣複製的內容，("row", bytes) 為一個完整的 <row> 元素
+    """
+    buffer = b""
+    eof = False
+    while True:
+        start = buffer.find(b"<row")
+        while start != -1 and buffer[start + 4:start + 5] not in (b" ", b">", b"/", b""):
+            # <rowBreaks> 等其他元素
+            start = buffer.find(b"<row", start + 4)
+
+        if start == -1 or buffer[start + 4:start + 5] == b"":
+            if eof:
+                if buffer:
+                    yield "raw", buffer
+                return
+            # 保留結尾可能被切斷的 "<row"
+            keep = max(0, len(buffer) - 4)
+            if keep:
+                yield "raw", buffer[:keep]
+                buffer = buffer[keep:]
+            chunk = stream.read(READ_CHUNK_BYTES)
+            eof = not chunk
+            buffer += chunk
+            continue
+
+        if start:
+            yield "raw", buffer[:start]
+            buffer = buffer[start:]
+
+        tag_end = buffer.find(b">")
+        end = -1
+        if tag_end != -1:
+            if buffer[tag_end - 1:tag_end] == b"/":
+                end = tag_end + 1
+            else:
+                end = buffer.find(b"</row>", tag_end)
+                if end != -1:
+                    end += len(b"</row>")
+        if end == -1:
+            chunk = stream.read(READ_CHUNK_BYTES)
+            if not chunk:
+                raise ValueError("工作表 XML 不完整")
+            buffer += chunk
+            continue
+
+        yield "row", buffer[:end]
+        buffer = buffer[end:]
+
+def _shared_strings(archive):
+    """讀取共用字串表（沒有時為空 list）"""
+    rels = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    for rel in rels.iterfind("rel:Relationship", _NS):
+        if rel.get("Type", "").endswith("/sharedStrings"):
+            target = rel.get("Target")
+            path = target.lstrip("/") if target.startswith("/") else "xl/" + target
+            break
+    else:
+        return []
+    strings = []
+    with archive.open(path) as stream:
+        for _, element in ElementTree.iterparse(stream):
+            if element.tag == _MAIN + "si":
+                # 一般字串 <t> 或多段格式的字串 <r><t>...</t></r>（不含注音標示 <rPh>）
+                parts = [element.findtext(_MAIN + "t") or ""]
+                parts.extend(run.findtext(_MAIN + "t") or "" for run in element.iterfind(_MAIN + "r"))
+                strings.append("".join(parts))
+                element.clear()
+    return strings
+
+def iter_sheet_values(path, sheet_name):
+    """
+    只用標準函式庫逐列讀取工作表的值（不載入 openpyxl，日期保留為 Excel 序號）
+
+    參數:
+        path: xlsx 路徑
+        sheet_name: 工作表名稱
+
+    返回:
+        generator: (Excel 列號, {欄位索引: 值})，字串為 str、數值為 float、布林值為 bool，空白儲存格不列出
+    """
+    with zipfile.ZipFile(path) as archive:
+        strings = _shared_strings(archive)
+        with archive.open(_sheet_xml_path(archive, sheet_name)) as stream:
+            excel_row = 0
+            for _, element in ElementTree.iterparse(stream):
+                if element.tag != _MAIN + "row":
+                    continue
+                excel_row = int(element.get("r", excel_row + 1))
+                values = {}
+                column = 0
+                for cell in element.iterfind(_MAIN + "c"):
+                    ref = cell.get("r")
+                    column = column_index(ref.rstrip("0123456789")) if ref else column + 1
+                    cell_type = cell.get("t", "n")
+                    if cell_type == "inlineStr":
+                        value = "".join(t.text or "" for t in cell.iter(_MAIN + "t"))
+                    else:
+                        value = cell.findtext(_MAIN + "v")
+                        if value is None:
+                            continue
+                        if cell_type == "s":
+                            value = strings[int(value)]
+                        elif cell_type == "b":
+                            value = value == "1"
+                        elif cell_type == "n":
+                            value = float(value)
+                    values[column] = value
+                element.clear()
+                yield excel_row, values
+
+def _cell_xml(ref, style, value):
+    """產生一個儲存格的 XML"""
+    style_attr = f' s="{style}"' if style else ""
+    if value is None:
+        return f'<c r="{ref}"{style_attr}/>'.encode()
+    if isinstance(value, bool):
+        return f'<c r="{ref}"{style_attr} t="b"><v>{int(value)}</v></c>'.encode()
+    if isinstance(value, (int, float)) or hasattr(value, "dtype"):
+        number = value.item() if hasattr(value, "item") else value
+        if isinstance(number, float):
+            if not math.isfinite(number):
+                # NaN / 無限大無法寫入 XML，當作空白
+                return f'<c r="{ref}"{style_attr}/>'.encode()
+            if number.is_integer():
+                # 與 openpyxl 相同：整數值的浮點數寫成整數
+                number = int(number)
+        return f'<c r="{ref}"{style_attr}><v>{number}</v></c>'.encode()
+    text = str(value)
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t{space}>{escape(text)}</t></is></c>'.encode("utf-8")
+
+def has_cell_value(value, empty_values=("", "nan")):
+    """儲存格是否有資料（與 excel_writer 的判斷相同）"""
+    return value is not None and str(value).strip() not in empty_values
+
+def _parse_cells(row_xml):
+    """回傳 (row 開始標籤, [(欄位索引, 儲存格 XML), ...])"""
+    tag_end = row_xml.find(b">") + 1
+    cells = []
+    column = 0
+    for match in _CELL.finditer(row_xml, tag_end):
+        cell = match.group(0)
+        ref = _CELL_REF.search(cell[:cell.find(b">")])
+        column = column_index(ref.group(1).decode()) if ref else column + 1
+        cells.append((column, cell))
+    return row_xml[:tag_end], cells
+
+def _cell_style(cell_xml):
+    if cell_xml is None:
+        return 0
+    match = _CELL_STYLE.search(cell_xml[:cell_xml.find(b">")])
+    return int(match.group(1)) if match else 0
+
+class _StyleWindow:
+    """
+    一個欄位往上 STYLE_LOOKBACK_ROWS 列內有資料的儲存格 (列號, 樣式編號)
+
+    參數:
+        filled_rows: 原本已有資料的列號（已排序），依列號遞增逐列查詢
+    """
+
+    def __init__(self, filled_rows):
+        self.filled_rows = filled_rows
+        self.position = 0
+        self.window = deque()
+
+    def is_filled(self, excel_row):
+        """原本是否有資料（列號必須遞增）"""
+        rows = self.filled_rows
+        while self.position < len(rows) and rows[self.position] < excel_row:
+            self.position += 1
+        return self.position < len(rows) and rows[self.position] == excel_row
+
+    def add(self, excel_row, style):
+        self.window.append((excel_row, style))
+        self.prune(excel_row)
+
+    def prune(self, excel_row):
+        while self.window and self.window[0][0] < excel_row - STYLE_LOOKBACK_ROWS:
+            self.window.popleft()
+
+    def reference_style(self, excel_row):
+        """往上 STYLE_LOOKBACK_ROWS 列內第一個有資料的儲存格樣式，沒有時為 None"""
+        self.prune(excel_row)
+        return self.window[0][1] if self.window else None
+
+def patch_sheet(path, sheet_name, updates, col_indices, ticker_col_idx, filled_rows):
+    """
+    串流改寫工作表，只重寫有更新的列（先寫暫存檔再取代）
+
+    參數:
+        path: xlsx 路徑
+        sheet_name: 工作表名稱
+        updates: 依 Excel 列號遞增排序的 (列號, {欄位名稱: 值}) 可迭代物件
+        col_indices: {欄位名稱: 欄位索引}
+        ticker_col_idx: 「公司代碼」欄位索引（找不到參考格式時使用）
+        filled_rows: {欄位索引: 原本已有資料的列號（已排序）}
+
+    返回:
+        int: 寫入的儲存格數
+    """
+    updates = iter(updates)
+    pending = next(updates, None)
+    windows = {col_idx: _StyleWindow(filled_rows.get(col_idx, [])) for col_idx in set(col_indices.values())}
+    cell_count = 0
+
+    def patch_row(segment):
+        nonlocal pending, cell_count
+        match = _ROW_NUMBER.search(segment[:segment.find(b">")])
+        if match is None:
+            return segment
+        excel_row = int(match.group(1))
+
+        # 工作表中沒有的列無法套用，略過
+        while pending is not None and pending[0] < excel_row:
+            pending = next(updates, None)
+        row_updates = pending[1] if pending is not None and pending[0] == excel_row else None
+        filled = {col_idx for col_idx, window in windows.items() if window.is_filled(excel_row)}
+        if row_updates is None and not filled:
+            return segment
+
+        row_start, cells = _parse_cells(segment)
+        row_cells = dict(cells)
+        if row_updates is not None:
+            ticker_style = _cell_style(row_cells.get(ticker_col_idx))
+            for col_name, value in row_updates.items():
+                col_idx = col_indices.get(col_name)
+                if col_idx is None:
+                    continue
+                style = windows[col_idx].reference_style(excel_row)
+                style = ticker_style if style is None else style
+                row_cells[col_idx] = _cell_xml(f"{column_letter(col_idx)}{excel_row}", style, value)
+                cell_count += 1
+                if has_cell_value(value):
+                    filled.add(col_idx)
+            pending = next(updates, None)
+
+        # 有資料（含剛寫入）的儲存格可以當作後面列的參考格式
+        for col_idx in filled:
+            windows[col_idx].add(excel_row, _cell_style(row_cells.get(col_idx)))
+
+        if row_updates is None:
+            return segment
+        if row_start.endswith(b"/>"):
+            row_start = row_start[:-2] + b">"
+        return row_start + b"".join(row_cells[col] for col in sorted(row_cells)) + b"</row>"
+
+    base, ext = os.path.splitext(path)
+    tmp_path = f"{base}.tmp{ext}"
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(tmp_path, "w") as target:
+        sheet_path = _sheet_xml_path(source, sheet_name)
+        for info in source.infolist():
+            with source.open(info) as src, target.open(info, "w") as dst:
+                if info.filename != sheet_path:
+                    while True:
+                        chunk = src.read(READ_CHUNK_BYTES)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                    continue
+                for kind, segment in _iter_row_segments(src):
+                    dst.write(segment if kind == "raw" else patch_row(segment))
+
+    os.replace(tmp_path, path)
+    return cell_count
@@ -0,0 +1,78 @@
+"""
+bar_cache 往前補資料時的涵蓋區間，以及附加資料時不改變已映射的舊檔案
+
+執行: python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bar_cache
+from market_data import EmptyResponseError
+
+def _source(listed="2024-01-02"):
+    """從 listed 開始每個平日都有日 K 的下載函式"""
+
+    def fetch(ticker, start, end):
+        index = pd.bdate_range(max(pd.Timestamp(start), pd.Timestamp(listed)), pd.Timestamp(end) - pd.Timedelta(days=1))
+        return pd.DataFrame({column: np.ones(len(index)) for column in bar_cache.COLUMNS}, index=index)
+
+    return fetch
+
+def _failing(ticker, start, end):
+    raise EmptyResponseError("rate limited")
+
+class BackfillTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_dir = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _start(self):
+        return bar_cache._read_meta(bar_cache._paths("A", "1d", self.cache_dir)[2])["start"]
+
+    def test_failed_backfill_keeps_coverage(self):
+        bar_cache.cached_download("A", "2024-03-01", "2024-04-01", "1d", _source(), self.cache_dir)
+        df = bar_cache.cached_download("A", "2024-02-01", "2024-04-01", "1d", _failing, self.cache_dir)
+        self.assertEqual(str(df.index[0].date()), "2024-03-01")
+        self.assertEqual(self._start(), "2024-03-01")
+
+        # 下次再試時補上前段
+        df = bar_cache.cached_download("A", "2024-02-01", "2024-04-01", "1d", _source(), self.cache_dir)
+        self.assertEqual(str(df.index[0].date()), "2024-02-01")
+        self.assertEqual(self._start(), "2024-02-01")
+
+    def test_backfill_before_listing_extends_coverage(self):
+        bar_cache.cached_download("A", "2024-03-01", "2024-04-01", "1d", _source(listed="2024-03-12"), self.cache_dir)
+        bar_cache.cached_download("A", "2024-02-01", "2024-04-01", "1d", _failing, self.cache_dir)
+        self.assertEqual(self._start(), "2024-02-01")
+
+class AppendTest(unittest.TestCase):
+
+    def test_append_keeps_earlier_mappings(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            bar_cache.cached_download("A", "2024-01-01", "2024-03-01", "1d", _source(), cache_dir)
+            before = bar_cache.read_cached_bars("A", "1d", cache_dir)
+            values = np.array(before)
+
+            # 從第二根 K 棒開始改寫：檔案變短，數值也不同
+            index = pd.bdate_range("2024-01-03", "2024-01-04")
+            revised = pd.DataFrame({column: np.full(len(index), 7.0) for column in bar_cache.COLUMNS}, index=index)
+            bar_cache.append_cached_bars("A", "1d", revised, cache_dir)
+
+            np.testing.assert_array_equal(np.array(before), values)
+            after = bar_cache.read_cached_bars("A", "1d", cache_dir)
+            self.assertEqual(len(after), 3)
+            self.assertEqual(after["Close"].tolist(), [1.0, 7.0, 7.0])
+
+if __name__ == "__main__":
+    unittest.main()
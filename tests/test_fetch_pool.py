@@ -0,0 +1,154 @@
+"""
+fetch_pool 的並行、限速、重試與負向快取（以 SimulatedFetch 等本地替身驗證，不需要網路）
+
+執行: python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bar_cache
+from fetch_pool import ConcurrentFetcher, SimulatedFetch, TokenBucket
+from market_data import EmptyResponseError, YFinanceProvider
+
+def _bars(ticker, start="2024-01-01", end="2024-01-10"):
+    index = pd.bdate_range(start, pd.Timestamp(end) - pd.Timedelta(days=1))
+    return pd.DataFrame({column: np.arange(len(index), dtype=float) for column in bar_cache.COLUMNS}, index=index)
+
+class FlakyFetch:
+    """前 failures 次請求拋出 error，之後回傳資料"""
+
+    def __init__(self, failures, error):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, ticker, *args):
+        with self._lock:
+            self.calls += 1
+            fail = self.calls <= self.failures
+        if fail:
+            raise self.error
+        return _bars(ticker)
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_waits_when_empty(self):
+        now = [0.0]
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+            now[0] += seconds
+
+        bucket = TokenBucket(rate=2.0, capacity=1, clock=lambda: now[0], sleep=sleep)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(waits, [0.5, 0.5])
+
+class ConcurrentFetcherTest(unittest.TestCase):
+
+    def test_requests_run_concurrently(self):
+        fetch = SimulatedFetch(_bars, latency=0.1)
+        fetcher = ConcurrentFetcher(fetch, max_workers=8, rate=None)
+        started = time.perf_counter()
+        results = fetcher.fetch_all({f"T{i}": (f"T{i}",) for i in range(8)})
+        elapsed = time.perf_counter() - started
+        self.assertEqual(fetch.calls, 8)
+        self.assertTrue(all(len(df) > 0 for df in results.values()))
+        self.assertLess(elapsed, 0.5)
+
+    def test_retries_exceptions_then_succeeds(self):
+        fetch = FlakyFetch(2, ConnectionError("reset"))
+        fetcher = ConcurrentFetcher(fetch, rate=None, max_retries=3, sleep=lambda seconds: None)
+        df = fetcher.fetch_all({"A": ("A",)})["A"]
+        self.assertFalse(df.empty)
+        self.assertEqual(fetcher.stats["retries"], 2)
+        self.assertEqual(fetcher.stats["failed"], 0)
+
+    def test_gives_up_after_max_retries(self):
+        fetch = SimulatedFetch(_bars, latency=0, failure_rate=1.0)
+        fetcher = ConcurrentFetcher(fetch, rate=None, max_retries=2, sleep=lambda seconds: None)
+        self.assertIsNone(fetcher.fetch_all({"A": ("A",)})["A"])
+        self.assertEqual(fetch.calls, 3)
+        self.assertEqual(fetcher.stats["failed"], 1)
+        self.assertNotIn("A", fetcher.negative_cache)
+
+    def test_empty_response_is_retried_before_negative_cache(self):
+        fetch = FlakyFetch(2, EmptyResponseError("rate limited"))
+        fetcher = ConcurrentFetcher(fetch, rate=None, max_retries=3, sleep=lambda seconds: None)
+        df = fetcher.fetch_all({"A": ("A",)})["A"]
+        self.assertFalse(df.empty)
+        self.assertEqual(fetcher.stats["retries"], 2)
+        self.assertNotIn("A", fetcher.negative_cache)
+
+    def test_empty_response_negative_cached_after_retries(self):
+        fetch = FlakyFetch(10, EmptyResponseError("no data"))
+        fetcher = ConcurrentFetcher(fetch, rate=None, max_retries=2, sleep=lambda seconds: None)
+        df = fetcher.fetch_all({"A": ("A",)})["A"]
+        self.assertTrue(df.empty)
+        self.assertEqual(fetch.calls, 3)
+        self.assertIn("A", fetcher.negative_cache)
+
+        # 本次執行中不再請求
+        self.assertIsNone(fetcher.fetch_all({"A": ("A",)})["A"])
+        self.assertEqual(fetch.calls, 3)
+        self.assertEqual(fetcher.stats["skipped"], 1)
+
+    def test_empty_response_not_cached_when_disabled(self):
+        fetch = FlakyFetch(10, EmptyResponseError("no data"))
+        fetcher = ConcurrentFetcher(fetch, rate=None, max_retries=1, sleep=lambda seconds: None)
+        self.assertTrue(fetcher.fetch_all({"A": ("A",)}, cache_empty=False)["A"].empty)
+        self.assertNotIn("A", fetcher.negative_cache)
+
+class YFinanceProviderTest(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            import yfinance  # noqa: F401
+        except ImportError:
+            self.skipTest("yfinance 未安裝")
+
+    def test_empty_download_raises(self):
+        provider = YFinanceProvider()
+        with mock.patch("yfinance.download", return_value=pd.DataFrame()):
+            with self.assertRaises(EmptyResponseError):
+                provider.get_daily_bars("AAPL", "2024-01-01", "2024-02-01")
+            with self.assertRaises(EmptyResponseError):
+                provider.get_intraday_bars("AAPL", "2024-01-01", "2024-01-03")
+
+    def test_empty_download_is_retried_by_fetcher(self):
+        provider = YFinanceProvider()
+        responses = [pd.DataFrame(), _bars("AAPL")]
+        fetcher = ConcurrentFetcher(provider.get_daily_bars, rate=None, sleep=lambda seconds: None)
+        with mock.patch("yfinance.download", side_effect=lambda *args, **kwargs: responses.pop(0)):
+            df = fetcher.fetch_all({"AAPL": ("AAPL", "2024-01-01", "2024-01-10")})["AAPL"]
+        self.assertEqual(len(df), 7)
+        self.assertEqual(fetcher.stats["retries"], 1)
+        self.assertNotIn("AAPL", fetcher.negative_cache)
+
+class CachedDownloadTest(unittest.TestCase):
+
+    def test_empty_response_keeps_cached_bars(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            bar_cache.cached_download("A", "2024-01-01", "2024-01-10", "1d", _bars, cache_dir)
+
+            def empty(ticker, start, end):
+                raise EmptyResponseError("rate limited")
+
+            df = bar_cache.cached_download("A", "2024-01-01", "2024-01-20", "1d", empty, cache_dir)
+            self.assertEqual(len(df), 7)
+            self.assertEqual(bar_cache._read_meta(bar_cache._paths("A", "1d", cache_dir)[2])["end"], "2024-01-10")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+indicator_service 從快取更新 K 棒時的行為
+
+執行: python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calculate_indicators as ci
+from indicator_service import IndicatorService
+from market_data import COLUMNS, MarketDataProvider
+
+class RevisableProvider(MarketDataProvider):
+    """經過 K 線快取的網路來源替身：每個平日一根日 K，數值可以事後修正"""
+
+    is_remote = True
+
+    def __init__(self):
+        index = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=200)
+        close = 100 + np.cumsum(np.sin(np.arange(len(index))))
+        self.bars = pd.DataFrame({"Open": close, "High": close + 1, "Low": close - 1,
+                                  "Close": close, "Volume": np.ones(len(index))}, index=index)
+
+    def get_daily_bars(self, ticker, start, end):
+        i = self.bars.index.searchsorted(pd.Timestamp(start), side="left")
+        j = self.bars.index.searchsorted(pd.Timestamp(end), side="left")
+        return self.bars.iloc[i:j].copy()
+
+class RefreshTest(unittest.TestCase):
+
+    def setUp(self):
+        # 快取寫在暫存目錄（bar_cache 的預設目錄是相對路徑）
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        self.provider = RevisableProvider()
+        patches = [mock.patch.object(ci, "market_data_provider", self.provider),
+                   mock.patch.object(ci, "USE_BAR_CACHE", True),
+                   mock.patch.object(ci, "FETCH_RATE_PER_SEC", None)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def test_revised_bar_is_recomputed(self):
+        service = IndicatorService()
+        history = service._history("AAA", self.provider.bars.index[-60], pd.Timestamp.now().normalize())
+        close = history.bars["Close"].iloc[-1]
+        rsi = history.rsi[-1]
+
+        self.provider.bars.iloc[-1, COLUMNS.index("Close")] += 50
+        self.assertEqual(service.refresh("AAA"), -1)
+        self.assertEqual(history.bars["Close"].iloc[-1], close + 50)
+        self.assertNotEqual(history.rsi[-1], rsi)
+
+    def test_unchanged_bar_is_kept(self):
+        service = IndicatorService()
+        history = service._history("AAA", self.provider.bars.index[-60], pd.Timestamp.now().normalize())
+        rsi = history.rsi.copy()
+        self.assertEqual(service.refresh("AAA"), 0)
+        np.testing.assert_array_equal(history.rsi, rsi)
+
+if __name__ == "__main__":
+    unittest.main()
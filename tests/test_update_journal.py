@@ -0,0 +1,46 @@
+"""
+update_journal 中斷後繼續附加的行為
+
+執行: python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from update_journal import UpdateJournal, read_journal
+
+COMPLETE = '{"row": 2, "ticker": "A", "date": "2024-01-02", "updates": {"RSI": 50}}\n'
+
+class UpdateJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "book.xlsx.journal.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _append_after(self, content):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(content)
+        journal = UpdateJournal(self.path)
+        journal.record(3, "B", "2024-01-03", {"RSI": 40})
+        journal.close()
+        return read_journal(self.path)
+
+    def test_torn_tail_is_truncated_before_appending(self):
+        entries = self._append_after(COMPLETE + '{"row": 4, "ticker": "C", "da')
+        self.assertEqual(sorted(entries), [2, 3])
+        self.assertEqual(entries[3]["updates"], {"RSI": 40})
+
+    def test_torn_only_line(self):
+        self.assertEqual(sorted(self._append_after('{"row": 4, "tick')), [3])
+
+    def test_complete_journal_is_kept(self):
+        self.assertEqual(sorted(self._append_after(COMPLETE)), [2, 3])
+
+if __name__ == "__main__":
+    unittest.main()
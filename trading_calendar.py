@@ -0,0 +1,219 @@
+"""
+美股交易日曆（NYSE）：交易日判斷、前一個交易日、往前 N 個交易日，以及台灣時間轉美國交易日
+
+日 K 的下載區間原本固定往前 250 個日曆天，這裡改用交易日計算每個視窗實際需要的最小區間。
+休市日依 NYSE 規則逐年計算（假日落在週末時的補假、復活節前的耶穌受難日、2022 年起的六月節），
+加上臨時休市日（SPECIAL_CLOSURES），建立一次 np.busdaycalendar 之後：
+
+  - is_session / next_session / previous_session / sessions_before 都是 NumPy 的向量化查詢，
+    可以一次傳入整個日期陣列，不需要對日 K 做布林遮罩掃描
+  - 只影響交易日判斷，不影響已下載的 K 棒（實際的前一根 K 棒仍以 K 棒索引 searchsorted 取得）
+
+台灣時間：美股開盤（美東 09:30）是台灣時間當天 21:30（夏令）或 22:30，
+所以只有日期的「開盤日期(台灣時間)」就是美國交易日；含時間的值先轉成美東時間，
+收盤（16:00）之後屬於下一個交易日，例如台灣時間 5/2 10:00 是美東 5/1 22:00，對應 5/2 的交易日。
+
+用法:
+    from trading_calendar import NYSE
+    NYSE.previous_session("2024-07-05")           # Timestamp('2024-07-03')
+    NYSE.sessions_before(dates, 151)              # 每個日期之前第 151 個交易日（DatetimeIndex）
+"""
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import sheet_config
+
+# 美股與台灣的時區
+MARKET_TZ = "America/New_York"
+TAIWAN_TZ = "Asia/Taipei"
+
+# 美股收盤時間（美東時間，時）：之後的時間屬於下一個交易日
+SESSION_CLOSE_HOUR = 16
+
+# 計算休市日的年份範圍：FIRST_YEAR 到今年加 HOLIDAY_YEARS_AHEAD 年（範圍外只排除週末）
+FIRST_YEAR = 1990
+HOLIDAY_YEARS_AHEAD = 5
+
+# 臨時休市日（國葬、911、颶風）
+SPECIAL_CLOSURES = [
+    "1994-04-27",
+    "2001-09-11", "2001-09-12", "2001-09-13", "2001-09-14",
+    "2004-06-11",
+    "2007-01-02",
+    "2012-10-29", "2012-10-30",
+    "2018-12-05",
+    "2025-01-09",
+]
+
+def _easter(year):
+    """復活節（西曆，Anonymous Gregorian algorithm）"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def _nth_weekday(year, month, weekday, n):
+    """某月第 n 個星期 weekday（0 為星期一），n 為 -1 表示最後一個"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+def _observed(day):
+    """假日落在星期六時提前到星期五、星期日時延後到星期一"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+def nyse_holidays(year):
+    """
+    NYSE 某一年的休市日（不含臨時休市）
+
+    返回:
+        list: date 列表
+    """
+    holidays = [
+        _nth_weekday(year, 2, 0, 3),            # 華盛頓誕辰（二月第三個星期一）
+        _easter(year) - timedelta(days=2),      # 耶穌受難日
+        _nth_weekday(year, 5, 0, -1),           # 陣亡將士紀念日（五月最後一個星期一）
+        _observed(date(year, 7, 4)),            # 獨立紀念日
+        _nth_weekday(year, 9, 0, 1),            # 勞動節（九月第一個星期一）
+        _nth_weekday(year, 11, 3, 4),           # 感恩節（十一月第四個星期四）
+        _observed(date(year, 12, 25)),          # 聖誕節
+    ]
+    # 元旦落在星期六時不在前一年的 12/31 補假
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.append(_observed(new_year))
+    if year >= 1998:
+        holidays.append(_nth_weekday(year, 1, 0, 3))       # 馬丁路德金恩紀念日（一月第三個星期一）
+    if year >= 2022:
+        holidays.append(_observed(date(year, 6, 19)))     # 六月節
+    return sorted(holidays)
+
+def _to_days(dates):
+    """把日期（純量或陣列）轉成 datetime64[D]；有時區的值先轉成美東時間的日期"""
+    if pd.api.types.is_list_like(dates):
+        index = pd.DatetimeIndex(dates)
+        if index.tz is not None:
+            index = index.tz_convert(MARKET_TZ).tz_localize(None)
+        return index.normalize().to_numpy().astype("datetime64[D]"), False
+    ts = pd.Timestamp(dates)
+    if ts.tz is not None:
+        ts = ts.tz_convert(MARKET_TZ).tz_localize(None)
+    return np.datetime64(ts.date(), "D"), True
+
+def _from_days(days, scalar):
+    """把 datetime64[D] 轉回 Timestamp（純量）或 DatetimeIndex"""
+    if scalar:
+        return pd.Timestamp(days)
+    return pd.DatetimeIndex(days.astype("datetime64[ns]"))
+
+class TradingCalendar:
+    """
+    NYSE 交易日曆（所有查詢都接受單一日期或日期陣列，分別回傳 Timestamp 或 DatetimeIndex）
+
+    參數:
+        first_year: 計算休市日的第一年
+        last_year: 計算休市日的最後一年，預設為今年加 HOLIDAY_YEARS_AHEAD
+    """
+
+    def __init__(self, first_year=FIRST_YEAR, last_year=None):
+        if last_year is None:
+            last_year = date.today().year + HOLIDAY_YEARS_AHEAD
+        holidays = [day for year in range(first_year, last_year + 1) for day in nyse_holidays(year)]
+        holidays += [date.fromisoformat(day) for day in SPECIAL_CLOSURES
+                     if first_year <= int(day[:4]) <= last_year]
+        self.holidays = np.array(sorted(holidays), dtype="datetime64[D]")
+        self._busdaycal = np.busdaycalendar(weekmask="1111100", holidays=self.holidays)
+
+    def is_session(self, dates):
+        """是否為交易日（純量回傳 bool，陣列回傳 bool 陣列）"""
+        days, scalar = _to_days(dates)
+        result = np.is_busday(days, busdaycal=self._busdaycal)
+        return bool(result) if scalar else result
+
+    def next_session(self, dates):
+        """當天（是交易日時）或之後的第一個交易日"""
+        days, scalar = _to_days(dates)
+        return _from_days(np.busday_offset(days, 0, roll="forward", busdaycal=self._busdaycal), scalar)
+
+    def previous_session(self, dates):
+        """當天之前（不含當天）的最後一個交易日"""
+        return self.sessions_before(dates, 1)
+
+    def sessions_before(self, dates, count):
+        """
+        當天之前（不含當天）的第 count 個交易日
+
+        參數:
+            dates: 日期或日期陣列
+            count: 往前的交易日數（1 為前一個交易日）
+
+        返回:
+            Timestamp 或 DatetimeIndex
+        """
+        days, scalar = _to_days(dates)
+        return _from_days(np.busday_offset(days, -count, roll="forward", busdaycal=self._busdaycal), scalar)
+
+    def session_count(self, start, end):
+        """[start, end) 之間的交易日數"""
+        start_days, scalar = _to_days(start)
+        end_days, _ = _to_days(end)
+        result = np.busday_count(start_days, end_days, busdaycal=self._busdaycal)
+        return int(result) if scalar else result
+
+    def sessions(self, start, end):
+        """[start, end) 之間的所有交易日（DatetimeIndex）"""
+        start_day, _ = _to_days(start)
+        end_day, _ = _to_days(end)
+        days = np.arange(start_day, max(start_day, end_day), dtype="datetime64[D]")
+        return _from_days(days[np.is_busday(days, busdaycal=self._busdaycal)], False)
+
+# 預設的 NYSE 交易日曆
+NYSE = TradingCalendar()
+
+def us_session_date(value, calendar=NYSE):
+    """
+    把台灣時間的開盤日期轉成美國交易日
+
+    只有日期（時間為 00:00）的值原樣回傳：台灣時間當天晚上開盤的交易日就是同一個日期。
+    含時間的值轉成美東時間，收盤之後屬於下一個交易日，週末與休市日順延到下一個交易日。
+
+    參數:
+        value: 開盤日期（台灣時間，沒有時區的值視為台灣時間）
+        calendar: 交易日曆
+
+    返回:
+        美國交易日（Timestamp），或原本的值（只有日期、無法解析時）
+    """
+    try:
+        ts = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        return value
+    if ts is pd.NaT or (ts.tz is None and ts == ts.normalize()):
+        return value
+
+    market_time = (ts.tz_localize(TAIWAN_TZ) if ts.tz is None else ts).tz_convert(MARKET_TZ)
+    day = market_time.tz_localize(None).normalize()
+    if market_time.hour >= SESSION_CLOSE_HOUR:
+        day += timedelta(days=1)
+    return calendar.next_session(day)
+
+def sheet_session_date(value, date_col):
+    """工作表日期欄位的值對應的美國交易日（台灣時間欄位才轉換，其他欄位原樣回傳）"""
+    if date_col in sheet_config.TAIWAN_TIME_DATE_COLUMNS:
+        return us_session_date(value)
+    return value
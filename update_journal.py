@@ -0,0 +1,228 @@
+"""
+更新日誌（只附加的 JSONL）：中斷後從上次完成的列繼續
+
+主程式原本把所有結果放在記憶體中的 updates，最後才一次寫回工作簿，
+執行到一半被中斷（當機、限流、Ctrl-C）時已計算的結果全部遺失。
+啟用日誌後每完成一列就附加一行：
+
+  {"row": Excel 列號, "ticker": 股票代碼, "date": 開盤日期, "updates": {欄位名稱: 值}, "sequences": {...}}
+
+每 JOURNAL_FLUSH_ROWS 列或 JOURNAL_FLUSH_SECONDS 秒寫入磁碟一次。
+工作簿最後儲存成功後刪除日誌；下次執行時日誌還在，表示上次沒有完成：
+  - 重播日誌中的更新，這些列不再計算
+  - 只有列號、股票代碼與日期都和目前工作表相同的列才會重播（工作表被修改過時略過不符的列）
+  - 最後一行寫到一半（中斷時）會被略過，繼續附加前先截掉
+"""
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from trading_calendar import sheet_session_date
+
+# 日誌檔名：工作簿檔名加上此後綴
+JOURNAL_SUFFIX = ".journal.jsonl"
+
+# 每寫入幾列或經過幾秒就寫入磁碟
+JOURNAL_FLUSH_ROWS = 20
+JOURNAL_FLUSH_SECONDS = 5.0
+
+def journal_path(workbook_path):
+    """回傳工作簿對應的日誌路徑"""
+    return workbook_path + JOURNAL_SUFFIX
+
+def _date_key(date):
+    return str(pd.Timestamp(date).date())
+
+def _json_default(value):
+    # NumPy 純量與時間戳轉成 JSON 可以表示的值
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    raise TypeError(f"無法寫入日誌的值: {value!r}")
+
+def _truncate_torn_tail(path):
+    """
+    截掉中斷時寫到一半的最後一行（檔案不是以換行結尾時）
+
+    不截掉的話，接著附加的第一筆會黏在殘缺的那一行後面，重播時兩筆都無法解析。
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            size = min(65536, position)
+            f.seek(position - size)
+            block = f.read(size)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                position = position - size + newline + 1
+                break
+            position -= size
+        if position < end:
+            f.truncate(position)
+
+class UpdateJournal:
+    """
+    附加寫入的更新日誌
+
+    參數:
+        path: 日誌路徑
+        flush_rows: 每寫入幾列寫入磁碟一次
+        flush_seconds: 距離上次寫入磁碟超過幾秒時寫入
+    """
+
+    def __init__(self, path, flush_rows=JOURNAL_FLUSH_ROWS, flush_seconds=JOURNAL_FLUSH_SECONDS):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.rows_written = 0
+        _truncate_torn_tail(path)
+        self._file = open(path, "a", encoding="utf-8")
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def record(self, excel_row, ticker, date, row_updates, sequences=None):
+        """
+        記錄一列已完成的更新
+
+        參數:
+            excel_row: Excel 列號
+            ticker: 股票代碼
+            date: 開盤日期
+            row_updates: {欄位名稱: 值}
+            sequences: 要存到序列側存檔的序列（可選）
+        """
+        entry = {"row": int(excel_row), "ticker": str(ticker), "date": _date_key(date), "updates": row_updates}
+        if sequences is not None:
+            entry["sequences"] = sequences
+        self._file.write(json.dumps(entry, ensure_ascii=False, default=_json_default) + "\n")
+        self.rows_written += 1
+        self._unflushed += 1
+        if self._unflushed >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """把緩衝區寫入磁碟"""
+        if self._file.closed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def discard(self):
+        """工作簿已儲存完成：關閉並刪除日誌"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def read_journal(path):
+    """
+    讀取日誌（同一列出現多次時以最後一次為準）
+
+    返回:
+        dict: {Excel 列號: 日誌項目}，檔案不存在時為空 dict
+    """
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 中斷時寫到一半的最後一行
+                continue
+            entries[entry["row"]] = entry
+    return entries
+
+def replay_journal(path, df, ticker_col, date_col):
+    """
+    讀取日誌並核對目前的工作表
+
+    參數:
+        path: 日誌路徑
+        df: 工作表資料（第 0 筆對應 Excel 第 2 列）
+        ticker_col: 股票代碼欄位名稱
+        date_col: 開盤日期欄位名稱
+
+    返回:
+        tuple: ({Excel 列號: 日誌項目}（只含與工作表相符的列）, 不相符而略過的列數)
+    """
+    entries = {}
+    mismatched = 0
+    for excel_row, entry in read_journal(path).items():
+        idx = excel_row - 2
+        if not 0 <= idx < len(df):
+            mismatched += 1
+            continue
+        ticker = df[ticker_col].iat[idx]
+        date = df[date_col].iat[idx]
+        if not pd.isna(date):
+            # 與 find_pending_rows 相同，台灣時間欄位比對對應的美國交易日
+            date = sheet_session_date(date, date_col)
+        if pd.isna(ticker) or pd.isna(date) or str(ticker) != entry["ticker"] or _date_key(date) != entry["date"]:
+            mismatched += 1
+            continue
+        entries[excel_row] = entry
+    return entries, mismatched
+
+def index_journal(path, row_keys):
+    """
+    建立日誌索引（只保留每列最後一次記錄的位置，不保留更新內容，適合很大的日誌）
+
+    參數:
+        path: 日誌路徑
+        row_keys: {Excel 列號: (股票代碼, 開盤日期)}，只有列號、代碼與日期都相符的記錄才保留
+
+    返回:
+        tuple: ({Excel 列號: 檔案位置}, 不相符而略過的筆數)
+    """
+    offsets = {}
+    mismatched = 0
+    if not os.path.exists(path):
+        return offsets, mismatched
+    with open(path, "rb") as f:
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            key = row_keys.get(entry["row"])
+            if key is None or str(key[0]) != entry["ticker"] or _date_key(key[1]) != entry["date"]:
+                mismatched += 1
+                continue
+            offsets[entry["row"]] = offset
+    return offsets, mismatched
+
+def iter_journal_entries(path, offsets):
+    """
+    依 Excel 列號遞增的順序逐筆讀取日誌項目
+
+    參數:
+        path: 日誌路徑
+        offsets: index_journal 回傳的 {Excel 列號: 檔案位置}
+
+    返回:
+        generator: 日誌項目 dict
+    """
+    with open(path, "rb") as f:
+        for excel_row in sorted(offsets):
+            f.seek(offsets[excel_row])
+            yield json.loads(f.readline())
+